@@ -13,6 +13,7 @@ from datetime import timedelta
 
 import dj_database_url
 import os
+import tempfile
 
 
 from pathlib import Path
@@ -57,6 +58,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'core.metricas.MetricasMiddleware',
+    'core.perfil_sql.PerfilSQLMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -150,6 +153,66 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR.parent, 'comprobantes_pagos')
 
+# Cache de los reportes (/api/reportes/*, ver core/reportes_cache.py). En
+# archivos y no en memoria: gunicorn puede levantar varios workers y todos
+# tienen que ver la misma version de datos. TIMEOUT es el tope de antiguedad de
+# una respuesta para los cambios que no pasan por las vistas (admin, comandos).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'reportes': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'REPORTES_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'meets_reportes_cache')),
+        'TIMEOUT': int(os.environ.get('REPORTES_CACHE_TIMEOUT', 3600)),
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+
+# Miniaturas de recibos y comprobantes (ver core/imagenes.py): lado mayor en
+# pixeles e hilos del worker en segundo plano de cada proceso.
+MINIATURA_LADO = int(os.environ.get('MINIATURA_LADO', 480))
+IMAGENES_WORKERS = int(os.environ.get('IMAGENES_WORKERS', 2))
+
+# Perfil de SQL por request (ver core/perfil_sql.py). Apagado por defecto;
+# con PERFIL_SQL=1 se loguea en JSON cada request que tarde al menos
+# PERFIL_SQL_UMBRAL_MS o haga al menos PERFIL_SQL_UMBRAL_CONSULTAS consultas.
+# Las lineas van a stderr (el log de gunicorn) o, con PERFIL_SQL_ARCHIVO, a ese
+# archivo; reporte_perfil_sql las resume.
+PERFIL_SQL = os.environ.get('PERFIL_SQL', '') in ('1', 'true', 'True')
+PERFIL_SQL_UMBRAL_MS = float(os.environ.get('PERFIL_SQL_UMBRAL_MS', 500))
+PERFIL_SQL_UMBRAL_CONSULTAS = int(os.environ.get('PERFIL_SQL_UMBRAL_CONSULTAS', 50))
+PERFIL_SQL_LENTAS = int(os.environ.get('PERFIL_SQL_LENTAS', 5))
+PERFIL_SQL_ARCHIVO = os.environ.get('PERFIL_SQL_ARCHIVO')
+
+# Metricas de Prometheus en /metrics (ver core/metricas.py). Apagadas por
+# defecto: con METRICAS=1 se mide y se monta /metrics, que ademas pide
+# 'Authorization: Bearer <METRICAS_TOKEN>' (sin token configurado responde 404).
+METRICAS = os.environ.get('METRICAS', '') in ('1', 'true', 'True')
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'mensaje': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'perfil_sql': {
+            'class': 'logging.handlers.WatchedFileHandler',
+            'filename': PERFIL_SQL_ARCHIVO,
+            'formatter': 'mensaje',
+        } if PERFIL_SQL_ARCHIVO else {
+            'class': 'logging.StreamHandler',
+            'formatter': 'mensaje',
+        },
+    },
+    'loggers': {
+        'core.perfil_sql': {'handlers': ['perfil_sql'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -21,6 +21,7 @@ from django.conf.urls.static import static
 from django.conf import settings
 
 from backend.views import hello_world
+from core.metricas import vista_metricas
 
 
 
@@ -30,6 +31,10 @@ urlpatterns = [
     path('api/', include('core.urls')),
 ]
 
+# /metrics solo existe con METRICAS=1 (ver core/metricas.py).
+if settings.METRICAS:
+    urlpatterns.append(path('metrics', vista_metricas, name='metricas'))
+
 # ESTO ES LO QUE TE FALTA:
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
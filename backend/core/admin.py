@@ -2,11 +2,32 @@ from django.contrib import admin
 
 # Register your models here.
 from core import models
+from core.imagenes import encolar_imagen
+
+
+class ConMiniaturaAdmin(admin.ModelAdmin):
+    """Encola la miniatura cuando se sube o cambia la foto desde el admin."""
+    campo_imagen = None
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if self.campo_imagen in form.changed_data:
+            encolar_imagen(obj)
+
+
+@admin.register(models.Pedido)
+class PedidoAdmin(ConMiniaturaAdmin):
+    campo_imagen = 'recibo'
+
+
+@admin.register(models.PagoVendedor)
+class PagoVendedorAdmin(ConMiniaturaAdmin):
+    campo_imagen = 'comprobante'
+
 
 admin.site.register(models.Vendedor)
 admin.site.register(models.Producto)
 admin.site.register(models.Cliente)
-admin.site.register(models.Pedido)
 admin.site.register(models.DetallePedido)
 admin.site.register(models.DetalleFactura)
 admin.site.register(models.Factura)
@@ -14,8 +35,11 @@ admin.site.register(models.PagoFactura)
 admin.site.register(models.EntradaProducto)
 admin.site.register(models.FacturaDetallePedido)
 admin.site.register(models.Proveedor)
-admin.site.register(models.PagoVendedor)
 admin.site.register(models.AjusteInventario)
 admin.site.register(models.HistorialPrecioProducto)
 
-
+# StockResumen y VentaDiaria no se registran: son tablas derivadas que solo
+# escriben actualizar_stock_resumen y actualizar_venta_diaria, y se
+# reconstruyen con resincronizar_ledger_stock --resumen y
+# reconstruir_ventas_diarias. Editarlas a mano dejaria el stock y los reportes
+# distintos de lo que dicen el ledger y los pedidos.
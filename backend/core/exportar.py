@@ -0,0 +1,173 @@
+"""Exportacion en streaming (CSV y XLSX) para la pantalla de Movimientos.
+
+Una hoja es ``(titulo, encabezados, filas)``, donde ``filas`` es un iterable
+de listas que se consume UNA vez mientras se envia la respuesta: quien llama
+pasa un generador sobre ``queryset.iterator(chunk_size=...)`` y nada de la
+historia queda entero en memoria, ni los registros ni el archivo.
+
+El XLSX se arma con la biblioteca estandar: un XLSX es un zip de XML y
+zipfile sabe escribir en un destino que no se puede rebobinar (usa
+descriptores de datos), asi que cada trozo comprimido sale hacia el cliente
+a medida que se escriben las filas. Los textos van como cadenas en linea y
+los numeros como numeros; sin estilos.
+"""
+import csv
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+
+CONTENT_TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Cada cuantas filas se manda lo que ya esta comprimido.
+FILAS_POR_TROZO = 500
+
+# Caracteres de control que XML 1.0 no admite (Excel rechaza el archivo).
+_NO_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return str(valor)
+
+
+class _Eco:
+    """Destino de csv.writer que devuelve lo escrito en vez de guardarlo."""
+
+    def write(self, valor):
+        return valor
+
+
+def _csv(encabezados, filas):
+    escritor = csv.writer(_Eco())
+    # BOM: sin el, Excel abre el CSV como Latin-1 y rompe los acentos.
+    yield '﻿' + escritor.writerow(encabezados)
+    for fila in filas:
+        yield escritor.writerow([_texto(v) for v in fila])
+
+
+def respuesta_csv(nombre_archivo, hoja):
+    """StreamingHttpResponse con la hoja ``(titulo, encabezados, filas)`` en
+    CSV (UTF-8 con BOM)."""
+    _titulo, encabezados, filas = hoja
+    respuesta = StreamingHttpResponse(_csv(encabezados, filas), content_type='text/csv; charset=utf-8')
+    respuesta['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
+    return respuesta
+
+
+class _Tubo:
+    """Archivo de solo escritura y sin seek para zipfile: acumula los bytes
+    hasta que el generador los saca con vaciar()."""
+
+    def __init__(self):
+        self._trozos = []
+
+    def write(self, datos):
+        self._trozos.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self._trozos)
+        self._trozos.clear()
+        return datos
+
+
+def _celda(valor):
+    if valor is None or valor == '':
+        return '<c/>'
+    if isinstance(valor, bool):
+        return f'<c t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float, Decimal)):
+        return f'<c><v>{valor}</v></c>'
+    texto = escape(_NO_XML.sub('', _texto(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _fila(valores):
+    return ('<row>' + ''.join(_celda(v) for v in valores) + '</row>').encode('utf-8')
+
+
+_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_NS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_NS_PKG = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+
+def _archivos_fijos(titulos):
+    hojas_ct = ''.join(
+        f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+        f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for i in range(1, len(titulos) + 1)
+    )
+    yield '[Content_Types].xml', (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        f'{hojas_ct}</Types>'
+    )
+    yield '_rels/.rels', (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<Relationships xmlns="{_NS_PKG}">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+        'relationships/officeDocument" Target="xl/workbook.xml"/></Relationships>'
+    )
+    hojas = ''.join(
+        # Excel limita el nombre de hoja a 31 caracteres.
+        f'<sheet name="{escape(titulo[:31], {chr(34): "&quot;"})}" sheetId="{i}" r:id="rId{i}"/>'
+        for i, titulo in enumerate(titulos, 1)
+    )
+    yield 'xl/workbook.xml', (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<workbook xmlns="{_NS}" xmlns:r="{_NS_REL}"><sheets>{hojas}</sheets></workbook>'
+    )
+    rels = ''.join(
+        f'<Relationship Id="rId{i}" Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+        f'relationships/worksheet" Target="worksheets/sheet{i}.xml"/>'
+        for i in range(1, len(titulos) + 1)
+    )
+    yield 'xl/_rels/workbook.xml.rels', (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<Relationships xmlns="{_NS_PKG}">{rels}</Relationships>'
+    )
+
+
+def _xlsx(hojas):
+    tubo = _Tubo()
+    with zipfile.ZipFile(tubo, 'w', compression=zipfile.ZIP_DEFLATED) as libro:
+        for nombre, contenido in _archivos_fijos([titulo for titulo, _e, _f in hojas]):
+            libro.writestr(nombre, contenido)
+        yield tubo.vaciar()
+
+        for i, (_titulo, encabezados, filas) in enumerate(hojas, 1):
+            with libro.open(f'xl/worksheets/sheet{i}.xml', 'w', force_zip64=True) as hoja:
+                hoja.write(
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    f'<worksheet xmlns="{_NS}"><sheetData>'.encode('utf-8'))
+                hoja.write(_fila(encabezados))
+                for n, fila in enumerate(filas, 1):
+                    hoja.write(_fila(fila))
+                    if n % FILAS_POR_TROZO == 0:
+                        yield tubo.vaciar()
+                hoja.write(b'</sheetData></worksheet>')
+            yield tubo.vaciar()
+    yield tubo.vaciar()
+
+
+def respuesta_xlsx(nombre_archivo, hojas):
+    """StreamingHttpResponse con un libro XLSX de una hoja por cada
+    ``(titulo, encabezados, filas)`` de ``hojas``. Las hojas se escriben una
+    detras de otra, asi que cada ``filas`` se consume recien cuando le toca."""
+    respuesta = StreamingHttpResponse(_xlsx(hojas), content_type=CONTENT_TYPE_XLSX)
+    respuesta['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
+    return respuesta
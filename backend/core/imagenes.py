@@ -0,0 +1,178 @@
+"""Miniaturas de las fotos de recibos (Pedido.recibo) y comprobantes
+(PagoVendedor.comprobante).
+
+Las fotos llegan del telefono tal cual: varios megas y con EXIF (modelo del
+equipo y, muchas veces, la ubicacion GPS). Por cada foto nueva se genera en
+segundo plano una miniatura WebP (JPEG si el Pillow instalado no trae WebP)
+de MINIATURA_LADO px de lado mayor, sin metadatos, y se reescribe el
+original sin EXIF (con la rotacion ya aplicada, para que no quede de lado).
+Las listas muestran la miniatura y el original se descarga solo al abrirlo.
+
+EL WORKER
+Sin broker: un ThreadPoolExecutor por proceso (IMAGENES_WORKERS hilos) que
+recibe el trabajo al confirmarse la transaccion que guardo la foto
+(encolar_imagen). Si el proceso se reinicia con trabajos en cola, esas fotos
+quedan sin miniatura; ``python manage.py procesar_imagenes`` las encuentra y
+las procesa (sirve tambien para las fotos anteriores a este modulo).
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps, features
+
+from .models import PagoVendedor, Pedido
+
+logger = logging.getLogger(__name__)
+
+# Modelo -> (campo original, campo miniatura)
+IMAGENES = {
+    Pedido: ('recibo', 'recibo_miniatura'),
+    PagoVendedor: ('comprobante', 'comprobante_miniatura'),
+}
+
+# Formatos del original que se saben reescribir sin EXIF, con sus opciones.
+_REESCRIBIBLES = {
+    'JPEG': ('JPEG', {'quality': 90, 'optimize': True}),
+    'MPO': ('JPEG', {'quality': 90, 'optimize': True}),  # JPEG de algunas camaras
+    'PNG': ('PNG', {'optimize': True}),
+    'WEBP': ('WEBP', {'quality': 90}),
+}
+
+_ejecutor = None
+_candado = threading.Lock()
+
+
+def _formato_miniatura():
+    if features.check('webp'):
+        return 'WEBP', '.webp', {'quality': 80, 'method': 4}
+    return 'JPEG', '.jpg', {'quality': 80, 'optimize': True}
+
+
+def _tiene_metadatos(imagen):
+    return bool(imagen.getexif()) or any(k in imagen.info for k in ('exif', 'xmp', 'XML:com.adobe.xmp'))
+
+
+def _codificar(imagen, formato, opciones):
+    # Sin exif= ni xmp= Pillow no escribe metadatos; info se vacia igual por
+    # si algun plugin los tomara de ahi.
+    imagen.info = {}
+    salida = BytesIO()
+    imagen.save(salida, format=formato, **opciones)
+    return salida.getvalue()
+
+
+def pendientes(modelo, todas=False):
+    """Filas de ``modelo`` con foto y sin miniatura (todas las que tienen foto
+    si ``todas``)."""
+    original, miniatura = IMAGENES[modelo]
+    filas = modelo.objects.exclude(**{original: ''}).exclude(**{f'{original}__isnull': True})
+    if not todas:
+        filas = filas.filter(Q(**{miniatura: ''}) | Q(**{f'{miniatura}__isnull': True}))
+    return filas.order_by('pk')
+
+
+def _guardar(instancia, campo, nombre, datos):
+    """Escribe ``datos`` como un archivo NUEVO del campo ``campo`` (el storage
+    elige un nombre libre: nunca pisa el archivo actual) y devuelve su nombre."""
+    archivo = getattr(instancia, campo)
+    return archivo.storage.save(archivo.field.generate_filename(instancia, nombre), ContentFile(datos))
+
+
+def procesar_imagen(instancia):
+    """Genera la miniatura de la foto de ``instancia`` y limpia el EXIF del
+    original. Si la foto se quito, borra la miniatura y devuelve False.
+
+    Nada se borra antes de que la fila apunte a lo nuevo: los archivos nuevos
+    se escriben con nombres nuevos, la fila se actualiza solo si sigue con la
+    foto que se leyo al empezar (update filtrado: si alguien subio otra foto
+    mientras tanto, no se la pisa) y recien entonces se borran los archivos
+    viejos. Si la fila cambio, se borran los nuevos y devuelve False."""
+    modelo = type(instancia)
+    campo_original, campo_miniatura = IMAGENES[modelo]
+    original = getattr(instancia, campo_original)
+    nombre_original = original.name
+    nombre_miniatura = getattr(instancia, campo_miniatura).name
+    storage = original.storage
+    if not original:
+        if nombre_miniatura:
+            sin_foto = Q(**{campo_original: ''}) | Q(**{f'{campo_original}__isnull': True})
+            if modelo.objects.filter(sin_foto, pk=instancia.pk, **{campo_miniatura: nombre_miniatura}).update(
+                    **{campo_miniatura: ''}):
+                storage.delete(nombre_miniatura)
+        return False
+
+    with original.open('rb') as archivo:
+        imagen = Image.open(archivo)
+        imagen.load()
+    formato_original = imagen.format
+    limpiar = _tiene_metadatos(imagen)
+    imagen = ImageOps.exif_transpose(imagen)
+    cambios = {}
+
+    miniatura = imagen.copy()
+    miniatura.thumbnail((settings.MINIATURA_LADO, settings.MINIATURA_LADO), Image.Resampling.LANCZOS)
+    formato, extension, opciones = _formato_miniatura()
+    transparente = miniatura.mode in ('RGBA', 'LA', 'PA') or 'transparency' in miniatura.info
+    miniatura = miniatura.convert('RGBA' if transparente and formato == 'WEBP' else 'RGB')
+    datos_miniatura = _codificar(miniatura, formato, opciones)
+
+    try:
+        if limpiar and formato_original in _REESCRIBIBLES:
+            formato, opciones = _REESCRIBIBLES[formato_original]
+            datos = _codificar(imagen.copy(), formato, opciones)
+            cambios[campo_original] = _guardar(instancia, campo_original, os.path.basename(nombre_original), datos)
+        nombre = os.path.splitext(os.path.basename(nombre_original))[0] + extension
+        cambios[campo_miniatura] = _guardar(instancia, campo_miniatura, nombre, datos_miniatura)
+        actualizadas = modelo.objects.filter(
+            pk=instancia.pk, **{campo_original: nombre_original}).update(**cambios)
+    except Exception:
+        for nuevo in cambios.values():
+            storage.delete(nuevo)
+        raise
+    if not actualizadas:
+        for nuevo in cambios.values():
+            storage.delete(nuevo)
+        return False
+
+    if campo_original in cambios:
+        storage.delete(nombre_original)
+    if nombre_miniatura:
+        storage.delete(nombre_miniatura)
+    return True
+
+
+def _procesar_en_hilo(modelo, pk):
+    close_old_connections()
+    try:
+        instancia = modelo.objects.filter(pk=pk).first()
+        if instancia is not None:
+            procesar_imagen(instancia)
+    except Exception:
+        logger.exception("No se pudo procesar la imagen de %s %s", modelo.__name__, pk)
+    finally:
+        # Cada hilo tiene su propia conexion: se cierra al terminar el trabajo.
+        connection.close()
+
+
+def _worker():
+    global _ejecutor
+    with _candado:
+        if _ejecutor is None:
+            _ejecutor = ThreadPoolExecutor(
+                max_workers=settings.IMAGENES_WORKERS, thread_name_prefix='imagenes')
+        return _ejecutor
+
+
+def encolar_imagen(instancia):
+    """Procesa en segundo plano la foto de ``instancia`` cuando se confirme la
+    transaccion en curso (de inmediato si no hay una): antes el hilo podria no
+    ver la fila o la foto."""
+    modelo, pk = type(instancia), instancia.pk
+    transaction.on_commit(lambda: _worker().submit(_procesar_en_hilo, modelo, pk))
@@ -1,9 +1,10 @@
-from decimal import Decimal
-
 from django.core.management.base import BaseCommand
 from django.db import transaction
 
-from core.models import DetallePedido, DetalleFactura, FacturaDetallePedido
+from core.models import DetallePedido
+from core.utils import actualizar_venta_diaria, bloquear_ledger, costos_por_kilo_ponderados
+
+LOTE = 2000
 
 
 class Command(BaseCommand):
@@ -17,17 +18,19 @@ class Command(BaseCommand):
     reconstruir desde DetalleFactura (que a diferencia de EntradaProducto
     nunca se borra/decrementa al vender).
 
-    Por cada FacturaDetallePedido de la linea rota:
-      peso_promedio_lote = DetalleFactura.cantidad_kilos / DetalleFactura.cantidad_unidades
-      kilos_atribuidos    = unidades_consumidas_de_esa_factura * peso_promedio_lote
-      costo_atribuido     = kilos_atribuidos * DetalleFactura.costo_por_kilo
-
-    Sumando esto sobre todas las facturas vinculadas se obtiene un costo por
-    kilo ponderado real, que se aplica a los kilos reales de la venta
+    El costo/kg reconstruido es el del modelo de costo elegido
+    (costo_por_kilo_ponderado en utils.py): promedio del costo/kg de las
+    facturas vinculadas ponderado por las unidades consumidas de cada una.
+    Antes se ponderaba por kilos atribuidos con el peso promedio por pieza de
+    cada lote, justo el dato que el modelo evita por estar corrupto en parte
+    de los historicos. Se aplica a los kilos reales de la venta
     (DetallePedido.cantidad_kilos, el peso de bascula, no el de la factura).
 
     Lineas que NO tengan ninguna factura vinculada quedan intactas: no hay
     forma honesta de inventarles un costo.
+
+    Los costos se calculan por lotes de lineas (costos_por_kilo_ponderados,
+    una consulta por lote) y se guardan con bulk_update.
     """
 
     help = "Reconstruye total_costo/costo_por_kilo en $0 de DetallePedido usando las facturas vinculadas."
@@ -60,54 +63,45 @@ class Command(BaseCommand):
         arregladas = 0
         sin_factura = 0
 
-        for detalle in qs:
-            links = FacturaDetallePedido.objects.filter(detallepedido=detalle)
-            if not links.exists():
-                sin_factura += 1
-                continue
-
-            costo_reconstruido = Decimal("0.00")
-            kilos_atribuidos_total = Decimal("0.00")
+        ids = list(qs.order_by("id").values_list("id", flat=True))
+        for inicio in range(0, len(ids), LOTE):
+            tramo = ids[inicio:inicio + LOTE]
+            costos = costos_por_kilo_ponderados(tramo)
+            arreglar = []
 
-            for link in links:
-                detalle_factura = (
-                    DetalleFactura.objects.filter(
-                        factura=link.factura_id, producto=detalle.producto_id
-                    )
-                    .first()
-                )
-                if not detalle_factura or not detalle_factura.cantidad_unidades:
+            for detalle in qs.filter(id__in=tramo).order_by("id"):
+                costo_por_kilo_nuevo = costos.get(detalle.id)
+                if costo_por_kilo_nuevo is None:
+                    sin_factura += 1
                     continue
 
-                peso_promedio = (
-                    Decimal(detalle_factura.cantidad_kilos)
-                    / Decimal(detalle_factura.cantidad_unidades)
-                )
-                kilos_atribuidos = Decimal(link.cantidad_unidades) * peso_promedio
-                costo_reconstruido += kilos_atribuidos * detalle_factura.costo_por_kilo
-                kilos_atribuidos_total += kilos_atribuidos
-
-            if kilos_atribuidos_total <= 0:
-                sin_factura += 1
-                continue
+                total_costo_nuevo = detalle.cantidad_kilos * costo_por_kilo_nuevo
 
-            costo_por_kilo_nuevo = costo_reconstruido / kilos_atribuidos_total
-            total_costo_nuevo = detalle.cantidad_kilos * costo_por_kilo_nuevo
+                self.stdout.write(
+                    f"Pedido #{detalle.pedido_id} / {detalle.producto.nombre}: "
+                    f"costo_por_kilo $0 -> ${costo_por_kilo_nuevo:.2f}, "
+                    f"total_costo $0 -> ${total_costo_nuevo:.2f}"
+                )
 
-            self.stdout.write(
-                f"Pedido #{detalle.pedido_id} / {detalle.producto.nombre}: "
-                f"costo_por_kilo $0 -> ${costo_por_kilo_nuevo:.2f}, "
-                f"total_costo $0 -> ${total_costo_nuevo:.2f}"
-            )
+                detalle.costo_por_kilo = costo_por_kilo_nuevo
+                detalle.derivar_totales()
+                arreglar.append(detalle)
 
-            if not dry_run:
+            if arreglar and not dry_run:
                 with transaction.atomic():
-                    detalle.costo_por_kilo = costo_por_kilo_nuevo
-                    detalle.save()
+                    # El costo entra en VentaDiaria: se recalculan sus claves
+                    # bajo el candado de los productos, como en las vistas.
+                    bloquear_ledger(d.producto_id for d in arreglar)
+                    DetallePedido.objects.bulk_update(
+                        arreglar, ["costo_por_kilo", "total_costo", "margen"]
+                    )
+                    actualizar_venta_diaria(
+                        (d.fecha, d.producto_id, d.pedido.vendedor_id) for d in arreglar
+                    )
 
-            arregladas += 1
+            arregladas += len(arreglar)
 
         self.stdout.write(self.style.SUCCESS(
             f"{'[DRY-RUN] ' if dry_run else ''}Lineas reconstruidas: {arregladas}. "
-            f"Sin factura vinculada o sin datos suficientes (sin tocar): {sin_factura}."
+            f"Sin factura vinculada (sin tocar): {sin_factura}."
         ))
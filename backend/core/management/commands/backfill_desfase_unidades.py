@@ -5,7 +5,7 @@ from django.db import transaction
 from django.db.models import Sum
 
 from core.models import DetallePedido, DetalleFactura, FacturaDetallePedido
-from core.utils import consumir_fifo
+from core.utils import actualizar_stock_resumen, actualizar_venta_diaria, bloquear_ledger, consumir_fifo
 
 
 class Command(BaseCommand):
@@ -79,6 +79,7 @@ class Command(BaseCommand):
 
             try:
                 with transaction.atomic():
+                    bloquear_ledger([detalle.producto_id])
                     costo_ex, kilos_ex = self._costo_kilos_facturas_existentes(detalle)
 
                     # Consumir el faltante del stock vivo (descuenta inventario).
@@ -114,6 +115,9 @@ class Command(BaseCommand):
                         if not created:
                             link.cantidad_unidades += cantidad
                             link.save()
+                    actualizar_stock_resumen([detalle.producto_id])
+                    actualizar_venta_diaria(
+                        [(detalle.fecha, detalle.producto_id, detalle.pedido.vendedor_id)])
 
                 corregidas += 1
             except _Rollback:
@@ -0,0 +1,108 @@
+"""Cantidad de consultas y tiempo de CrearPedido segun el largo del pedido.
+
+QUE HACE
+Dentro de UNA transaccion que siempre se revierte siembra un catalogo (un
+producto distinto por linea y por pedido, cada uno con varios lotes) y, para
+cada largo en --lineas, hace POST /api/pedidos/crear/ con un pedido de ese
+largo: la mitad de las lineas pesadas (consumen unidades y kilos) y la mitad
+reservadas (solo unidades). Cuenta las consultas con CaptureQueriesContext y
+mide el tiempo.
+
+Medido con este comando sobre PostgreSQL (valores por defecto), antes y
+despues del camino masivo de CrearPedido (consumir_fifo_pedido + bulk_create):
+
+    lineas   antes   despues
+         1      29        24
+        10     154        55
+        50     714       195
+
+Lo que queda por linea es la lectura FIFO de cada producto (ver
+consumir_fifo_pedido) y la serializacion de la respuesta.
+
+USO
+    python manage.py benchmark_crear_pedido
+    python manage.py benchmark_crear_pedido --lineas 1 10 50 100 --lotes 8
+"""
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.models import Cliente, EntradaProducto, Factura, Producto, Proveedor, Vendedor
+from core.views import CrearPedido
+
+
+class Command(BaseCommand):
+    help = "Consultas y tiempo de CrearPedido para pedidos de distinto largo (se revierte)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lineas', type=int, nargs='+', default=[1, 10, 50],
+                            help='Largos de pedido a medir.')
+        parser.add_argument('--lotes', type=int, default=4,
+                            help='Lotes sembrados por producto.')
+
+    def handle(self, *args, **options):
+        largos = sorted(set(options['lineas']))
+        resultados = []
+        with transaction.atomic():
+            escenario = self._sembrar(sum(largos), max(1, options['lotes']))
+            productos = iter(escenario['productos'])
+            vista = CrearPedido.as_view()
+            factory = APIRequestFactory()
+            for largo in largos:
+                payload = {
+                    'cliente': escenario['cliente'].id,
+                    'detalles': [
+                        {'producto': p.id, 'cantidad_unidades': 3,
+                         'cantidad_kilos': 6 if i % 2 == 0 else 0}
+                        for i, p in zip(range(largo), productos)
+                    ],
+                }
+                request = factory.post('/api/pedidos/crear/', payload, format='json')
+                force_authenticate(request, user=escenario['usuario'])
+                with CaptureQueriesContext(connection) as consultas:
+                    t0 = time.perf_counter()
+                    respuesta = vista(request)
+                    ms = (time.perf_counter() - t0) * 1000
+                if respuesta.status_code != 201:
+                    raise CommandError(f"Pedido de {largo} lineas rechazado: {respuesta.data}")
+                resultados.append((largo, len(consultas), ms))
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{'lineas':>8}{'consultas':>12}{'ms':>10}")
+        for largo, n, ms in resultados:
+            self.stdout.write(f"{largo:>8}{n:>12}{ms:>10.1f}")
+        self.stdout.write(self.style.SUCCESS("Transaccion revertida."))
+
+    def _sembrar(self, n_productos, n_lotes):
+        tag = f"BENCHPED-{timezone.now().timestamp()}"
+        proveedor = Proveedor.objects.create(nombre=tag)
+        vendedor = Vendedor.objects.create(nombre=tag, sigla='BP')
+        cliente = Cliente.objects.create(nombre=tag, direccion='-', vendedor=vendedor)
+        usuario = get_user_model().objects.create_user(username=tag, is_staff=True)
+        productos = Producto.objects.bulk_create([
+            Producto(nombre=f"{tag} {i}", precio_por_kilo=Decimal('10000'))
+            for i in range(n_productos)
+        ])
+        facturas = Factura.objects.bulk_create([
+            Factura(numero_factura=f"{tag}-{j}", proveedor=proveedor,
+                    fecha=timezone.now().date(), subtotal=0, iva=0, total=0)
+            for j in range(n_lotes)
+        ])
+        # Lotes de 2 unidades: cada linea de 3 unidades cruza dos lotes.
+        EntradaProducto.objects.bulk_create([
+            EntradaProducto(
+                factura=factura, producto=producto,
+                cantidad_unidades=2, cantidad_kilos=Decimal('4.00'),
+                costo_por_kilo=Decimal(5000 + j * 100),
+                fecha_entrada=timezone.now() + timezone.timedelta(seconds=j),
+            )
+            for producto in productos
+            for j, factura in enumerate(facturas)
+        ])
+        return {'cliente': cliente, 'usuario': usuario, 'productos': productos}
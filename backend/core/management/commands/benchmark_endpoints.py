@@ -0,0 +1,367 @@
+"""Consultas, tiempo y tamano de respuesta de cada ruta de core/urls.py sobre
+un conjunto de datos sintetico, para detectar si un cambio en las vistas
+vuelve mas lenta la API.
+
+QUE HACE
+Dentro de UNA transaccion que siempre se revierte siembra datos con la forma
+de la base real (core/sintetico.py; --escala multiplica las cantidades
+observadas, o se fijan una por una) y recorre la lista de CASOS con el
+cliente de pruebas de DRF (pasa por las URLs, los middlewares y la
+autenticacion, como una peticion real). Cada caso corre --repeticiones veces,
+cada vez en un savepoint que se revierte, asi que las escrituras (crear
+pedido, cancelar, importar facturas...) miden siempre sobre los mismos datos.
+Por caso guarda el status, la cantidad de consultas, la mediana y el minimo
+del tiempo y los bytes de la respuesta (las exportaciones se consumen
+enteras). Las rutas de core/urls.py que ningun caso cubre se avisan. Todos
+los casos deben responder 2xx: si alguno responde 4xx/5xx el comando termina
+con error sin guardar ni comparar (una base que mide el error no sirve).
+
+Los reportes se miden en frio: corren con un cache 'reportes' en memoria,
+propio del comando, que se vacia antes de cada repeticion. El cache en
+archivos de produccion no se lee ni se escribe.
+
+COMPARAR
+--json guarda el resultado; --comparar BASE.json lo compara con una corrida
+anterior y termina con error si alguna ruta hace mas consultas que antes, o
+su tiempo minimo sube mas de --umbral-tiempo por ciento (y mas de --piso-ms,
+para no saltar por ruido en rutas de pocos ms), o cambio de status. Las consultas son
+deterministas para la misma semilla y las mismas cantidades; el tiempo
+depende de la maquina, asi que la base conviene generarla en el mismo equipo
+y motor.
+
+USO
+    python manage.py benchmark_endpoints
+    python manage.py benchmark_endpoints --escala 10 --json base.json
+    python manage.py benchmark_endpoints --escala 10 --comparar base.json --umbral-tiempo 20
+    python manage.py benchmark_endpoints --solo reportes --json -
+"""
+import json
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core import urls as core_urls
+from core.models import (
+    Cliente, DetalleFactura, DetallePedido, EntradaProducto, Factura, PagoFactura, Pedido,
+    Producto, Proveedor, Vendedor,
+)
+from core.sintetico import PERFIL_BASE, escalar, sembrar
+
+CLAVE = 'bench-endpoints'
+
+
+def _referencias(prefijo):
+    """Ids de los datos sembrados que usan los casos."""
+    productos = Producto.objects.filter(nombre__startswith=prefijo)
+    con_stock = EntradaProducto.objects.filter(
+        producto=OuterRef('pk'), cantidad_unidades__gt=0, cantidad_kilos__gt=0)
+    producto = productos.filter(Exists(con_stock)).order_by('pk').first()
+    if producto is None:
+        raise CommandError("Los datos sembrados no dejaron stock: subi --facturas.")
+    pedidos = Pedido.objects.filter(cliente__nombre__startswith=prefijo).order_by('-pk')
+    pagado = pedidos.filter(estado='Pagado').first() or pedidos.first()
+    # La factura mas nueva: es la que menos ventas tiene encima.
+    factura = Factura.objects.filter(numero_factura__startswith=prefijo).order_by('-fecha', '-pk').first()
+    cliente = Cliente.objects.filter(nombre__startswith=prefijo).order_by('pk').first()
+    impaga = (Factura.objects.filter(numero_factura__startswith=prefijo)
+              .exclude(pk__in=PagoFactura.objects.values('factura')).order_by('pk').first())
+    return {
+        'producto': producto,
+        'cliente': cliente,
+        'vendedor': Vendedor.objects.filter(nombre__startswith=prefijo).order_by('pk').first(),
+        'proveedor': Proveedor.objects.filter(nombre__startswith=prefijo).order_by('pk').first(),
+        'pagado': pagado,
+        'factura': factura,
+        'lineas_factura': list(DetalleFactura.objects.filter(factura=factura)
+                               .values('id', 'cantidad_unidades', 'cantidad_kilos')),
+        'impaga': impaga or factura,
+        # Lo que completa las urls de _casos.
+        'ids': {
+            'producto': producto.pk, 'cliente': cliente.pk,
+            'factura': factura.pk,
+            'desde': (timezone.localdate() - timedelta(days=60)).isoformat(),
+        },
+    }
+
+
+def _reservar(cliente, r):
+    """Crea por la API un pedido sin pesar (Reservado) de un producto con
+    stock, para los casos que editan pedidos. El perfil real casi no tiene
+    Reservados y uno Pagado sin lotes detras hacia fallar esos casos con 400."""
+    respuesta = cliente.post('/api/pedidos/crear/', {
+        'cliente': r['cliente'].id,
+        'detalles': [{'producto': r['producto'].id, 'cantidad_unidades': 1, 'cantidad_kilos': 0}],
+    }, format='json')
+    if respuesta.status_code != 201:
+        raise CommandError(f"No se pudo crear el pedido reservado: {respuesta.status_code} {respuesta.data}")
+    reservado = Pedido.objects.get(pk=respuesta.data['id'])
+    if reservado.estado != 'Reservado':
+        raise CommandError(f"El pedido de prueba quedo {reservado.estado}, no Reservado.")
+    r['reservado'] = reservado
+    r['lineas_reservado'] = list(DetallePedido.objects.filter(pedido=reservado)
+                                 .values('producto', 'cantidad_unidades'))
+    r['ids']['reservado'] = reservado.pk
+
+
+def _casos(r):
+    """(nombre de la ruta, metodo, url, datos). El nombre es el name= de
+    core/urls.py: asi se sabe que rutas quedaron sin medir. Los ids van como
+    {producto}, {factura}...: el caso se identifica por la url sin completar,
+    que no cambia entre corridas aunque cambien los ids."""
+    hoy = timezone.localdate()
+    p, pid = r['producto'], r['producto'].id
+    factura_nueva = {
+        'proveedor': r['proveedor'].id, 'numero_factura': f'{CLAVE}-1', 'fecha': hoy.isoformat(),
+        'subtotal': 100000, 'iva': 19000, 'total': 119000,
+        'detalles': [{'producto': pid, 'cantidad_unidades': 10, 'cantidad_kilos': 20,
+                      'costo_por_kilo': 5000}],
+    }
+    importacion = {'facturas': [
+        dict(factura_nueva, numero_factura=f'{CLAVE}-imp-{i}') for i in range(5)
+    ]}
+    return [
+        ('productos', 'get', '/api/productos/', None),
+        ('crear_producto', 'post', '/api/productos/crear/',
+         {'nombre': f'{CLAVE} producto', 'precio_por_kilo': 9990, 'estado': 'disponible'}),
+        ('actualizar_producto', 'put', '/api/productos/{producto}/',
+         {'precio_por_kilo': str(p.precio_por_kilo + 10)}),
+        ('historial_precio_producto', 'get', '/api/productos/{producto}/historial-precio/', None),
+        ('pedidos', 'get', '/api/pedidos/', None),
+        ('pedidos', 'get', '/api/pedidos/?page_size=50', None),
+        ('crear_pedido', 'post', '/api/pedidos/crear/',
+         {'cliente': r['cliente'].id, 'detalles': [{'producto': pid, 'cantidad_unidades': 1,
+                                                    'cantidad_kilos': 2}]}),
+        ('actualizar_kilos_pedido', 'post', '/api/pedidos/actualizar_kilos/{reservado}/',
+         {'detalles': [{'producto': linea['producto'], 'cantidad_kilos': 2}
+                       for linea in r['lineas_reservado']]}),
+        ('pedido-detail', 'put', '/api/pedidos/{reservado}/',
+         {'detalles': [{'producto': linea['producto'], 'cantidad_unidades': linea['cantidad_unidades'],
+                        'cantidad_kilos': 0} for linea in r['lineas_reservado']]}),
+        ('cancelar_pedido', 'post', '/api/pedidos/cancelar/', {'pedido_id': r['pagado'].id}),
+        ('clientes', 'get', '/api/clientes/', None),
+        ('crear_cliente', 'post', '/api/clientes/crear/',
+         {'nombre': f'{CLAVE} cliente', 'direccion': '-', 'telefono': '', 'vendedor_id': r['vendedor'].id}),
+        ('actualizar_cliente', 'put', '/api/clientes/{cliente}/',
+         {'nombre': r['cliente'].nombre, 'direccion': 'Otra 123', 'vendedor_id': r['vendedor'].id}),
+        ('crear_factura', 'post', '/api/facturas/crear/', factura_nueva),
+        ('importar_facturas', 'post', '/api/facturas/importar/', importacion),
+        ('facturas', 'get', '/api/facturas/', None),
+        ('pagar_factura', 'post', '/api/facturas/pagar/',
+         {'factura': r['impaga'].pk, 'fecha_de_pago': hoy.isoformat(), 'monto_del_pago': 1000}),
+        ('actualizar_factura', 'put', '/api/facturas/{factura}/',
+         {'detalles': [{'id': d['id'], 'cantidad_unidades': d['cantidad_unidades'],
+                        'cantidad_kilos': str(d['cantidad_kilos']), 'costo_por_kilo': 5100}
+                       for d in r['lineas_factura']]}),
+        ('stock_productos', 'get', '/api/stock/', None),
+        ('stock_productos', 'get', '/api/stock/?fuente=ledger', None),
+        ('vendedores', 'get', '/api/vendedores/', None),
+        ('proveedores', 'get', '/api/proveedores/', None),
+        ('detalle-pedidos-list', 'get', '/api/inventario/detalle-pedidos/', None),
+        ('detalle-pedidos-list', 'get', '/api/inventario/detalle-pedidos/?page_size=50&desde={desde}', None),
+        ('detalle-facturas-list', 'get', '/api/inventario/detalle-facturas/', None),
+        ('detalle-facturas-list', 'get', '/api/inventario/detalle-facturas/?page_size=50', None),
+        ('exportar-detalle-pedidos', 'get', '/api/inventario/detalle-pedidos/exportar/', None),
+        ('exportar-detalle-pedidos', 'get', '/api/inventario/detalle-pedidos/exportar/?formato=csv', None),
+        ('exportar-detalle-facturas', 'get', '/api/inventario/detalle-facturas/exportar/', None),
+        ('ajustes-inventario-list', 'get', '/api/inventario/ajustes/', None),
+        ('crear_ajuste_inventario', 'post', '/api/inventario/ajustes/crear/',
+         {'producto': pid, 'tipo': 'merma', 'cantidad': 1, 'cantidad_unidades': 0}),
+        ('pagos_vendedor', 'get', '/api/pagos-vendedor/', None),
+        ('pagos_vendedor', 'post', '/api/pagos-vendedor/',
+         {'vendedor': r['vendedor'].id, 'monto': 5000, 'tipo': 'pago'}),
+        ('reporte_ganancias', 'get', '/api/reportes/ganancias/', None),
+        ('reporte_perdidas', 'get', '/api/reportes/perdidas/', None),
+        ('reporte_fluctuacion', 'get', '/api/reportes/fluctuacion-precios/?producto={producto}', None),
+        ('reporte_margen_productos', 'get', '/api/reportes/margen-productos/', None),
+        ('reporte_rentabilidad_historica', 'get', '/api/reportes/rentabilidad-historica/?producto={producto}', None),
+        ('reportes_cache', 'get', '/api/reportes/cache/', None),
+        ('token_obtain_pair', 'post', '/api/token/', {'username': CLAVE, 'password': CLAVE}),
+        ('token_refresh', 'post', '/api/token/refresh/', None),
+    ]
+
+
+def _bytes(respuesta):
+    if respuesta.streaming:
+        return sum(len(trozo) for trozo in respuesta.streaming_content)
+    return len(respuesta.content)
+
+
+class Command(BaseCommand):
+    help = "Consultas, tiempo y bytes de cada ruta de la API sobre datos sinteticos (se revierte)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escala', type=float, default=1,
+                            help='Multiplica las cantidades de la base observada (default 1).')
+        for nombre in PERFIL_BASE['cantidades']:
+            parser.add_argument(f'--{nombre}', type=int, help=f'Fija la cantidad de {nombre}.')
+        parser.add_argument('--lotes', type=int,
+                            help='Lotes comprados en total (fija --facturas segun las lineas por factura).')
+        parser.add_argument('--semilla', type=int, default=1)
+        parser.add_argument('--repeticiones', type=int, default=5,
+                            help='Veces que se mide cada caso (se informa la mediana).')
+        parser.add_argument('--solo', action='append', default=[],
+                            help='Mide solo los casos cuya ruta o nombre contiene el texto (repetible).')
+        parser.add_argument('--json', metavar='ARCHIVO',
+                            help="Guarda el resultado en ARCHIVO ('-' para stdout).")
+        parser.add_argument('--comparar', metavar='BASE',
+                            help='Compara con un resultado guardado y falla si hay regresiones.')
+        parser.add_argument('--umbral-tiempo', type=float, default=25,
+                            help='Porcentaje de aumento del tiempo minimo que cuenta como regresion (default 25).')
+        parser.add_argument('--piso-ms', type=float, default=5,
+                            help='Aumento minimo en ms para contar como regresion (default 5).')
+
+    def _cantidades(self, options):
+        cantidades = escalar(options['escala'])
+        for nombre in cantidades:
+            if options[nombre] is not None:
+                cantidades[nombre] = max(1, options[nombre])
+        if options['lotes']:
+            lineas = PERFIL_BASE['lineas_por_factura']
+            media = sum(k * v for k, v in lineas.items()) / sum(lineas.values())
+            cantidades['facturas'] = max(1, round(options['lotes'] / media))
+        return cantidades
+
+    def handle(self, *args, **options):
+        cantidades = self._cantidades(options)
+        repeticiones = max(1, options['repeticiones'])
+        salida = self.stderr if options['json'] == '-' else self.stdout
+        base = None
+        if options['comparar']:
+            with open(options['comparar'], encoding='utf-8') as archivo:
+                base = json.load(archivo)
+
+        # Fijo, para que los numeros de factura sembrados (parte de las
+        # respuestas) no cambien entre corridas; nada de esto se confirma.
+        prefijo = 'BENCH'
+        cache_propio = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': CLAVE}
+        resultados = {}
+        with override_settings(CACHES={'default': cache_propio, 'reportes': cache_propio}):
+            with transaction.atomic():
+                t0 = time.perf_counter()
+                filas = sembrar(cantidades, semilla=options['semilla'], prefijo=prefijo)
+                salida.write(f"Sembrado en {time.perf_counter() - t0:.1f}s: "
+                             + ", ".join(f"{tabla} {n}" for tabla, n in filas.items() if n))
+                usuario = get_user_model().objects.create_user(
+                    username=CLAVE, password=CLAVE, is_staff=True, is_superuser=True)
+                referencias = _referencias(prefijo)
+                # Un 500 se registra como status del caso, no corta la corrida.
+                cliente = APIClient(raise_request_exception=False)
+                refresco = cliente.post('/api/token/', {'username': CLAVE, 'password': CLAVE},
+                                        format='json').data.get('refresh')
+                cliente.force_authenticate(usuario)
+                _reservar(cliente, referencias)
+                casos = _casos(referencias)
+
+                medidos = set()
+                for nombre, metodo, url, datos in casos:
+                    clave = f"{metodo.upper()} {url}"
+                    if options['solo'] and not any(t in clave or t in nombre for t in options['solo']):
+                        continue
+                    if nombre == 'token_refresh':
+                        datos = {'refresh': refresco}
+                    resultados[clave] = self._medir(
+                        cliente, metodo, url.format(**referencias['ids']), datos, repeticiones)
+                    resultados[clave]['ruta'] = nombre
+                    medidos.add(nombre)
+                transaction.set_rollback(True)
+
+        if not options['solo']:
+            rutas = {p.name for p in core_urls.urlpatterns}
+            faltan = sorted(rutas - medidos)
+            if faltan:
+                salida.write(self.style.WARNING(f"Rutas sin caso: {', '.join(faltan)}"))
+
+        informe = {
+            'generado': timezone.now().isoformat(),
+            'motor': connection.vendor,
+            'semilla': options['semilla'],
+            'repeticiones': repeticiones,
+            'cantidades': cantidades,
+            'filas': filas,
+            'casos': resultados,
+        }
+        self._tabla(salida, resultados, base)
+        # Todos los casos deben responder bien: medir el camino de error no
+        # sirve de base y esconderia una regresion del camino real.
+        fallidos = [f"{clave}: {r['status']}" for clave, r in resultados.items() if r['status'] >= 400]
+        if fallidos:
+            for texto in fallidos:
+                salida.write(self.style.ERROR(f"  {texto}"))
+            raise CommandError(f"{len(fallidos)} caso(s) respondieron con error; no se guarda ni compara nada.")
+        if options['json'] == '-':
+            json.dump(informe, sys.stdout, indent=2, ensure_ascii=False)
+            sys.stdout.write('\n')
+        elif options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as archivo:
+                json.dump(informe, archivo, indent=2, ensure_ascii=False)
+            salida.write(f"Resultado en {options['json']}")
+        salida.write(self.style.SUCCESS("Transaccion revertida."))
+
+        if base is not None:
+            self._comparar(salida, options['comparar'], base, informe, options['umbral_tiempo'],
+                           options['piso_ms'])
+
+    def _medir(self, cliente, metodo, url, datos, repeticiones):
+        tiempos = []
+        for _ in range(repeticiones):
+            caches['reportes'].clear()
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as consultas:
+                    t0 = time.perf_counter()
+                    respuesta = getattr(cliente, metodo)(url, datos, format='json')
+                    tamano = _bytes(respuesta)
+                    tiempos.append((time.perf_counter() - t0) * 1000)
+                transaction.set_rollback(True)
+        return {
+            'status': respuesta.status_code,
+            'consultas': len(consultas),
+            'ms': round(statistics.median(tiempos), 2),
+            'ms_min': round(min(tiempos), 2),
+            'bytes': tamano,
+        }
+
+    def _tabla(self, salida, resultados, base):
+        anteriores = (base or {}).get('casos', {})
+        salida.write(f"{'caso':<72}{'status':>7}{'consultas':>10}{'ms':>10}{'bytes':>10}")
+        for clave, r in resultados.items():
+            linea = f"{clave[:71]:<72}{r['status']:>7}{r['consultas']:>10}{r['ms']:>10.1f}{r['bytes']:>10}"
+            if clave in anteriores:
+                a = anteriores[clave]
+                linea += f"   (antes {a['consultas']} / {a['ms']:.1f} ms / {a['bytes']} b)"
+            estilo = self.style.ERROR if r['status'] >= 400 else (lambda t: t)
+            salida.write(estilo(linea))
+
+    def _comparar(self, salida, nombre_base, base, informe, umbral, piso_ms):
+        if base.get('cantidades') != informe['cantidades'] or base.get('semilla') != informe['semilla']:
+            salida.write(self.style.WARNING(
+                "La base se genero con otras cantidades o semilla: las consultas pueden no ser comparables."))
+        if base.get('motor') != informe['motor']:
+            salida.write(self.style.WARNING(f"La base se genero sobre {base.get('motor')}."))
+        regresiones = []
+        for clave, r in informe['casos'].items():
+            a = base.get('casos', {}).get(clave)
+            if a is None:
+                continue
+            if r['status'] != a['status']:
+                regresiones.append(f"{clave}: status {a['status']} -> {r['status']}")
+            if r['consultas'] > a['consultas']:
+                regresiones.append(f"{clave}: consultas {a['consultas']} -> {r['consultas']}")
+            # El minimo de las repeticiones: la mediana sube con cualquier
+            # ruido de la maquina, el minimo solo si la ruta se hizo mas lenta.
+            if r['ms_min'] - a['ms_min'] > piso_ms and r['ms_min'] > a['ms_min'] * (1 + umbral / 100):
+                regresiones.append(f"{clave}: {a['ms_min']:.1f} ms -> {r['ms_min']:.1f} ms (minimo)")
+        if regresiones:
+            for texto in regresiones:
+                salida.write(self.style.ERROR(f"  {texto}"))
+            raise CommandError(f"{len(regresiones)} regresion(es) respecto de {nombre_base}.")
+        salida.write(self.style.SUCCESS("Sin regresiones respecto de la base."))
@@ -0,0 +1,139 @@
+"""Muestra el cambio de plan de las consultas calientes del ledger FIFO
+(EntradaProducto) con y sin los indices de la migracion 0024.
+
+QUE HACE
+Dentro de UNA transaccion que siempre se revierte:
+  1. siembra un ledger sintetico (por defecto 100k lotes repartidos entre
+     varios productos, con una fraccion de lotes ya vaciados en kilos y
+     unidades, como los que deja consumir_fifo/descontar_kilos_fifo),
+  2. corre ANALYZE y EXPLAIN ANALYZE de cada consulta con los indices,
+  3. borra los indices (DDL transaccional) y repite los EXPLAIN.
+
+Al final se hace ROLLBACK: ni los datos sinteticos ni el DROP INDEX quedan en
+la base. Requiere un motor con DDL transaccional (PostgreSQL).
+
+USO
+    python manage.py benchmark_indices_ledger
+    python manage.py benchmark_indices_ledger --lotes 20000 --productos 10
+"""
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import EntradaProducto, Factura, Producto, Proveedor
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN de las consultas FIFO con y sin indices sobre un ledger sintetico (se revierte)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lotes', type=int, default=100_000,
+                            help='Cantidad de lotes EntradaProducto a sembrar.')
+        parser.add_argument('--productos', type=int, default=40,
+                            help='Cantidad de productos entre los que se reparten los lotes.')
+        parser.add_argument('--vaciados', type=float, default=0.6,
+                            help='Fraccion de lotes sembrados con 0 unidades y 0 kg.')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError(
+                "Este benchmark borra indices dentro de una transaccion y "
+                "necesita PostgreSQL (DDL transaccional + EXPLAIN ANALYZE).")
+
+        random.seed(options['seed'])
+        with transaction.atomic():
+            producto, lote = self._sembrar(
+                options['lotes'], options['productos'], options['vaciados'])
+
+            consultas = self._consultas(producto, lote)
+
+            self.stdout.write(self.style.MIGRATE_HEADING("\n=== CON indices ==="))
+            con = self._explicar(consultas)
+
+            indices = list(EntradaProducto._meta.indexes)
+            with connection.schema_editor(atomic=False) as editor:
+                for index in indices:
+                    editor.remove_index(EntradaProducto, index)
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {EntradaProducto._meta.db_table}')
+
+            self.stdout.write(self.style.MIGRATE_HEADING("\n=== SIN indices ==="))
+            sin = self._explicar(consultas)
+
+            self.stdout.write("\n" + "=" * 60)
+            self.stdout.write(f"{'consulta':<28}{'con (ms)':>12}{'sin (ms)':>12}")
+            for nombre in consultas:
+                self.stdout.write(f"{nombre:<28}{con[nombre]:>12.2f}{sin[nombre]:>12.2f}")
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS(
+            "\nTransaccion revertida: no quedaron datos sinteticos ni indices borrados."))
+
+    def _sembrar(self, n_lotes, n_productos, vaciados):
+        proveedor = Proveedor.objects.create(nombre=f'BENCH-{timezone.now().timestamp()}')
+        productos = Producto.objects.bulk_create([
+            Producto(nombre=f'BENCH {i}', precio_por_kilo=Decimal('10000'))
+            for i in range(n_productos)
+        ])
+        facturas = Factura.objects.bulk_create([
+            Factura(
+                numero_factura=f'BENCH-{proveedor.id}-{i}', proveedor=proveedor,
+                fecha=timezone.now().date(), subtotal=0, iva=0, total=0,
+            )
+            for i in range(max(1, n_lotes // 50))
+        ])
+
+        inicio = timezone.now() - timezone.timedelta(days=3 * 365)
+        lotes = []
+        for i in range(n_lotes):
+            vacio = random.random() < vaciados
+            unidades = 0 if vacio else random.randint(1, 12)
+            lotes.append(EntradaProducto(
+                factura=facturas[i // 50],
+                producto=random.choice(productos),
+                cantidad_unidades=unidades,
+                cantidad_kilos=Decimal('0.00') if vacio else Decimal(unidades * 2),
+                costo_por_kilo=Decimal(random.randint(4000, 9000)),
+                fecha_entrada=inicio + timezone.timedelta(minutes=i),
+            ))
+        EntradaProducto.objects.bulk_create(lotes, batch_size=5000)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {EntradaProducto._meta.db_table}')
+
+        self.stdout.write(
+            f"Sembrados {n_lotes} lotes, {n_productos} productos, "
+            f"{len(facturas)} facturas ({vaciados:.0%} vaciados).")
+        return productos[0], lotes[n_lotes // 2]
+
+    def _consultas(self, producto, lote):
+        vivos = EntradaProducto.objects.filter(producto=producto, cantidad_unidades__gt=0)
+        return {
+            # _lotes_fifo (consumir_fifo / descontar_kilos_fifo)
+            'fifo_lotes_vivos': vivos.order_by('fecha_entrada', 'id')[:10],
+            # restituir_kilos_fifo y la fecha de retorno de CancelarPedido
+            'fifo_lote_mas_antiguo': EntradaProducto.objects.filter(
+                producto=producto).order_by('fecha_entrada')[:1],
+            # costo reciente de MargenActualProductoView
+            'ultimo_costo_producto': EntradaProducto.objects.filter(
+                producto=producto).order_by('-fecha_entrada')[:1],
+            # estado_consumo_detalle
+            'vivas_factura_producto': EntradaProducto.objects.filter(
+                factura=lote.factura_id, producto=lote.producto_id),
+        }
+
+    def _explicar(self, consultas):
+        tiempos = {}
+        for nombre, qs in consultas.items():
+            t0 = time.perf_counter()
+            plan = qs.explain(analyze=True)
+            tiempos[nombre] = (time.perf_counter() - t0) * 1000
+            self.stdout.write(self.style.HTTP_INFO(f"\n-- {nombre}"))
+            self.stdout.write(plan)
+        return tiempos
@@ -0,0 +1,163 @@
+"""Compacta el ledger de stock (EntradaProducto): junta lotes fragmentados y
+borra las filas vacias.
+
+POR QUE HACE FALTA
+Cada anulacion (CancelarPedido) crea un lote nuevo por cada factura de la que
+habia salido la venta, un segundo antes del lote mas antiguo. Y consumir_fifo
+conserva los lotes que se quedan sin unidades pero todavia tienen kilos. Con
+el tiempo cada producto junta muchas filas chicas que cada lectura FIFO
+(_lotes_fifo) tiene que recorrer, y filas 0/0 que quedaron de antes de que se
+borraran solas.
+
+QUE HACE
+Recorre los lotes de cada producto en orden FIFO (fecha_entrada, id):
+  - borra las filas con 0 unidades y 0 kilos (no rastrean nada);
+  - suma un lote al lote vivo ANTERIOR (el que queda, con su fecha) cuando son
+    de la misma factura, con el mismo costo_por_kilo y la fusion no cambia el
+    costeo de las ventas futuras: los dos sin unidades (restos de kilos, que
+    el FIFO de unidades no mira) o los dos con unidades y el mismo peso
+    promedio (kilos / unidades), que es con lo que consumir_fifo costea.
+Las filas que se suman son vecinas en el orden FIFO, asi que el orden de
+consumo no cambia, y los totales de unidades y kilos por producto (y por
+factura) quedan exactamente iguales. Nada referencia a EntradaProducto por FK.
+
+Con --mezclar-pesos tambien se suman lotes con unidades de distinto peso
+promedio: el costo de vender el lote entero es el mismo, pero una venta
+parcial se costea con el promedio de los dos. Los restos sin unidades nunca se
+suman a lotes con unidades (sus kilos entrarian al costeo).
+
+REPORTE
+Por producto: filas antes y despues, filas borradas por vacias y por fusion, y
+lotes vivos antes y despues. Los lotes vivos son la profundidad maxima de una
+lectura FIFO (la relectura completa de _lotes_fifo los recorre todos): la
+diferencia es lo que se ahorra cada lectura profunda.
+
+CONCURRENCIA
+Con --apply cada producto se compacta en su propia transaccion, con el
+candado del ledger (bloquear_ledger) y releyendo los lotes: las ventas del
+producto esperan unos milisegundos y las de otros productos siguen. Se puede
+correr de noche desde un cron.
+
+USO
+    python manage.py compactar_lotes                   # dry-run: que se haria
+    python manage.py compactar_lotes --apply
+    python manage.py compactar_lotes --producto 3 --apply
+    python manage.py compactar_lotes --mezclar-pesos --apply
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import EntradaProducto, Producto
+from core.reportes_cache import invalidar_reportes
+from core.utils import bloquear_ledger
+
+
+def _vivo(lote):
+    return lote.cantidad_unidades > 0 or lote.cantidad_kilos > 0
+
+
+def _fusionables(ancla, lote, mezclar_pesos):
+    if ancla.factura_id != lote.factura_id or ancla.costo_por_kilo != lote.costo_por_kilo:
+        return False
+    if ancla.cantidad_unidades <= 0 or lote.cantidad_unidades <= 0:
+        return ancla.cantidad_unidades <= 0 and lote.cantidad_unidades <= 0
+    if mezclar_pesos:
+        return True
+    # Mismo peso promedio, sin dividir: ka / ua == kb / ub.
+    return ancla.cantidad_kilos * lote.cantidad_unidades == lote.cantidad_kilos * ancla.cantidad_unidades
+
+
+def planear(lotes, mezclar_pesos=False):
+    """Plan de compactacion de ``lotes`` (de un producto, en orden FIFO). No
+    escribe: suma en memoria sobre los objetos y devuelve
+    (lotes a actualizar, pks de vacias a borrar, pks fusionados a borrar)."""
+    vacias, fusionadas, tocados = set(), set(), {}
+    ancla = None
+    for lote in lotes:
+        if not _vivo(lote):
+            vacias.add(lote.pk)
+            continue
+        if ancla is not None and _fusionables(ancla, lote, mezclar_pesos):
+            ancla.cantidad_unidades += lote.cantidad_unidades
+            ancla.cantidad_kilos += lote.cantidad_kilos
+            tocados[ancla.pk] = ancla
+            fusionadas.add(lote.pk)
+            continue
+        ancla = lote
+    return list(tocados.values()), vacias, fusionadas
+
+
+def _lotes(producto_id, bloquear=False):
+    lotes = EntradaProducto.objects.filter(producto_id=producto_id)
+    if bloquear:
+        lotes = lotes.select_for_update()
+    return list(lotes.order_by('fecha_entrada', 'id'))
+
+
+class Command(BaseCommand):
+    help = "Junta lotes fragmentados de EntradaProducto y borra los vacios (dry-run por defecto)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--producto', type=int, action='append', default=None,
+                            help='Limita la compactacion a este id de producto (repetible).')
+        parser.add_argument('--mezclar-pesos', action='store_true',
+                            help='Junta tambien lotes con unidades de distinto peso promedio.')
+        parser.add_argument('--apply', action='store_true',
+                            help='Escribe. Sin este flag solo muestra lo que se haria.')
+
+    def _compactar(self, producto_id, mezclar_pesos, aplicar):
+        """Devuelve (filas del producto antes, vacias, fusionadas)."""
+        if not aplicar:
+            lotes = _lotes(producto_id)
+            _tocados, vacias, fusionadas = planear(lotes, mezclar_pesos)
+            return len(lotes), vacias, fusionadas
+        with transaction.atomic():
+            bloquear_ledger([producto_id])
+            lotes = _lotes(producto_id, bloquear=True)
+            tocados, vacias, fusionadas = planear(lotes, mezclar_pesos)
+            if tocados:
+                EntradaProducto.objects.bulk_update(tocados, ['cantidad_unidades', 'cantidad_kilos'])
+            if vacias or fusionadas:
+                EntradaProducto.objects.filter(pk__in=vacias | fusionadas).delete()
+        return len(lotes), vacias, fusionadas
+
+    def handle(self, *args, **options):
+        aplicar = options['apply']
+        productos = Producto.objects.order_by('id')
+        if options['producto']:
+            productos = productos.filter(id__in=options['producto'])
+        if not aplicar:
+            self.stdout.write(self.style.WARNING("DRY-RUN: no se escribe nada. Usa --apply para ejecutar.\n"))
+
+        self.stdout.write(f"{'producto':<32}{'filas':>8}{'->':>4}{'quedan':>8}"
+                          f"{'vacias':>8}{'fusion':>8}{'vivos':>8}{'->':>4}{'quedan':>8}")
+        totales = {'filas': 0, 'vacias': 0, 'fusionadas': 0, 'vivos': 0, 'vivos_despues': 0}
+        max_antes = max_despues = 0
+        for producto in productos:
+            filas, vacias, fusionadas = self._compactar(producto.id, options['mezclar_pesos'], aplicar)
+            vivos = filas - len(vacias)
+            vivos_despues = vivos - len(fusionadas)
+            totales['filas'] += filas
+            totales['vacias'] += len(vacias)
+            totales['fusionadas'] += len(fusionadas)
+            totales['vivos'] += vivos
+            totales['vivos_despues'] += vivos_despues
+            max_antes, max_despues = max(max_antes, vivos), max(max_despues, vivos_despues)
+            if vacias or fusionadas:
+                self.stdout.write(
+                    f"{producto.nombre[:31]:<32}{filas:>8}{'':>4}{filas - len(vacias) - len(fusionadas):>8}"
+                    f"{len(vacias):>8}{len(fusionadas):>8}{vivos:>8}{'':>4}{vivos_despues:>8}")
+
+        borradas = totales['vacias'] + totales['fusionadas']
+        self.stdout.write(
+            f"\nFilas: {totales['filas']} -> {totales['filas'] - borradas} "
+            f"({totales['vacias']} vacias y {totales['fusionadas']} fusionadas)."
+            f"\nLotes vivos (profundidad FIFO): {totales['vivos']} -> {totales['vivos_despues']}; "
+            f"el producto mas profundo {max_antes} -> {max_despues}.")
+        if not borradas:
+            self.stdout.write(self.style.SUCCESS("Nada que compactar."))
+        elif aplicar:
+            invalidar_reportes()
+            self.stdout.write(self.style.SUCCESS(f"Listo: {borradas} filas menos."))
+        else:
+            self.stdout.write(self.style.WARNING("DRY-RUN: repite con --apply para compactar."))
@@ -0,0 +1,164 @@
+"""Genera datos sinteticos con la forma de produccion a 10x, 100x... el
+volumen real, para dimensionar el servidor y encontrar donde se cae el
+rendimiento.
+
+LA FORMA
+Se ajusta desde un volcado real (core/sintetico.py, ajustar_perfil): lineas
+por factura, unidades por lote, peso por unidad y su variacion de cada corte,
+mezcla de estados de los pedidos (Reservado, Preparado, tasa de anulacion),
+lineas sin pesar y frecuencia y tamano de las mermas. Sin --desde se usa el
+primer volcado que sirva entre backup_completo.json (el de backend/ y el de
+la raiz) y el backups/*.sql mas nuevo; un archivo vacio o cortado se avisa y
+se saltea. Con --perfil-base se usa PERFIL_BASE sin leer nada.
+
+LAS CANTIDADES
+--escala multiplica las cantidades del volcado (productos y proveedores
+crecen con la raiz, ver escalar); cada una se puede fijar aparte. Los dias
+cubiertos son los del volcado salvo --dias: a mas escala, mas movimiento por
+dia, como un negocio que vende mas.
+
+LA SALIDA
+Por defecto escribe en la base configurada, en UNA transaccion: en
+PostgreSQL con COPY (--sin-copy para usar bulk_create), en otros motores con
+bulk_create. Con --fixture ARCHIVO escribe un fixture JSON para loaddata y no
+toca la base (los ids arrancan despues de los que ya hay en ella, para poder
+cargarlo en la misma base). Los nombres llevan --prefijo; si ya hay datos con
+ese prefijo no se genera nada.
+
+Los datos cuadran con verificar_ledger (StockResumen y VentaDiaria incluidos).
+
+USO
+    python manage.py generar_datos_sinteticos                        # dry-run: perfil y cantidades
+    python manage.py generar_datos_sinteticos --escala 10 --apply
+    python manage.py generar_datos_sinteticos --escala 100 --prefijo X100 --apply
+    python manage.py generar_datos_sinteticos --escala 100 --fixture sinteticos.json --apply
+    python manage.py generar_datos_sinteticos --desde ../backups/backup_railway_20260810_224557.sql
+"""
+import json
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.models import Factura, Proveedor
+from core.sintetico import (
+    PERFIL_BASE, EscritorFixture, ajustar_perfil, escalar, escribir_bulk, escribir_copy,
+    leer_volcado, sembrar,
+)
+
+
+def _volcados_por_defecto():
+    raiz = Path(settings.BASE_DIR)
+    candidatos = [raiz / 'backup_completo.json', raiz.parent / 'backup_completo.json']
+    candidatos += sorted((raiz.parent / 'backups').glob('*.sql'), reverse=True)
+    return [ruta for ruta in candidatos if ruta.exists()]
+
+
+def _media(frecuencias):
+    return sum(float(k) * v for k, v in frecuencias.items()) / max(1, sum(frecuencias.values()))
+
+
+class Command(BaseCommand):
+    help = "Genera datos sinteticos con la forma de produccion, a escala (dry-run por defecto)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', metavar='VOLCADO',
+                            help='Volcado del que ajustar el perfil (pg_dump .sql o dumpdata .json).')
+        parser.add_argument('--perfil-base', action='store_true',
+                            help='Usa PERFIL_BASE de core/sintetico.py sin leer volcados.')
+        parser.add_argument('--escala', type=float, default=10,
+                            help='Multiplica las cantidades del volcado (default 10).')
+        for nombre in PERFIL_BASE['cantidades']:
+            parser.add_argument(f'--{nombre}', type=int, help=f'Fija la cantidad de {nombre}.')
+        parser.add_argument('--dias', type=int, help='Dias que cubren los datos (default: los del volcado).')
+        parser.add_argument('--semilla', type=int, default=1)
+        parser.add_argument('--prefijo', default='SIN',
+                            help='Prefijo de nombres y numeros de factura (default SIN).')
+        parser.add_argument('--fixture', metavar='ARCHIVO',
+                            help='Escribe un fixture JSON en vez de la base.')
+        parser.add_argument('--sin-copy', action='store_true',
+                            help='En PostgreSQL, inserta con bulk_create en vez de COPY.')
+        parser.add_argument('--perfil-json', metavar='ARCHIVO',
+                            help='Guarda el perfil ajustado en ARCHIVO.')
+        parser.add_argument('--apply', action='store_true',
+                            help='Genera los datos. Sin este flag solo muestra el perfil y las cantidades.')
+
+    def _perfil(self, options):
+        if options['perfil_base']:
+            return 'PERFIL_BASE', PERFIL_BASE
+        rutas = [Path(options['desde'])] if options['desde'] else _volcados_por_defecto()
+        for ruta in rutas:
+            try:
+                return str(ruta), ajustar_perfil(leer_volcado(ruta))
+            except (OSError, ValueError) as e:
+                if options['desde']:
+                    raise CommandError(f"{ruta}: {e}")
+                self.stdout.write(self.style.WARNING(f"Se omite {ruta}: {e}"))
+        self.stdout.write(self.style.WARNING("Ningun volcado sirve: se usa PERFIL_BASE."))
+        return 'PERFIL_BASE', PERFIL_BASE
+
+    def handle(self, *args, **options):
+        fuente, perfil = self._perfil(options)
+        if options['dias']:
+            perfil = dict(perfil, dias=options['dias'])
+        cantidades = escalar(options['escala'], perfil)
+        for nombre in cantidades:
+            if options[nombre] is not None:
+                cantidades[nombre] = max(1, options[nombre])
+
+        estados = perfil['estados']
+        total_estados = sum(estados.values())
+        self.stdout.write(f"Perfil: {fuente}")
+        self.stdout.write(
+            f"  lineas/factura {_media(perfil['lineas_por_factura']):.2f}  "
+            f"unidades/lote {_media(perfil['unidades_por_lote']):.1f}  "
+            f"lineas/pedido {_media(perfil['lineas_por_pedido']):.2f}  "
+            f"unidades/linea {_media(perfil['unidades_por_linea']):.2f}")
+        self.stdout.write("  estados " + ", ".join(
+            f"{estado} {n / total_estados:.1%}" for estado, n in estados.items()))
+        self.stdout.write(
+            f"  sin pesar {perfil['sin_pesar']:.1%}  mermas/pedido {perfil['mermas_por_pedido']:.3f}  "
+            f"margen {perfil['margen']}  cortes {len(perfil['cortes'])}  dias {perfil['dias']}")
+        self.stdout.write("Cantidades: " + ", ".join(f"{k} {v}" for k, v in cantidades.items()))
+        self.stdout.write(
+            f"  ~{round(cantidades['facturas'] * _media(perfil['lineas_por_factura']))} lineas de factura, "
+            f"~{round(cantidades['pedidos'] * _media(perfil['lineas_por_pedido']))} lineas de pedido")
+        if options['perfil_json']:
+            with open(options['perfil_json'], 'w', encoding='utf-8') as archivo:
+                json.dump(perfil, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Perfil en {options['perfil_json']}")
+
+        if not options['apply']:
+            self.stdout.write(self.style.WARNING("DRY-RUN: no se genero nada. Repite con --apply."))
+            return
+
+        prefijo = options['prefijo']
+        if (Factura.objects.filter(numero_factura__startswith=f"{prefijo}-").exists()
+                or Proveedor.objects.filter(nombre__startswith=f"{prefijo} ").exists()):
+            raise CommandError(f"Ya hay datos con el prefijo '{prefijo}': usa otro --prefijo.")
+
+        t0 = time.perf_counter()
+        if options['fixture']:
+            with open(options['fixture'], 'w', encoding='utf-8') as archivo:
+                escritor = EscritorFixture(archivo)
+                filas = sembrar(cantidades, perfil=perfil, semilla=options['semilla'], prefijo=prefijo,
+                                escribir=escritor, en_base=False)
+                escritor.cerrar()
+            destino, metodo = options['fixture'], 'fixture'
+        else:
+            copy = connection.vendor == 'postgresql' and not options['sin_copy']
+            with transaction.atomic():
+                filas = sembrar(cantidades, perfil=perfil, semilla=options['semilla'], prefijo=prefijo,
+                                escribir=escribir_copy if copy else escribir_bulk)
+            destino, metodo = f"la base ({connection.vendor})", 'COPY' if copy else 'bulk_create'
+        segundos = time.perf_counter() - t0
+
+        total = sum(filas.values())
+        for tabla, n in filas.items():
+            self.stdout.write(f"  {tabla:<32}{n:>12}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} filas en {destino} con {metodo}, {segundos:.1f}s ({total / max(segundos, 1e-9):.0f} filas/s)."))
+        if options['fixture']:
+            self.stdout.write(f"Cargar con: python manage.py loaddata {options['fixture']}")
@@ -0,0 +1,56 @@
+"""Genera las miniaturas que faltan de recibos y comprobantes.
+
+Las miniaturas se generan en segundo plano al subir cada foto (ver
+core/imagenes.py). Este comando cubre lo que ese worker no alcanzo a hacer:
+fotos anteriores al worker, trabajos perdidos porque el proceso se reinicio
+con la cola llena, o un cambio de MINIATURA_LADO (--todas).
+
+Por cada foto: miniatura WebP sin metadatos y el original reescrito sin EXIF.
+Corre en el proceso actual, una foto a la vez; una foto que falla (archivo
+borrado, formato que Pillow no abre) se informa y no frena a las demas.
+
+USO
+    python manage.py procesar_imagenes                 # dry-run: cuenta pendientes
+    python manage.py procesar_imagenes --apply
+    python manage.py procesar_imagenes --todas --apply # regenera todas
+"""
+from django.core.management.base import BaseCommand
+
+from core.imagenes import IMAGENES, pendientes, procesar_imagen
+
+
+class Command(BaseCommand):
+    help = "Genera las miniaturas faltantes de recibos y comprobantes (dry-run por defecto)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--apply', action='store_true',
+            help='Procesa las fotos. Sin este flag solo cuenta las pendientes.',
+        )
+        parser.add_argument(
+            '--todas', action='store_true',
+            help='Regenera tambien las que ya tienen miniatura.',
+        )
+
+    def handle(self, *args, **options):
+        procesadas = fallidas = 0
+        for modelo in IMAGENES:
+            filas = pendientes(modelo, todas=options['todas'])
+            self.stdout.write(f"{modelo.__name__}: {filas.count()} pendientes")
+            if not options['apply']:
+                continue
+            for instancia in filas.iterator():
+                try:
+                    procesar_imagen(instancia)
+                    procesadas += 1
+                except Exception as e:
+                    fallidas += 1
+                    self.stdout.write(self.style.ERROR(
+                        f"  {modelo.__name__} {instancia.pk}: {e}"))
+
+        if not options['apply']:
+            self.stdout.write(self.style.WARNING(
+                "DRY-RUN: no se proceso nada. Repite con --apply."))
+            return
+        estilo = self.style.SUCCESS if not fallidas else self.style.WARNING
+        self.stdout.write(estilo(f"Procesadas: {procesadas}  con error: {fallidas}"))
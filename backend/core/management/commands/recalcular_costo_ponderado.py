@@ -4,7 +4,9 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 
 from core.models import DetallePedido
-from core.utils import costo_por_kilo_ponderado
+from core.utils import actualizar_venta_diaria, bloquear_ledger, costos_por_kilo_ponderados
+
+LOTE = 2000
 
 
 class Command(BaseCommand):
@@ -20,6 +22,10 @@ class Command(BaseCommand):
     cuadra exacto con total_costo.
 
     Solo toca lineas con al menos una factura vinculada; el resto queda intacto.
+
+    Trabaja por lotes de lineas: una consulta de costos por lote
+    (costos_por_kilo_ponderados) y un bulk_update de las que cambian, asi que
+    recorrer toda la historia no hace consultas por linea.
     """
 
     help = "Recalcula costo_por_kilo como promedio ponderado de los lotes (modelo robusto)."
@@ -39,29 +45,48 @@ class Command(BaseCommand):
         actualizadas = 0
         sin_factura = 0
 
-        for detalle in qs:
-            cpk = costo_por_kilo_ponderado(detalle)
-            if cpk is None:
-                sin_factura += 1
-                continue
-
-            cpk = cpk.quantize(Decimal("0.01"))
-            if cpk == detalle.costo_por_kilo:
-                continue
-
-            total_nuevo = (Decimal(str(detalle.cantidad_kilos or 0)) * cpk).quantize(Decimal("0.01"))
-            self.stdout.write(
-                f"Pedido #{detalle.pedido_id} / {detalle.producto.nombre}: "
-                f"costo/kg {detalle.costo_por_kilo} -> {cpk} | "
-                f"total_costo {detalle.total_costo} -> {total_nuevo}"
-            )
-
-            if not dry_run:
+        # Ids primero y lineas por tramos: no se escribe la tabla con un
+        # cursor abierto sobre ella.
+        ids = list(qs.order_by("id").values_list("id", flat=True))
+        for inicio in range(0, len(ids), LOTE):
+            lote = list(qs.filter(id__in=ids[inicio:inicio + LOTE]).order_by("id"))
+            costos = costos_por_kilo_ponderados(ids[inicio:inicio + LOTE])
+            cambiadas = []
+
+            for detalle in lote:
+                cpk = costos.get(detalle.id)
+                if cpk is None:
+                    sin_factura += 1
+                    continue
+
+                cpk = cpk.quantize(Decimal("0.01"))
+                if cpk == detalle.costo_por_kilo:
+                    continue
+
+                total_nuevo = (Decimal(str(detalle.cantidad_kilos or 0)) * cpk).quantize(Decimal("0.01"))
+                self.stdout.write(
+                    f"Pedido #{detalle.pedido_id} / {detalle.producto.nombre}: "
+                    f"costo/kg {detalle.costo_por_kilo} -> {cpk} | "
+                    f"total_costo {detalle.total_costo} -> {total_nuevo}"
+                )
+
+                detalle.costo_por_kilo = cpk
+                detalle.derivar_totales()  # total_costo = costo/kg * kilos, como save()
+                cambiadas.append(detalle)
+
+            if cambiadas and not dry_run:
                 with transaction.atomic():
-                    detalle.costo_por_kilo = cpk
-                    detalle.save()  # deriva total_costo = costo/kg * kilos
-
-            actualizadas += 1
+                    # El costo entra en VentaDiaria: se recalculan sus claves
+                    # bajo el candado de los productos, como en las vistas.
+                    bloquear_ledger(d.producto_id for d in cambiadas)
+                    DetallePedido.objects.bulk_update(
+                        cambiadas, ["costo_por_kilo", "total_costo", "margen"]
+                    )
+                    actualizar_venta_diaria(
+                        (d.fecha, d.producto_id, d.pedido.vendedor_id) for d in cambiadas
+                    )
+
+            actualizadas += len(cambiadas)
 
         self.stdout.write(self.style.SUCCESS(
             f"{'[DRY-RUN] ' if dry_run else ''}Lineas actualizadas: {actualizadas}. "
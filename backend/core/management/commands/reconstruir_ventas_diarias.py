@@ -0,0 +1,105 @@
+"""Verifica y reconstruye el rollup VentaDiaria contra DetallePedido.
+
+VentaDiaria (ver models.py) es una foto: las sumas por (fecha, producto,
+vendedor) de las lineas de pedidos no anulados, recalculadas por clave en cada
+transaccion que toca esas lineas (actualizar_venta_diaria en utils.py). Si algo
+escribe DetallePedido sin pasar por ahi (una edicion en el admin, un script
+suelto) la foto queda desfasada y ReporteGananciasView reporta cifras viejas.
+
+QUE HACE
+Calcula las filas esperadas con filas_venta_diaria (la misma agregacion que
+usa el mantenimiento incremental), las compara clave por clave con las que hay
+guardadas y lista las diferencias: claves faltantes, sobrantes y con montos
+distintos. Con --apply borra las filas del rango y las reinserta en UNA
+transaccion.
+
+USO
+    python manage.py reconstruir_ventas_diarias                  # dry-run
+    python manage.py reconstruir_ventas_diarias --apply
+    python manage.py reconstruir_ventas_diarias --desde 2025-01-01 --hasta 2025-03-31 --apply
+"""
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from core.models import DetallePedido, VentaDiaria
+from core.utils import filas_venta_diaria
+
+CAMPOS = ('ventas', 'costo', 'kilos')
+
+
+def _clave(fila):
+    return (fila.fecha, fila.producto_id, fila.vendedor_id)
+
+
+class Command(BaseCommand):
+    help = "Compara VentaDiaria con DetallePedido y, con --apply, la reconstruye (dry-run por defecto)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--apply', action='store_true',
+            help='Escribe los cambios. Sin este flag solo muestra las diferencias.',
+        )
+        parser.add_argument('--desde', default=None, help='Fecha de venta inicial (YYYY-MM-DD).')
+        parser.add_argument('--hasta', default=None, help='Fecha de venta final (YYYY-MM-DD).')
+
+    def handle(self, *args, **options):
+        rango = {}
+        for opcion, lookup in (('desde', 'fecha__gte'), ('hasta', 'fecha__lte')):
+            if options[opcion]:
+                fecha = parse_date(options[opcion])
+                if fecha is None:
+                    raise CommandError(f"--{opcion} invalida: {options[opcion]} (usar YYYY-MM-DD).")
+                rango[lookup] = fecha
+
+        with transaction.atomic():
+            esperadas = {_clave(f): f for f in filas_venta_diaria(DetallePedido.objects.filter(**rango))}
+            guardadas = {}
+            duplicadas = 0
+            for fila in VentaDiaria.objects.filter(**rango):
+                if _clave(fila) in guardadas:
+                    duplicadas += 1
+                    continue
+                guardadas[_clave(fila)] = fila
+
+            faltantes = esperadas.keys() - guardadas.keys()
+            sobrantes = guardadas.keys() - esperadas.keys()
+            distintas = [
+                clave for clave in esperadas.keys() & guardadas.keys()
+                if any(Decimal(getattr(esperadas[clave], c)) != getattr(guardadas[clave], c)
+                       for c in CAMPOS)
+            ]
+
+            for clave in sorted(faltantes, key=str):
+                self.stdout.write(f"  falta   {clave}: " + self._montos(esperadas[clave]))
+            for clave in sorted(sobrantes, key=str):
+                self.stdout.write(f"  sobra   {clave}: " + self._montos(guardadas[clave]))
+            for clave in sorted(distintas, key=str):
+                self.stdout.write(
+                    f"  difiere {clave}: " + self._montos(guardadas[clave])
+                    + "  ->  " + self._montos(esperadas[clave]))
+
+            desfases = len(faltantes) + len(sobrantes) + len(distintas) + duplicadas
+            self.stdout.write(
+                f"\nClaves esperadas: {len(esperadas)}  guardadas: {len(guardadas)}  "
+                f"faltantes: {len(faltantes)}  sobrantes: {len(sobrantes)}  "
+                f"distintas: {len(distintas)}  duplicadas: {duplicadas}")
+
+            if not desfases:
+                self.stdout.write(self.style.SUCCESS("VentaDiaria cuadra con DetallePedido."))
+                return
+            if not options['apply']:
+                self.stdout.write(self.style.WARNING(
+                    "DRY-RUN: no se escribio nada. Repite con --apply."))
+                return
+
+            VentaDiaria.objects.filter(**rango).delete()
+            VentaDiaria.objects.bulk_create(esperadas.values(), batch_size=2000)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"VentaDiaria reconstruida: {len(esperadas)} filas."))
+
+    def _montos(self, fila):
+        return "  ".join(f"{c}={getattr(fila, c)}" for c in CAMPOS)
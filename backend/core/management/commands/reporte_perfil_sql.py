@@ -0,0 +1,170 @@
+"""Resume el log del perfil de SQL (core/perfil_sql.py) en un ranking de
+endpoints calientes y sospechosos de N+1. Solo lee.
+
+Lee las lineas JSON que escribe PerfilSQLMiddleware, del archivo
+PERFIL_SQL_ARCHIVO o de un log de gunicorn/Railway copiado tal cual: se
+saltean las lineas que no son del perfil y lo que venga antes del JSON (fecha,
+nivel). Recordar que solo se loguean los requests que pasaron el umbral: las
+cuentas son de requests lentos, no del trafico total.
+
+ENDPOINTS CALIENTES
+Por metodo y ruta (la de urls.py, no el path con ids): requests, ms p50, p95 y
+maximo, consultas y db_ms promedio y ms TOTAL. Se ordena por ms total
+(frecuencia por latencia: lo que mas tiempo de servidor se lleva), o con
+--orden por p95 o consultas.
+
+SOSPECHOSOS DE N+1
+Por ruta y huella de consulta: en cuantos requests aparecio repetida, las
+veces por request (promedio y maximo) y el tiempo. Una misma consulta que
+corre decenas de veces por request es casi siempre un select_related o
+prefetch_related que falta. Se listan las que repiten al menos --min-veces.
+
+USO
+    python manage.py reporte_perfil_sql /var/log/perfil_sql.log
+    railway logs | python manage.py reporte_perfil_sql -
+    python manage.py reporte_perfil_sql perfil.log --orden p95 --top 10 --json reporte.json
+"""
+import json
+import sys
+from statistics import median
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.perfil_sql import EVENTO
+
+ORDENES = {
+    'total': lambda e: e['ms_total'],
+    'p95': lambda e: e['ms_p95'],
+    'consultas': lambda e: e['consultas_prom'],
+}
+
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+
+def leer_eventos(lineas):
+    """Eventos del perfil en ``lineas``; devuelve (eventos, lineas que
+    parecian del perfil pero no se pudieron leer)."""
+    eventos, rotas = [], 0
+    marca = f'"evento": "{EVENTO}"'
+    for linea in lineas:
+        if marca not in linea:
+            continue
+        try:
+            evento = json.loads(linea[linea.index('{'):])
+        except ValueError:
+            rotas += 1
+            continue
+        if evento.get('evento') == EVENTO:
+            eventos.append(evento)
+    return eventos, rotas
+
+
+def resumir(eventos, min_veces):
+    endpoints, sospechosos = {}, {}
+    for e in eventos:
+        clave = (e['metodo'], e['ruta'])
+        endpoints.setdefault(clave, []).append(e)
+        for r in e.get('repetidas', []):
+            if r['veces'] >= min_veces:
+                sospechosos.setdefault(clave + (r['huella'],), []).append(r)
+
+    filas_endpoints = []
+    for (metodo, ruta), lista in endpoints.items():
+        ms = [e['ms'] for e in lista]
+        filas_endpoints.append({
+            'metodo': metodo,
+            'ruta': ruta,
+            'requests': len(lista),
+            'ms_p50': round(median(ms), 1),
+            'ms_p95': round(_percentil(ms, 95), 1),
+            'ms_max': round(max(ms), 1),
+            'ms_total': round(sum(ms), 1),
+            'db_prom': round(sum(e['db_ms'] for e in lista) / len(lista), 1),
+            'consultas_prom': round(sum(e['consultas'] for e in lista) / len(lista), 1),
+            'consultas_max': max(e['consultas'] for e in lista),
+            'status': sorted({e['status'] for e in lista}),
+        })
+
+    filas_sospechosos = []
+    for (metodo, ruta, clave), lista in sospechosos.items():
+        filas_sospechosos.append({
+            'metodo': metodo,
+            'ruta': ruta,
+            'huella': clave,
+            'requests': len(lista),
+            'veces_prom': round(sum(r['veces'] for r in lista) / len(lista), 1),
+            'veces_max': max(r['veces'] for r in lista),
+            'ms_total': round(sum(r['ms'] for r in lista), 1),
+            'sql': lista[-1]['sql'],
+        })
+    filas_sospechosos.sort(key=lambda s: (-s['requests'] * s['veces_prom'], -s['ms_total']))
+    return filas_endpoints, filas_sospechosos
+
+
+class Command(BaseCommand):
+    help = "Ranking de endpoints lentos y sospechosos de N+1 a partir del log de perfil_sql."
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivos', nargs='+', metavar='ARCHIVO',
+                            help="Logs a leer ('-' = stdin).")
+        parser.add_argument('--orden', choices=sorted(ORDENES), default='total',
+                            help='Orden de los endpoints (default total).')
+        parser.add_argument('--top', type=int, default=15,
+                            help='Filas de cada ranking (default 15).')
+        parser.add_argument('--min-veces', type=int, default=5,
+                            help='Repeticiones por request para sospechar un N+1 (default 5).')
+        parser.add_argument('--json', default=None, metavar='ARCHIVO',
+                            help="Escribe el reporte en JSON en ARCHIVO ('-' = stdout).")
+
+    def handle(self, *args, **options):
+        eventos, rotas = [], 0
+        for nombre in options['archivos']:
+            try:
+                if nombre == '-':
+                    leidos, malas = leer_eventos(sys.stdin)
+                else:
+                    with open(nombre, encoding='utf-8', errors='replace') as archivo:
+                        leidos, malas = leer_eventos(archivo)
+            except OSError as e:
+                raise CommandError(f"{nombre}: {e}")
+            eventos += leidos
+            rotas += malas
+        if rotas:
+            self.stdout.write(self.style.WARNING(f"{rotas} lineas del perfil no se pudieron leer."))
+        if not eventos:
+            raise CommandError("No hay lineas del perfil de SQL en los archivos.")
+
+        endpoints, sospechosos = resumir(eventos, options['min_veces'])
+        endpoints.sort(key=ORDENES[options['orden']], reverse=True)
+        top = options['top']
+
+        if options['json']:
+            reporte = {'requests': len(eventos), 'endpoints': endpoints, 'sospechosos_n_mas_1': sospechosos}
+            texto = json.dumps(reporte, indent=2, ensure_ascii=False)
+            if options['json'] == '-':
+                self.stdout.write(texto)
+                return
+            with open(options['json'], 'w', encoding='utf-8') as archivo:
+                archivo.write(texto)
+
+        self.stdout.write(f"{len(eventos)} requests sobre el umbral, {len(endpoints)} endpoints.")
+        self.stdout.write(f"\nENDPOINTS CALIENTES (por {options['orden']})")
+        self.stdout.write(f"{'endpoint':<58}{'req':>6}{'p50':>9}{'p95':>9}{'max':>9}"
+                          f"{'total s':>9}{'db':>8}{'cons':>7}{'max':>6}")
+        for e in endpoints[:top]:
+            self.stdout.write(
+                f"{(e['metodo'] + ' ' + e['ruta'])[:57]:<58}{e['requests']:>6}{e['ms_p50']:>9.1f}"
+                f"{e['ms_p95']:>9.1f}{e['ms_max']:>9.1f}{e['ms_total'] / 1000:>9.1f}{e['db_prom']:>8.1f}"
+                f"{e['consultas_prom']:>7.1f}{e['consultas_max']:>6}")
+
+        self.stdout.write(f"\nSOSPECHOSOS DE N+1 (misma consulta {options['min_veces']}+ veces por request)")
+        if not sospechosos:
+            self.stdout.write("  ninguno")
+        for s in sospechosos[:top]:
+            self.stdout.write(
+                f"{s['metodo']} {s['ruta']}  [{s['huella']}]  {s['requests']} requests, "
+                f"{s['veces_prom']:.1f} veces/request (max {s['veces_max']}), {s['ms_total']:.1f} ms")
+            self.stdout.write(f"    {s['sql'][:200]}")
@@ -30,6 +30,11 @@ USO
     python manage.py resincronizar_ledger_stock              # dry-run
     python manage.py resincronizar_ledger_stock --apply      # escribe
     python manage.py resincronizar_ledger_stock --producto 2 --apply
+    python manage.py resincronizar_ledger_stock --resumen [--apply]
+
+Cualquier escritura de este comando recalcula tambien la fila StockResumen del
+producto tocado. --resumen no toca el ledger: solo verifica StockResumen contra
+el y, con --apply, lo reconstruye (ver _handle_resumen).
 """
 from decimal import Decimal
 
@@ -39,7 +44,9 @@ from django.db.models import Sum
 
 from core.models import (
     Producto, DetalleFactura, DetallePedido, EntradaProducto, FacturaDetallePedido,
+    StockResumen,
 )
+from core.utils import actualizar_stock_resumen, calcular_stock
 
 
 def _sum(qs, campo):
@@ -66,11 +73,17 @@ class Command(BaseCommand):
             '--faltantes', action='store_true',
             help='Repone unidades que faltan en el ledger (ver _handle_faltantes).',
         )
+        parser.add_argument(
+            '--resumen', action='store_true',
+            help='Verifica/reconstruye StockResumen contra el ledger (ver _handle_resumen).',
+        )
 
     def handle(self, *args, **options):
         aplicar = options['apply']
         producto_id = options['producto']
 
+        if options['resumen']:
+            return self._handle_resumen(aplicar, producto_id)
         if options['faltantes']:
             return self._handle_faltantes(aplicar, producto_id)
         if options['kilos']:
@@ -133,6 +146,7 @@ class Command(BaseCommand):
             if aplicar:
                 with transaction.atomic():
                     self._recortar_fifo(p, recorte, verbose=True)
+                    actualizar_stock_resumen([p.id])
                 nuevo = int(_sum(EntradaProducto.objects.filter(producto=p),
                                  'cantidad_unidades'))
                 self.stdout.write(self.style.SUCCESS(
@@ -152,6 +166,55 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING(
                 "\nDRY-RUN: no se escribio nada. Repite con --apply."))
 
+    def _handle_resumen(self, aplicar, producto_id):
+        """Verifica StockResumen (lo que muestra StockProductos) contra el
+        ledger y, con --apply, reconstruye la tabla entera.
+
+        El ledger es la verdad; StockResumen es solo una foto que se recalcula
+        en cada transaccion que mueve stock. Si diverge es porque algo escribio
+        el ledger sin pasar por actualizar_stock_resumen (una edicion manual en
+        el admin, un script suelto): este modo lo detecta y lo repara.
+        """
+        productos = Producto.objects.order_by('nombre')
+        if producto_id:
+            productos = productos.filter(id=producto_id)
+        productos = list(productos)
+
+        esperado = calcular_stock(p.id for p in productos)
+        fotos = {
+            r.producto_id: r
+            for r in StockResumen.objects.filter(producto__in=productos)
+        }
+
+        diferencias = []
+        for p in productos:
+            real = esperado[p.id]
+            foto = fotos.get(p.id)
+            actual = {
+                campo: getattr(foto, campo) if foto else None for campo in real
+            }
+            if any(actual[c] is None or Decimal(actual[c]) != Decimal(real[c]) for c in real):
+                diferencias.append(p)
+                self.stdout.write(
+                    f"{p.nombre} (id={p.id})  "
+                    + "  ".join(f"{c}: {actual[c]} -> {real[c]}" for c in real))
+
+        if not diferencias:
+            self.stdout.write(self.style.SUCCESS(
+                f"StockResumen cuadra con el ledger ({len(productos)} productos)."))
+            return
+
+        self.stdout.write(f"\nProductos con foto desfasada: {len(diferencias)}")
+        if not aplicar:
+            self.stdout.write(self.style.WARNING(
+                "DRY-RUN: no se escribio nada. Repite con --apply."))
+            return
+
+        with transaction.atomic():
+            actualizar_stock_resumen(p.id for p in productos)
+        self.stdout.write(self.style.SUCCESS(
+            f"StockResumen reconstruido para {len(productos)} productos."))
+
     def _handle_faltantes(self, aplicar, producto_id):
         """Repone en el ledger las unidades compradas que se perdieron.
 
@@ -263,6 +326,7 @@ class Command(BaseCommand):
                                 costo_por_kilo=d.costo_por_kilo,
                                 fecha_entrada=fecha,
                             )
+                        actualizar_stock_resumen([p.id])
 
         self.stdout.write("\n" + "=" * 60)
         self.stdout.write(f"Unidades repuestas: {total_repuesto}")
@@ -328,6 +392,7 @@ class Command(BaseCommand):
                 if aplicar:
                     with transaction.atomic():
                         self._recortar_kilos_fifo(lotes, sobra)
+                        actualizar_stock_resumen([p.id])
             else:
                 faltan = objetivo - actual
                 total_un = sum(int(l.cantidad_unidades or 0) for l in lotes)
@@ -346,6 +411,7 @@ class Command(BaseCommand):
                             lote.cantidad_kilos = (
                                 Decimal(str(lote.cantidad_kilos)) + extra)
                             lote.save()
+                        actualizar_stock_resumen([p.id])
 
             if aplicar:
                 nuevo = Decimal(str(_sum(
@@ -0,0 +1,286 @@
+"""Verifica los invariantes del ledger de stock. Solo lee.
+
+Reemplaza a los scripts sueltos de auditoria (audit_desfase.py,
+audit_corrupcion.py, auditar_links.py, reconciliar_stock.py...) y al recorrido
+producto por producto de resincronizar_ledger_stock: cada invariante se
+calcula con UNA consulta agrupada por producto (o por linea), asi que el costo
+no crece con la cantidad de consultas sino con el tamano de las tablas.
+
+INVARIANTES
+  unidades  Sum(EntradaProducto.cantidad_unidades) de cada producto debe ser
+              comprado  Sum(DetalleFactura.cantidad_unidades)
+            - vendido   Sum(DetallePedido.cantidad_unidades de pedidos no anulados)
+            - mermas    Sum(AjusteInventario.cantidad_unidades negativos)
+            (los ajustes positivos no mueven el ledger, ver
+            CrearAjusteInventario). Tambien cuenta lotes con unidades o
+            kilos negativos.
+  kilos     lo mismo en kilos: la deriva entre el ledger y
+            comprado - vendido - mermas. Los recortes proporcionales redondean
+            cada lote a 0.01 kg, asi que se tolera --tolerancia-kg.
+  vinculos  cada linea de un pedido no anulado debe tener tantas unidades
+            atribuidas a facturas (FacturaDetallePedido) como unidades vendidas.
+  resumen   la foto StockResumen debe coincidir con el ledger (calcular_stock);
+            sin fila cuenta como cero, igual que en StockProductos.
+
+PARALELISMO
+Cada verificacion corre en una transaccion REPEATABLE READ de solo lectura
+(en PostgreSQL), asi que todas sus consultas ven la misma foto de la base.
+Con --procesos N los productos se reparten en N grupos y cada grupo se verifica
+en un proceso aparte (fork) con su propia conexion y su propia foto; en
+PostgreSQL las consultas de los grupos corren en paralelo. Si hay ventas
+mientras corre, dos grupos pueden ver momentos distintos: conviene correrlo de
+noche o repetir antes de corregir.
+
+REPORTE
+Imprime las diferencias y un resumen. Con --json ARCHIVO (o --json - para
+stdout) escribe el reporte completo en JSON para que lo lea un cron o un
+monitor. Con --estricto termina con error si encuentra diferencias.
+
+USO
+    python manage.py verificar_ledger
+    python manage.py verificar_ledger --procesos 4 --json /var/log/meets/ledger.json
+    python manage.py verificar_ledger --producto 2 --producto 7 --estricto
+"""
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import (
+    AjusteInventario, DetalleFactura, DetallePedido, EntradaProducto,
+    FacturaDetallePedido, Producto, StockResumen,
+)
+from core.utils import calcular_stock
+
+INVARIANTES = ('unidades', 'kilos', 'vinculos', 'resumen')
+
+CERO = Decimal('0')
+
+
+def _por_producto(qs, ids, **agregados):
+    if ids is not None:
+        qs = qs.filter(producto_id__in=ids)
+    return {
+        fila.pop('producto'): fila
+        for fila in qs.order_by().values('producto').annotate(**agregados)
+    }
+
+
+def verificar(ids, tolerancia_kg):
+    """Corre los invariantes sobre los productos ``ids`` (None = todos) y
+    devuelve ``{invariante: [diferencias]}``. Es la unidad de trabajo de cada
+    proceso, asi que solo devuelve tipos simples."""
+    productos = Producto.objects.order_by('id')
+    if ids is not None:
+        productos = productos.filter(id__in=ids)
+    nombres = dict(productos.values_list('id', 'nombre'))
+    no_anulados = DetallePedido.objects.exclude(pedido__estado="Anulado")
+
+    comprado = _por_producto(DetalleFactura.objects.all(), ids,
+                             u=Sum('cantidad_unidades'), k=Sum('cantidad_kilos'))
+    vendido = _por_producto(no_anulados, ids,
+                            u=Sum('cantidad_unidades'), k=Sum('cantidad_kilos'))
+    mermas = _por_producto(
+        AjusteInventario.objects.filter(Q(cantidad_unidades__lt=0) | Q(cantidad__lt=0)), ids,
+        u=Sum('cantidad_unidades', filter=Q(cantidad_unidades__lt=0)),
+        k=Sum('cantidad', filter=Q(cantidad__lt=0)),
+    )
+    ledger = _por_producto(
+        EntradaProducto.objects.all(), ids,
+        u=Sum('cantidad_unidades'), k=Sum('cantidad_kilos'),
+        negativos=Count('id', filter=Q(cantidad_unidades__lt=0) | Q(cantidad_kilos__lt=0)),
+    )
+
+    def _valor(tabla, pid, campo):
+        return Decimal((tabla.get(pid) or {}).get(campo) or 0)
+
+    resultado = {nombre: [] for nombre in INVARIANTES}
+    for pid in sorted(nombres):
+        for campo, invariante in (('u', 'unidades'), ('k', 'kilos')):
+            c, v, m = (_valor(t, pid, campo) for t in (comprado, vendido, mermas))
+            objetivo = c - v + m
+            actual = _valor(ledger, pid, campo)
+            negativos = (ledger.get(pid) or {}).get('negativos') or 0
+            tolerancia = tolerancia_kg if campo == 'k' else CERO
+            if abs(actual - objetivo) > tolerancia or (campo == 'u' and negativos):
+                resultado[invariante].append({
+                    'producto_id': pid, 'producto': nombres[pid],
+                    'comprado': c, 'vendido': v, 'mermas': -m,
+                    'objetivo': objetivo, 'ledger': actual,
+                    'diferencia': actual - objetivo,
+                    **({'lotes_negativos': negativos} if campo == 'u' else {}),
+                })
+
+    # Unidades atribuidas por linea con una subconsulta y no con un join, para
+    # que la suma no se multiplique.
+    vinculadas = (
+        FacturaDetallePedido.objects.filter(detallepedido=OuterRef('pk'))
+        .order_by().values('detallepedido').annotate(t=Sum('cantidad_unidades')).values('t')
+    )
+    lineas = no_anulados.filter(producto_id__in=list(nombres)) if ids is not None else no_anulados
+    lineas = (
+        lineas.annotate(vinculadas=Coalesce(Subquery(vinculadas, output_field=IntegerField()), 0))
+        .exclude(vinculadas=Coalesce('cantidad_unidades', 0))
+        .order_by('id')
+        .values('id', 'pedido_id', 'producto_id', 'cantidad_unidades', 'vinculadas')
+    )
+    for linea in lineas:
+        unidades = Decimal(linea['cantidad_unidades'] or 0)
+        resultado['vinculos'].append({
+            'detalle_id': linea['id'], 'pedido_id': linea['pedido_id'],
+            'producto_id': linea['producto_id'],
+            'unidades_linea': unidades, 'unidades_vinculadas': linea['vinculadas'],
+            'diferencia': linea['vinculadas'] - unidades,
+        })
+
+    esperado = calcular_stock(nombres)
+    fotos = {r.producto_id: r for r in StockResumen.objects.filter(producto_id__in=list(nombres))}
+    for pid, real in sorted(esperado.items()):
+        foto = fotos.get(pid)
+        # Un producto sin movimientos no tiene fila y StockProductos lo
+        # muestra en cero: solo es diferencia si el ledger no esta en cero.
+        distintos = {
+            campo: {'foto': getattr(foto, campo) if foto else None, 'ledger': valor}
+            for campo, valor in real.items()
+            if Decimal(getattr(foto, campo) if foto else 0) != Decimal(valor)
+        }
+        if distintos:
+            resultado['resumen'].append({'producto_id': pid, 'producto': nombres[pid], **distintos})
+    return resultado
+
+
+def _verificar_consistente(ids, tolerancia_kg):
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Todas las consultas ven la misma foto de la base.
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+        return verificar(ids, tolerancia_kg)
+
+
+def _verificar_en_proceso(ids, tolerancia_kg):
+    try:
+        return _verificar_consistente(ids, tolerancia_kg)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Verifica los invariantes del ledger de stock con consultas agrupadas (solo lee)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--producto', type=int, action='append', default=None,
+                            help='Limita la verificacion a este id de producto (repetible).')
+        parser.add_argument('--procesos', type=int, default=1,
+                            help='Reparte los productos en N procesos (default 1).')
+        parser.add_argument('--tolerancia-kg', default='0.05',
+                            help='Deriva de kilos por producto que se tolera (default 0.05).')
+        parser.add_argument('--json', default=None, metavar='ARCHIVO',
+                            help="Escribe el reporte en JSON en ARCHIVO ('-' = stdout).")
+        parser.add_argument('--estricto', action='store_true',
+                            help='Termina con error si hay diferencias.')
+
+    def handle(self, *args, **options):
+        try:
+            tolerancia_kg = Decimal(options['tolerancia_kg'])
+        except Exception:
+            raise CommandError(f"--tolerancia-kg invalida: {options['tolerancia_kg']}")
+        procesos = max(1, options['procesos'])
+        ids = options['producto']
+
+        inicio = time.monotonic()
+        if procesos == 1:
+            resultado = _verificar_consistente(ids, tolerancia_kg)
+            n_productos = len(ids) if ids else Producto.objects.count()
+        else:
+            resultado, n_productos = self._en_paralelo(ids, procesos, tolerancia_kg)
+        duracion = time.monotonic() - inicio
+
+        totales = {nombre: len(resultado[nombre]) for nombre in INVARIANTES}
+        reporte = {
+            'generado': timezone.now(),
+            'base': connection.vendor,
+            'productos': n_productos,
+            'procesos': procesos,
+            'tolerancia_kg': tolerancia_kg,
+            'duracion_s': round(duracion, 3),
+            'ok': not any(totales.values()),
+            'totales': totales,
+            **resultado,
+        }
+
+        if options['json'] == '-':
+            self.stdout.write(json.dumps(reporte, cls=DjangoJSONEncoder, indent=2))
+        else:
+            self._imprimir(reporte)
+            if options['json']:
+                with open(options['json'], 'w', encoding='utf-8') as archivo:
+                    json.dump(reporte, archivo, cls=DjangoJSONEncoder, indent=2)
+                self.stdout.write(f"Reporte JSON en {options['json']}")
+
+        if options['estricto'] and not reporte['ok']:
+            raise CommandError(
+                "Ledger con diferencias: "
+                + ", ".join(f"{k}={v}" for k, v in totales.items() if v))
+
+    def _en_paralelo(self, ids, procesos, tolerancia_kg):
+        if ids is None:
+            ids = list(Producto.objects.order_by('id').values_list('id', flat=True))
+        grupos = [ids[i::procesos] for i in range(procesos) if ids[i::procesos]]
+        # fork: los hijos heredan Django ya configurado. Se cierran antes las
+        # conexiones para que ningun hijo reuse el socket del padre.
+        connections.close_all()
+        contexto = multiprocessing.get_context('fork')
+        resultado = {nombre: [] for nombre in INVARIANTES}
+        with ProcessPoolExecutor(max_workers=len(grupos), mp_context=contexto) as pool:
+            for parcial in pool.map(_verificar_en_proceso, grupos, [tolerancia_kg] * len(grupos)):
+                for nombre in INVARIANTES:
+                    resultado[nombre].extend(parcial[nombre])
+        for nombre in INVARIANTES:
+            clave = 'detalle_id' if nombre == 'vinculos' else 'producto_id'
+            resultado[nombre].sort(key=lambda fila: fila[clave])
+        return resultado, len(ids)
+
+    def _imprimir(self, reporte):
+        for fila in reporte['unidades']:
+            self.stdout.write(
+                f"  unidades  {fila['producto']} (id={fila['producto_id']}): "
+                f"comprado={fila['comprado']} vendido={fila['vendido']} mermas={fila['mermas']} "
+                f"objetivo={fila['objetivo']} ledger={fila['ledger']} "
+                f"diferencia={fila['diferencia']:+}  lotes negativos={fila['lotes_negativos']}")
+        for fila in reporte['kilos']:
+            self.stdout.write(
+                f"  kilos     {fila['producto']} (id={fila['producto_id']}): "
+                f"objetivo={fila['objetivo']} kg ledger={fila['ledger']} kg "
+                f"deriva={fila['diferencia']:+} kg")
+        for fila in reporte['vinculos']:
+            self.stdout.write(
+                f"  vinculos  linea {fila['detalle_id']} (pedido #{fila['pedido_id']}, "
+                f"producto {fila['producto_id']}): vendidas={fila['unidades_linea']} "
+                f"con factura={fila['unidades_vinculadas']}")
+        for fila in reporte['resumen']:
+            campos = "  ".join(
+                f"{c}: {v['foto']} -> {v['ledger']}"
+                for c, v in fila.items() if c not in ('producto_id', 'producto'))
+            self.stdout.write(f"  resumen   {fila['producto']} (id={fila['producto_id']}): {campos}")
+
+        totales = reporte['totales']
+        self.stdout.write(
+            f"\nProductos: {reporte['productos']}  procesos: {reporte['procesos']}  "
+            f"tiempo: {reporte['duracion_s']} s\n"
+            + "  ".join(f"{k}: {v}" for k, v in totales.items()))
+        if reporte['ok']:
+            self.stdout.write(self.style.SUCCESS("El ledger cuadra."))
+        else:
+            self.stdout.write(self.style.WARNING(
+                "Hay diferencias. Para corregirlas ver resincronizar_ledger_stock "
+                "(--kilos, --faltantes, --resumen), backfill_desfase_unidades y "
+                "reconstruir_ventas_diarias."))
@@ -0,0 +1,259 @@
+"""Metricas en formato de texto de Prometheus en /metrics, sin servicios
+externos.
+
+QUE SE MIDE
+  meets_http_request_duration_seconds   histograma por vista y metodo
+  meets_http_requests_total             requests por vista, metodo y status
+  meets_db_consultas_por_request        histograma de consultas por request
+  meets_fifo_lotes_leidos               histograma de lotes que lee cada
+                                        lectura FIFO (_lotes_fifo: una por
+                                        consumir_fifo/descontar_kilos_fifo y
+                                        una por producto en
+                                        consumir_fifo_pedido), por campo
+  meets_fifo_relecturas_total           veces que el prefijo FIFO no alcanzo y
+                                        se releyo el ledger entero
+  meets_kilos_faltantes_total           pesajes con faltante de kilos
+                                        (permitir_faltante=True) por producto
+  meets_kilos_faltantes_kg_total        kilos que faltaron, por producto
+  meets_lotes_vivos / meets_lotes_filas filas de EntradaProducto por producto
+                                        con stock / en total (se cuentan al
+                                        leer /metrics)
+  meets_reportes_cache_total            aciertos y fallos del cache de
+                                        reportes (estadisticas_cache)
+
+Los faltantes se cuentan al confirmarse la transaccion: un pedido que se
+revierte no deja deriva. Antes solo se veian corriendo
+resincronizar_ledger_stock --kilos; con esto se puede alertar sobre
+rate(meets_kilos_faltantes_kg_total[1h]) > 0 o sobre el p95 de
+meets_fifo_lotes_leidos.
+
+PROCESOS
+Los contadores e histogramas viven en la memoria de cada proceso y arrancan
+en cero al reiniciar (Prometheus lo trata como un reset). gunicorn corre con
+un worker (ver Dockerfile); con varios, cada lectura de /metrics ve solo el
+worker que la atiende.
+
+ACCESO Y COSTO
+Apagado por defecto. Con METRICAS=1 se instala el middleware y se monta
+/metrics, que pide ``Authorization: Bearer <METRICAS_TOKEN>``: expone nombres
+de productos, lotes, faltantes y trafico, asi que sin token configurado
+responde 404 y con uno equivocado 401. Apagado, /metrics no existe, el
+middleware no se instala y las funciones de registro no hacen nada; prendido
+cuesta un contador por consulta y un lock por observacion.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from .models import EntradaProducto, Producto
+from .reportes_cache import estadisticas_cache
+
+PREFIJO = 'meets_'
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+_candado = threading.Lock()
+REGISTRO = []
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _etiquetas(nombres, valores, extra=''):
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return '{' + ','.join(partes) + '}' if partes else ''
+
+
+def _numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    tipo = 'counter'
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = PREFIJO + nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.valores = {}
+        REGISTRO.append(self)
+
+    def sumar(self, *valores_etiquetas, valor=1):
+        with _candado:
+            self.valores[valores_etiquetas] = self.valores.get(valores_etiquetas, 0) + valor
+
+    def lineas(self):
+        with _candado:
+            valores = sorted(self.valores.items())
+        for etiquetas, valor in valores:
+            yield f'{self.nombre}{_etiquetas(self.etiquetas, etiquetas)} {_numero(valor)}'
+
+
+class Histograma:
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, limites, etiquetas=()):
+        self.nombre = PREFIJO + nombre
+        self.ayuda = ayuda
+        self.limites = tuple(limites)
+        self.etiquetas = tuple(etiquetas)
+        self.valores = {}  # etiquetas -> [conteo por limite..., +Inf, suma]
+        REGISTRO.append(self)
+
+    def observar(self, valor, *valores_etiquetas):
+        with _candado:
+            serie = self.valores.get(valores_etiquetas)
+            if serie is None:
+                serie = self.valores[valores_etiquetas] = [0] * (len(self.limites) + 2)
+            for i, limite in enumerate(self.limites):
+                if valor <= limite:
+                    serie[i] += 1
+                    break
+            else:
+                serie[-2] += 1
+            serie[-1] += valor
+
+    def lineas(self):
+        with _candado:
+            valores = sorted((k, list(v)) for k, v in self.valores.items())
+        for etiquetas, serie in valores:
+            acumulado = 0
+            for limite, conteo in zip(self.limites + (float('inf'),), serie):
+                acumulado += conteo
+                le = f'le="{_numero(limite)}"'
+                yield f'{self.nombre}_bucket{_etiquetas(self.etiquetas, etiquetas, le)} {acumulado}'
+            yield f'{self.nombre}_sum{_etiquetas(self.etiquetas, etiquetas)} {_numero(serie[-1])}'
+            yield f'{self.nombre}_count{_etiquetas(self.etiquetas, etiquetas)} {acumulado}'
+
+
+DURACION = Histograma(
+    'http_request_duration_seconds', 'Duracion de los requests por vista.',
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10), ('vista', 'metodo'))
+REQUESTS = Contador('http_requests_total', 'Requests por vista, metodo y status.', ('vista', 'metodo', 'status'))
+CONSULTAS = Histograma(
+    'db_consultas_por_request', 'Consultas SQL por request.',
+    (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000), ('vista', 'metodo'))
+LOTES_LEIDOS = Histograma(
+    'fifo_lotes_leidos', 'Lotes de EntradaProducto leidos por cada lectura FIFO.',
+    (1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000), ('campo',))
+RELECTURAS = Contador(
+    'fifo_relecturas_total', 'Lecturas FIFO cuyo prefijo no alcanzo y releyeron el ledger entero.', ('campo',))
+FALTANTES = Contador(
+    'kilos_faltantes_total', 'Pesajes que descontaron menos kilos de los vendidos (permitir_faltante).',
+    ('producto',))
+FALTANTES_KG = Contador(
+    'kilos_faltantes_kg_total', 'Kilos vendidos que el ledger no tenia (permitir_faltante).', ('producto',))
+
+
+def observar_lectura_fifo(campo, lotes, relectura):
+    """Registra una lectura de _lotes_fifo: cuantos lotes trajo y si tuvo
+    que releer el ledger entero."""
+    if not settings.METRICAS:
+        return
+    LOTES_LEIDOS.observar(lotes, campo)
+    if relectura:
+        RELECTURAS.sumar(campo)
+
+
+def registrar_faltante_kilos(producto, faltante):
+    """Registra un faltante de kilos de ``producto`` cuando se confirme la
+    transaccion en curso."""
+    if not settings.METRICAS or faltante <= 0:
+        return
+    faltante = float(faltante)
+
+    def sumar():
+        FALTANTES.sumar(producto.pk)
+        FALTANTES_KG.sumar(producto.pk, valor=faltante)
+    transaction.on_commit(sumar)
+
+
+class _ContadorConsultas:
+    def __init__(self):
+        self.consultas = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.consultas += 1
+        return execute(sql, params, many, context)
+
+
+class MetricasMiddleware:
+    def __init__(self, get_response):
+        if not settings.METRICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        contador = _ContadorConsultas()
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(contador):
+            respuesta = self.get_response(request)
+        duracion = time.perf_counter() - inicio
+        coincidencia = getattr(request, 'resolver_match', None)
+        # Las rutas que no existen van juntas: con el path de etiqueta un
+        # escaneo de URLs crearia una serie por URL.
+        vista = coincidencia.view_name if coincidencia is not None else 'sin_ruta'
+        DURACION.observar(duracion, vista, request.method)
+        CONSULTAS.observar(contador.consultas, vista, request.method)
+        REQUESTS.sumar(vista, request.method, respuesta.status_code)
+        return respuesta
+
+
+def _lineas_lotes():
+    nombres = dict(Producto.objects.values_list('id', 'nombre'))
+    filas = (
+        EntradaProducto.objects.values('producto_id')
+        .annotate(filas=Count('id'), vivos=Count('id', filter=Q(cantidad_unidades__gt=0) | Q(cantidad_kilos__gt=0)))
+        .order_by('producto_id')
+    )
+    vivos, totales = [], []
+    for fila in filas:
+        etiquetas = _etiquetas(('producto', 'nombre'), (fila['producto_id'], nombres.get(fila['producto_id'], '')))
+        vivos.append(f'{PREFIJO}lotes_vivos{etiquetas} {fila["vivos"]}')
+        totales.append(f'{PREFIJO}lotes_filas{etiquetas} {fila["filas"]}')
+    yield f'# HELP {PREFIJO}lotes_vivos Filas de EntradaProducto con unidades o kilos, por producto.'
+    yield f'# TYPE {PREFIJO}lotes_vivos gauge'
+    yield from vivos
+    yield f'# HELP {PREFIJO}lotes_filas Filas de EntradaProducto, por producto (incluye las 0/0).'
+    yield f'# TYPE {PREFIJO}lotes_filas gauge'
+    yield from totales
+
+
+def _lineas_reportes():
+    yield f'# HELP {PREFIJO}reportes_cache_total Aciertos y fallos del cache de reportes.'
+    yield f'# TYPE {PREFIJO}reportes_cache_total counter'
+    for reporte, cuentas in sorted(estadisticas_cache()['por_reporte'].items()):
+        for resultado in ('hits', 'misses'):
+            etiquetas = _etiquetas(('reporte', 'resultado'), (reporte, resultado))
+            yield f'{PREFIJO}reportes_cache_total{etiquetas} {cuentas[resultado]}'
+
+
+def exponer():
+    """Todas las metricas en formato de texto de Prometheus (0.0.4)."""
+    lineas = []
+    for metrica in REGISTRO:
+        lineas.append(f'# HELP {metrica.nombre} {metrica.ayuda}')
+        lineas.append(f'# TYPE {metrica.nombre} {metrica.tipo}')
+        lineas.extend(metrica.lineas())
+    lineas.extend(_lineas_lotes())
+    lineas.extend(_lineas_reportes())
+    return '\n'.join(lineas) + '\n'
+
+
+def vista_metricas(request):
+    token = settings.METRICAS_TOKEN
+    if not token:
+        raise Http404
+    if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse('No autorizado\n', status=401, content_type='text/plain; charset=utf-8')
+    return HttpResponse(exponer(), content_type=TIPO_CONTENIDO)
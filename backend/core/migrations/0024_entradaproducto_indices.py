@@ -0,0 +1,25 @@
+# Generated by Django 5.1.3 on 2026-10-17 17:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_alter_entradaproducto_fecha_entrada'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='entradaproducto',
+            index=models.Index(fields=['producto', 'fecha_entrada'], name='entrada_prod_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entradaproducto',
+            index=models.Index(condition=models.Q(('cantidad_unidades__gt', 0), ('cantidad_kilos__gt', 0), _connector='OR'), fields=['producto', 'fecha_entrada', 'id'], name='entrada_prod_vivos_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entradaproducto',
+            index=models.Index(fields=['factura', 'producto'], name='entrada_fact_prod_idx'),
+        ),
+    ]
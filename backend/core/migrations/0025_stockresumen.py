@@ -0,0 +1,59 @@
+# Generated by Django 5.1.3 on 2026-10-17 17:35
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def poblar_stock_resumen(apps, schema_editor):
+    """Primera foto de StockResumen desde el ledger, con el mismo criterio que
+    actualizar_stock_resumen (utils.py)."""
+    Producto = apps.get_model('core', 'Producto')
+    EntradaProducto = apps.get_model('core', 'EntradaProducto')
+    DetallePedido = apps.get_model('core', 'DetallePedido')
+    StockResumen = apps.get_model('core', 'StockResumen')
+
+    ledger = {
+        r['producto_id']: r
+        for r in EntradaProducto.objects.values('producto_id')
+        .annotate(u=Sum('cantidad_unidades'), k=Sum('cantidad_kilos'))
+    }
+    reservas = dict(
+        DetallePedido.objects.filter(cantidad_kilos=0)
+        .exclude(pedido__estado="Anulado")
+        .values('producto_id')
+        .annotate(u=Sum('cantidad_unidades'))
+        .values_list('producto_id', 'u')
+    )
+    StockResumen.objects.bulk_create([
+        StockResumen(
+            producto_id=pid,
+            disponibles=(ledger.get(pid) or {}).get('u') or 0,
+            kilos_actuales=(ledger.get(pid) or {}).get('k') or Decimal('0.00'),
+            reservas=reservas.get(pid) or Decimal('0.00'),
+        )
+        for pid in Producto.objects.values_list('id', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_entradaproducto_indices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockResumen',
+            fields=[
+                ('producto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock_resumen', serialize=False, to='core.producto')),
+                ('disponibles', models.IntegerField(default=0)),
+                ('kilos_actuales', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('reservas', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(poblar_stock_resumen, migrations.RunPython.noop),
+    ]
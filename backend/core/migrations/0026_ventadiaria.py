@@ -0,0 +1,60 @@
+# Generated by Django 5.1.3 on 2026-10-17 17:50
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+
+def poblar_ventas_diarias(apps, schema_editor):
+    """Primera carga de VentaDiaria desde DetallePedido, con el mismo
+    criterio que filas_venta_diaria (utils.py)."""
+    DetallePedido = apps.get_model('core', 'DetallePedido')
+    VentaDiaria = apps.get_model('core', 'VentaDiaria')
+
+    filas = (
+        DetallePedido.objects.exclude(pedido__estado="Anulado")
+        .values('fecha', 'producto_id', 'pedido__vendedor_id')
+        .annotate(
+            ventas=Coalesce(Sum('total_venta'), Decimal('0')),
+            costo=Coalesce(Sum('total_costo'), Decimal('0')),
+            kilos=Coalesce(Sum('cantidad_kilos'), Decimal('0')),
+        )
+        .order_by()
+    )
+    VentaDiaria.objects.bulk_create([
+        VentaDiaria(
+            fecha=r['fecha'], producto_id=r['producto_id'],
+            vendedor_id=r['pedido__vendedor_id'],
+            ventas=r['ventas'], costo=r['costo'], kilos=r['kilos'],
+        )
+        for r in filas
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_stockresumen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('ventas', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('costo', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('kilos', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ventas_diarias', to='core.producto')),
+                ('vendedor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ventas_diarias', to='core.vendedor')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['fecha', 'producto', 'vendedor'], name='venta_diaria_clave_idx')],
+            },
+        ),
+        migrations.RunPython(poblar_ventas_diarias, migrations.RunPython.noop),
+    ]
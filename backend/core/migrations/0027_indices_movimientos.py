@@ -0,0 +1,25 @@
+# Generated by Django 5.1.3 on 2026-10-17 18:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_ventadiaria'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='detallepedido',
+            index=models.Index(fields=['fecha', 'id'], name='detalle_pedido_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detallepedido',
+            index=models.Index(fields=['producto', 'fecha'], name='detalle_pedido_prod_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['fecha', 'numero_factura'], name='factura_fecha_idx'),
+        ),
+    ]
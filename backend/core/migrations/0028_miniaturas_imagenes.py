@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-17 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_indices_movimientos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pagovendedor',
+            name='comprobante_miniatura',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='comprobantes_pagos/miniaturas/', verbose_name='Comprobante (miniatura)'),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='recibo_miniatura',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='recibo_pedidos/miniaturas/', verbose_name='Recibo (miniatura)'),
+        ),
+    ]
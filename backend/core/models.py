@@ -196,6 +196,12 @@ class Pedido(models.Model):
     recibo = models.ImageField(
         upload_to="recibo_pedidos/", blank=True, null=True, verbose_name="Recibo (Foto)"
     )
+    # Version reducida (WebP, sin EXIF) que generan core/imagenes.py en segundo
+    # plano: es la que muestran las listas; el original se pide solo al abrirlo.
+    recibo_miniatura = models.ImageField(
+        upload_to="recibo_pedidos/miniaturas/", blank=True, null=True, editable=False,
+        verbose_name="Recibo (miniatura)"
+    )
 
     def __str__(self):
         return f"Pedido #{self.id} - Cliente: {self.cliente.nombre}"
@@ -217,6 +223,10 @@ class DetallePedido(models.Model):
 
 
     def save(self, *args, **kwargs):
+        self.derivar_totales()
+        super().save(*args, **kwargs)
+
+    def derivar_totales(self):
         # Modelo de costo (elegido): costo_por_kilo es el costo de compra por
         # kilo con el proveedor (promedio ponderado de los lotes que abastecieron
         # la venta, ver costo_por_kilo_ponderado en utils.py) y total_costo se
@@ -227,19 +237,27 @@ class DetallePedido(models.Model):
         # datos historicos (ventas que figuran pesando mas de lo comprado), lo
         # que hacia estallar el costo reconstruido. Este modelo solo usa datos
         # confiables: costo/kg del proveedor y kilos de bascula.
+        #
+        # Separado de save() para que los recalculos masivos (bulk_update)
+        # deriven exactamente lo mismo.
         if self.cantidad_kilos and self.cantidad_kilos > 0:
             self.total_costo = self.cantidad_kilos * self.costo_por_kilo
 
         self.margen = self.total_venta - self.total_costo
 
-        super().save(*args, **kwargs)
-
     def __str__(self):
         return f"{self.producto.nombre} - {self.cantidad_kilos} kg"
 
     class Meta:
         verbose_name = "Detalle del pedido"
         verbose_name_plural = "Detalles de pedidos"
+        indexes = [
+            # DetallePedidosList pagina por (fecha, id) y filtra por rango de
+            # fechas; los reportes y los exportes tambien cortan por fecha.
+            models.Index(fields=['fecha', 'id'], name='detalle_pedido_fecha_idx'),
+            # Movimientos filtrado por producto (y rango de fechas).
+            models.Index(fields=['producto', 'fecha'], name='detalle_pedido_prod_fecha_idx'),
+        ]
 
 
 class Proveedor(models.Model):
@@ -265,6 +283,11 @@ class Factura(models.Model):
         verbose_name = "Factura"
         verbose_name_plural = "Facturas"
         ordering = ['-fecha']
+        indexes = [
+            # FacturaListView y DetalleFacturasList ordenan y paginan por fecha
+            # de factura (numero_factura desempata) y filtran por rango.
+            models.Index(fields=['fecha', 'numero_factura'], name='factura_fecha_idx'),
+        ]
 
 
 class FacturaDetallePedido(models.Model):
@@ -334,6 +357,11 @@ class PagoVendedor(models.Model):
     comprobante = models.ImageField(
         upload_to="comprobantes_pagos/", blank=True, null=True, verbose_name="Comprobante (Foto)"
     )
+    # Ver Pedido.recibo_miniatura.
+    comprobante_miniatura = models.ImageField(
+        upload_to="comprobantes_pagos/miniaturas/", blank=True, null=True, editable=False,
+        verbose_name="Comprobante (miniatura)"
+    )
     comentario = models.TextField(
         blank=True, null=True, verbose_name="Comentario"
     )
@@ -367,4 +395,86 @@ class EntradaProducto(models.Model):
     def __str__(self):
         return f"{self.producto.nombre} - {self.cantidad_kilos} kg - {self.costo_por_kilo} por kilo"
 
+    class Meta:
+        indexes = [
+            # Orden FIFO por producto: consumir_fifo, descontar_kilos_fifo,
+            # restituir_kilos_fifo, CancelarPedido y MargenActualProductoView
+            # recorren el ledger de un producto por fecha_entrada.
+            models.Index(fields=['producto', 'fecha_entrada'], name='entrada_prod_fecha_idx'),
+            # Solo lotes vivos: consumir_fifo borra los lotes que deja en 0/0,
+            # pero descontar_kilos_fifo nunca borra (un lote sin unidades
+            # puede quedar en 0 kilos) y hay filas 0/0 de antes; hasta que
+            # compactar_lotes las borre, no deberian pesar en el FIFO.
+            # El id va al final porque _lotes_fifo desempata por id.
+            models.Index(
+                fields=['producto', 'fecha_entrada', 'id'],
+                condition=models.Q(cantidad_unidades__gt=0) | models.Q(cantidad_kilos__gt=0),
+                name='entrada_prod_vivos_idx',
+            ),
+            # estado_consumo_detalle y UpdateFacturaEntrada buscan el stock
+            # vivo de una linea de factura por (factura, producto).
+            models.Index(fields=['factura', 'producto'], name='entrada_fact_prod_idx'),
+        ]
+
+
+
+
+class StockResumen(models.Model):
+    """Foto materializada del stock de un producto, para que el dashboard
+    (StockProductos) sea una sola lectura en vez de dos agregados por producto.
+
+    NO es fuente de verdad: se recalcula desde el ledger (EntradaProducto) y
+    desde las reservas (DetallePedido) con actualizar_stock_resumen en
+    utils.py, al final de cada transaccion que los modifica y bajo el mismo
+    candado de producto (bloquear_ledger). Si alguna vez diverge, se
+    reconstruye con ``resincronizar_ledger_stock --resumen``.
+    """
+    producto = models.OneToOneField(
+        Producto, on_delete=models.CASCADE, primary_key=True, related_name='stock_resumen'
+    )
+    # Sum(EntradaProducto.cantidad_unidades): lo que CrearPedido puede vender.
+    disponibles = models.IntegerField(default=0)
+    # Sum(EntradaProducto.cantidad_kilos)
+    kilos_actuales = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Unidades de lineas no anuladas y sin pesar: ya salieron del ledger pero
+    # siguen fisicamente en la camara.
+    reservas = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Stock {self.producto_id}: {self.disponibles} un / {self.kilos_actuales} kg"
+
+
+class VentaDiaria(models.Model):
+    """Ventas de un dia por (fecha, producto, vendedor), para que
+    ReporteGananciasView sume unos cientos de filas en vez de recorrer todo
+    DetallePedido.
+
+    Igual que StockResumen NO es fuente de verdad: guarda las sumas de las
+    lineas de pedidos NO anulados (DetallePedido.fecha, producto y
+    Pedido.vendedor) y se recalcula por clave con actualizar_venta_diaria en
+    utils.py al final de cada transaccion que toca esas lineas, bajo el
+    candado de sus productos (bloquear_ledger). Si alguna vez diverge, se
+    reconstruye con ``reconstruir_ventas_diarias``.
+
+    Sin unique: ``vendedor`` puede ser NULL (pedidos sin vendedor) y los NULL
+    no chocan en un unique; actualizar_venta_diaria borra y reinserta cada
+    clave que recalcula.
+    """
+    fecha = models.DateField()
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='ventas_diarias')
+    vendedor = models.ForeignKey('Vendedor', on_delete=models.SET_NULL, null=True, blank=True,
+                                 related_name='ventas_diarias')
+    # Sum(DetallePedido.total_venta): venta CON IVA, como se guarda la linea.
+    ventas = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Sum(DetallePedido.total_costo): costo neto.
+    costo = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    kilos = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['fecha', 'producto', 'vendedor'], name='venta_diaria_clave_idx'),
+        ]
+
+    def __str__(self):
+        return f"Ventas {self.fecha} producto {self.producto_id} vendedor {self.vendedor_id}: {self.ventas}"
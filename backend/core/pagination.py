@@ -0,0 +1,56 @@
+from rest_framework.pagination import CursorPagination
+
+
+class PedidoCursorPagination(CursorPagination):
+    """Paginacion por cursor de PedidoListView, del mas nuevo al mas viejo.
+
+    El cursor se posiciona sobre ``fecha`` y ``id`` desempata pedidos con la
+    misma fecha, asi que pedir la pagina siguiente cuesta lo mismo en la
+    primera pagina que en la numero mil (no hay OFFSET que recorrer) y un
+    pedido nuevo no corre las paginas ya vistas.
+    """
+    ordering = ('-fecha', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class FacturaCursorPagination(CursorPagination):
+    """Paginacion por cursor de FacturaListView, de la mas nueva a la mas
+    vieja. ``numero_factura`` (la PK) desempata las facturas del mismo dia."""
+    ordering = ('-fecha', '-numero_factura')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class DetallePedidoCursorPagination(CursorPagination):
+    """Paginacion por cursor de DetallePedidosList (salidas de Movimientos),
+    de la linea mas nueva a la mas vieja. Se apoya en el indice
+    detalle_pedido_fecha_idx (fecha, id)."""
+    ordering = ('-fecha', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class DetalleFacturaCursorPagination(CursorPagination):
+    """Paginacion por cursor de DetalleFacturasList (entradas de Movimientos).
+
+    Las lineas no tienen fecha propia: la vista anota ``fecha_factura`` (la
+    fecha de su factura) y el cursor se posiciona sobre ella, con ``id``
+    desempatando las lineas del mismo dia.
+    """
+    ordering = ('-fecha_factura', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class AjusteCursorPagination(CursorPagination):
+    """Paginacion por cursor de AjusteInventarioListView, del ajuste mas nuevo
+    al mas viejo."""
+    ordering = ('-fecha', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
@@ -0,0 +1,165 @@
+"""Perfil de SQL por request: cuantas consultas hace cada endpoint, cuanto
+tiempo pasa en la base y que consultas se repiten.
+
+Cuando un endpoint se pone lento en produccion el access log de gunicorn solo
+dice que tardo. PerfilSQLMiddleware envuelve cada consulta del request con
+``connection.execute_wrapper`` y, si el request supera PERFIL_SQL_UMBRAL_MS
+o PERFIL_SQL_UMBRAL_CONSULTAS, escribe UNA linea JSON en el logger
+'core.perfil_sql' con:
+  ruta, metodo, status, ms (total), db_ms, consultas
+  identicas   consultas repetidas con los mismos parametros (cacheables)
+  lentas      las PERFIL_SQL_LENTAS consultas mas lentas
+  repetidas   las PERFIL_SQL_LENTAS huellas (SQL sin valores, ver huella)
+              que mas veces corrieron, con las veces y su tiempo: la firma
+              de un N+1
+``python manage.py reporte_perfil_sql`` junta esas lineas y arma el ranking.
+
+Las respuestas en streaming (las exportaciones CSV/XLSX) consultan mientras se
+envian: el perfil de esas se cierra al terminar de enviarlas.
+
+APAGADO
+Solo se activa con PERFIL_SQL=1. Apagado, el middleware levanta
+MiddlewareNotUsed y Django lo saca de la cadena: no cuesta nada.
+"""
+import hashlib
+import heapq
+import json
+import logging
+import re
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+EVENTO = 'perfil_sql'
+# Largo maximo del SQL que se guarda en el log.
+LARGO_SQL = 600
+
+_LISTAS = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_LITERALES = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_ESPACIOS = re.compile(r'\s+')
+
+
+def normalizar(sql):
+    """SQL sin valores: las listas IN (%s, %s, ...) de cualquier largo quedan
+    como IN (%s, ...) y los literales como %s. Django ya manda casi todo
+    parametrizado; esto junta lo que no (numeros de LIMIT, listas)."""
+    sql = _LITERALES.sub('%s', sql)
+    sql = _LISTAS.sub('(%s, ...)', sql)
+    return _ESPACIOS.sub(' ', sql).strip()
+
+
+def huella(sql):
+    """Clave corta de la forma de una consulta (ver normalizar)."""
+    return hashlib.md5(normalizar(sql).encode()).hexdigest()[:12]
+
+
+class _Registro:
+    """Se instala con connection.execute_wrapper y anota cada consulta."""
+
+    def __init__(self, lentas):
+        self.consultas = 0
+        self.identicas = 0
+        self.db = 0.0
+        self.lentas = []  # heap (segundos, sql) con las N mas lentas
+        self.n_lentas = lentas
+        self.por_sql = {}  # sql -> [veces, segundos]
+        self.vistas = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion = time.perf_counter() - inicio
+            self.consultas += 1
+            self.db += duracion
+            clave = (sql, repr(params))
+            if clave in self.vistas:
+                self.identicas += 1
+            else:
+                self.vistas.add(clave)
+            acumulado = self.por_sql.get(sql)
+            if acumulado is None:
+                self.por_sql[sql] = [1, duracion]
+            else:
+                acumulado[0] += 1
+                acumulado[1] += duracion
+            if len(self.lentas) < self.n_lentas:
+                heapq.heappush(self.lentas, (duracion, sql))
+            elif self.lentas and duracion > self.lentas[0][0]:
+                heapq.heapreplace(self.lentas, (duracion, sql))
+
+    def repetidas(self):
+        # Se agrupa por huella recien aca: normalizar cada consulta en caliente
+        # costaria una regex por consulta.
+        grupos = {}
+        for sql, (veces, segundos) in self.por_sql.items():
+            clave = huella(sql)
+            grupo = grupos.setdefault(clave, {'huella': clave, 'veces': 0, 'ms': 0.0, 'sql': sql})
+            grupo['veces'] += veces
+            grupo['ms'] += segundos * 1000
+        repetidas = [g for g in grupos.values() if g['veces'] > 1]
+        repetidas.sort(key=lambda g: (-g['veces'], -g['ms']))
+        return [
+            dict(g, ms=round(g['ms'], 1), sql=normalizar(g['sql'])[:LARGO_SQL])
+            for g in repetidas[:settings.PERFIL_SQL_LENTAS]
+        ]
+
+
+def _ruta(request):
+    coincidencia = getattr(request, 'resolver_match', None)
+    if coincidencia is None:
+        return request.path_info, None
+    return '/' + coincidencia.route, coincidencia.view_name
+
+
+class PerfilSQLMiddleware:
+    def __init__(self, get_response):
+        if not settings.PERFIL_SQL:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        registro = _Registro(settings.PERFIL_SQL_LENTAS)
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(registro):
+            respuesta = self.get_response(request)
+        if respuesta.streaming:
+            respuesta.streaming_content = self._seguir(respuesta.streaming_content, registro, request,
+                                                       respuesta, inicio)
+        else:
+            self._cerrar(registro, request, respuesta, inicio)
+        return respuesta
+
+    def _seguir(self, contenido, registro, request, respuesta, inicio):
+        try:
+            with connection.execute_wrapper(registro):
+                yield from contenido
+        finally:
+            self._cerrar(registro, request, respuesta, inicio)
+
+    def _cerrar(self, registro, request, respuesta, inicio):
+        ms = (time.perf_counter() - inicio) * 1000
+        if ms < settings.PERFIL_SQL_UMBRAL_MS and registro.consultas < settings.PERFIL_SQL_UMBRAL_CONSULTAS:
+            return
+        ruta, vista = _ruta(request)
+        lentas = sorted(registro.lentas, reverse=True)
+        logger.info(json.dumps({
+            'evento': EVENTO,
+            'ts': round(time.time(), 3),
+            'metodo': request.method,
+            'ruta': ruta,
+            'vista': vista,
+            'path': request.path_info,
+            'status': respuesta.status_code,
+            'ms': round(ms, 1),
+            'db_ms': round(registro.db * 1000, 1),
+            'consultas': registro.consultas,
+            'identicas': registro.identicas,
+            'lentas': [{'ms': round(s * 1000, 1), 'sql': sql[:LARGO_SQL]} for s, sql in lentas],
+            'repetidas': registro.repetidas(),
+        }, ensure_ascii=False))
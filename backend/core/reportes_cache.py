@@ -0,0 +1,136 @@
+"""Cache de respuestas de los reportes (/api/reportes/*).
+
+Los reportes se leen muchas veces al dia pero sus datos solo cambian cuando se
+escribe un pedido, una factura, un ajuste o un producto. Cada respuesta se
+guarda con una clave que incluye el reporte, los parametros de la consulta y
+una VERSION DE DATOS global; las vistas que escriben llaman a
+invalidar_reportes(), que sube la version al confirmarse la transaccion. Las
+claves viejas dejan de leerse y caducan solas (TIMEOUT del cache).
+
+Usa el alias 'reportes' de CACHES (ver settings.py): un cache en archivos, para
+que todos los workers de gunicorn vean la misma version. Lo que no pasa por
+las vistas (el admin, los comandos de mantenimiento) no sube la version; para
+eso queda el TIMEOUT como tope de antiguedad.
+
+La version no se incrementa: cada escritura guarda un valor NUEVO (un uuid)
+sin leer el anterior. Con un get+set, dos commits en workers distintos podian
+escribir los dos v+1 y un reporte calculado entre esos commits quedaba
+guardado con la version final, sirviendo datos viejos hasta el TIMEOUT.
+
+Los contadores de aciertos/fallos (estadisticas_cache) viven en el mismo
+cache. Son para monitoreo: se suman con get/set, que no es atomico entre
+procesos, y bajo carga pueden perder alguna cuenta. La version no tiene ese
+problema.
+"""
+import hashlib
+import uuid
+from functools import wraps
+
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+ALIAS = 'reportes'
+CLAVE_VERSION = 'reportes:version'
+
+# Reportes registrados con cachear_reporte, para listar sus contadores.
+REPORTES = []
+
+
+def _cache():
+    return caches[ALIAS]
+
+
+def version_datos():
+    """Version actual de los datos. Si la clave no existe (cache nuevo o
+    descartada por el cache) arranca en un valor nuevo, para no volver a una
+    version que ya tenga respuestas guardadas."""
+    cache = _cache()
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, _nueva_version(), timeout=None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def _sumar(clave, inicial):
+    # Sin cache.incr: vuelve a guardar la clave con el TIMEOUT por defecto y
+    # los contadores no deben caducar.
+    cache = _cache()
+    valor = cache.get(clave)
+    cache.set(clave, inicial if valor is None else valor + 1, timeout=None)
+
+
+def _nueva_version():
+    return uuid.uuid4().hex
+
+
+def _subir_version():
+    # Un valor nuevo sin leer el anterior: dos workers que suben a la vez
+    # dejan versiones distintas, nunca la misma (ver el docstring del modulo).
+    _cache().set(CLAVE_VERSION, _nueva_version(), timeout=None)
+
+
+def invalidar_reportes():
+    """Sube la version de datos cuando se confirme la transaccion en curso (de
+    inmediato si no hay una). Subirla antes del commit dejaria que un reporte
+    leido entre medio guardara datos viejos con la version nueva."""
+    transaction.on_commit(_subir_version)
+
+
+def _contar(reporte, evento):
+    _sumar(f'reportes:{evento}:{reporte}', 1)
+
+
+def estadisticas_cache():
+    """Aciertos y fallos por reporte (y totales) desde el arranque del cache."""
+    cache = _cache()
+    claves = [f'reportes:{evento}:{r}' for r in REPORTES for evento in ('hits', 'misses')]
+    valores = cache.get_many(claves)
+    por_reporte = {
+        r: {
+            'hits': valores.get(f'reportes:hits:{r}', 0),
+            'misses': valores.get(f'reportes:misses:{r}', 0),
+        }
+        for r in REPORTES
+    }
+    return {
+        'version': version_datos(),
+        'hits': sum(r['hits'] for r in por_reporte.values()),
+        'misses': sum(r['misses'] for r in por_reporte.values()),
+        'por_reporte': por_reporte,
+    }
+
+
+def cachear_reporte(nombre):
+    """Decorador para el ``get`` de una vista de reporte: devuelve la respuesta
+    guardada para (nombre, parametros, version) si existe y si no la calcula y
+    la guarda. Solo se guardan respuestas 200. Corre despues de la
+    autenticacion y los permisos de la vista (DRF los revisa antes de llamar a
+    ``get``). La cabecera X-Cache dice si fue HIT o MISS."""
+    REPORTES.append(nombre)
+
+    def decorador(get):
+        @wraps(get)
+        def envuelta(self, request, *args, **kwargs):
+            parametros = sorted(
+                (k, sorted(v)) for k, v in request.query_params.lists()
+            )
+            firma = hashlib.md5(repr((args, sorted(kwargs.items()), parametros)).encode()).hexdigest()
+            clave = f'reportes:{version_datos()}:{nombre}:{firma}'
+
+            cache = _cache()
+            data = cache.get(clave)
+            if data is not None:
+                _contar(nombre, 'hits')
+                return Response(data, status=status.HTTP_200_OK, headers={'X-Cache': 'HIT'})
+
+            _contar(nombre, 'misses')
+            respuesta = get(self, request, *args, **kwargs)
+            if respuesta.status_code == status.HTTP_200_OK:
+                cache.set(clave, respuesta.data)
+            respuesta['X-Cache'] = 'MISS'
+            return respuesta
+        return envuelta
+    return decorador
@@ -1,6 +1,9 @@
 from decimal import Decimal
 
+from django.db import models
+from django.db.models import F, Q, QuerySet
 from rest_framework import serializers
+from .utils import LOTE_IDS
 from .models import Producto, Pedido, DetallePedido, Cliente, PagoFactura, Factura, DetalleFactura, Vendedor, Proveedor, FacturaDetallePedido, HistorialPrecioProducto, AjusteInventario
 
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
@@ -79,6 +82,64 @@ class AjusteInventarioSerializer(serializers.ModelSerializer):
         fields = ['id', 'producto', 'producto_nombre', 'cantidad', 'cantidad_unidades', 'tipo', 'razon', 'fecha']
 
 
+def _cargar_cache_facturas(instancia, obj):
+    """Arma el cache de DetallePedidoSerializer.get_facturas_detalle para
+    todas las lineas de ``instancia`` (lo que recibio el serializer raiz: un
+    Pedido, un DetallePedido o una lista/queryset de cualquiera de ellos).
+    Si no se reconoce, se arma solo para ``obj``.
+
+    Dos consultas (por cada tramo de LOTE_IDS): los links de esas lineas con
+    su factura y proveedor, y los DetalleFactura de los pares (factura,
+    producto) que aparecen en esos links.
+    """
+    if isinstance(instancia, models.Manager):
+        instancia = instancia.all()
+    objetos = instancia if isinstance(instancia, (list, tuple, QuerySet)) else [instancia]
+    pedido_ids = [o.pk for o in objetos if isinstance(o, Pedido)]
+    detalle_ids = [o.pk for o in objetos if isinstance(o, DetallePedido)]
+    if obj.pedido_id not in pedido_ids and obj.id not in detalle_ids:
+        pedido_ids, detalle_ids = [], [obj.id]
+
+    filtros = [
+        Q(detallepedido__pedido_id__in=pedido_ids[i:i + LOTE_IDS])
+        for i in range(0, len(pedido_ids), LOTE_IDS)
+    ] + [
+        Q(detallepedido_id__in=detalle_ids[i:i + LOTE_IDS])
+        for i in range(0, len(detalle_ids), LOTE_IDS)
+    ]
+
+    links_por_pedido = {}
+    pares = set()
+    for filtro in filtros:
+        links = (
+            FacturaDetallePedido.objects.filter(filtro)
+            .select_related('factura', 'factura__proveedor')
+            .annotate(linea_producto_id=F('detallepedido__producto_id'))
+            .order_by('id')
+        )
+        for link in links:
+            links_por_pedido.setdefault(link.detallepedido_id, []).append(link)
+            pares.add((link.factura_id, link.linea_producto_id))
+
+    detalle_factura_por_par = {}
+    facturas = sorted({f for f, _p in pares})
+    productos = {p for _f, p in pares}
+    for i in range(0, len(facturas), LOTE_IDS):
+        # Si una factura repite el producto, gana la ultima, como antes.
+        for df in DetalleFactura.objects.filter(
+            factura_id__in=facturas[i:i + LOTE_IDS], producto_id__in=productos
+        ).order_by('id'):
+            if (df.factura_id, df.producto_id) in pares:
+                detalle_factura_por_par[(df.factura_id, df.producto_id)] = df
+
+    return {
+        'pedidos': set(pedido_ids),
+        'detalles': set(detalle_ids),
+        'links_por_pedido': links_por_pedido,
+        'detalle_factura_por_par': detalle_factura_por_par,
+    }
+
+
 class DetallePedidoSerializer(serializers.ModelSerializer):
     producto = ProductoSerializer()
     cliente_nombre = serializers.ReadOnlyField(source='pedido.cliente.nombre')
@@ -86,24 +147,19 @@ class DetallePedidoSerializer(serializers.ModelSerializer):
     estado_pedido = serializers.ReadOnlyField(source='pedido.estado')
     facturas_detalle = serializers.SerializerMethodField()
 
-    def _cache_facturas(self):
-        # Cachea en `self` (compartido por todas las filas cuando se serializa
-        # con many=True) los links de FacturaDetallePedido agrupados por pedido
-        # y los DetalleFactura indexados por (factura, producto), para evitar
-        # 1-2 queries extra POR FILA (N+1) — ver spawn_task sobre esta vista.
-        cache = getattr(self, '_facturas_cache', None)
-        if cache is None:
-            links_por_pedido = {}
-            for link in FacturaDetallePedido.objects.select_related('factura', 'factura__proveedor'):
-                links_por_pedido.setdefault(link.detallepedido_id, []).append(link)
-
-            detalle_factura_por_par = {
-                (df.factura_id, df.producto_id): df
-                for df in DetalleFactura.objects.all()
-            }
-
-            cache = {'links_por_pedido': links_por_pedido, 'detalle_factura_por_par': detalle_factura_por_par}
-            self._facturas_cache = cache
+    def _cache_facturas(self, obj):
+        # Links de FacturaDetallePedido agrupados por linea y DetalleFactura
+        # indexados por (factura, producto), SOLO de las lineas que se estan
+        # serializando, para evitar 1-2 queries extra POR FILA (N+1).
+        #
+        # Vive en el context del serializer raiz, que comparten todos los
+        # anidados: en PedidoSerializer(many=True) se arma una vez por
+        # respuesta y no una vez por pedido.
+        cache = self.context.get('_facturas_cache')
+        if cache is None or (obj.pedido_id not in cache['pedidos']
+                             and obj.id not in cache['detalles']):
+            cache = _cargar_cache_facturas(self.root.instance, obj)
+            self.context['_facturas_cache'] = cache
         return cache
 
     def get_facturas_detalle(self, obj):
@@ -114,7 +170,7 @@ class DetallePedidoSerializer(serializers.ModelSerializer):
         # costos atribuidos coincide EXACTA con total_costo de la linea
         # (= costo/kg ponderado * kilos vendidos), en vez de reconstruir desde el
         # peso de compra por pieza (que en historicos esta corrupto y no cuadra).
-        cache = self._cache_facturas()
+        cache = self._cache_facturas(obj)
         links = cache['links_por_pedido'].get(obj.id, [])
         total_unidades = sum(l.cantidad_unidades for l in links) or 0
         kilos_linea = Decimal(str(obj.cantidad_kilos or 0))
@@ -146,10 +202,23 @@ class PedidoSerializer(serializers.ModelSerializer):
     detalles = DetallePedidoSerializer(many=True)
     cliente = ClienteSerializer()
     vendedor = VendedorSerializer()
+    # URL de la miniatura para las listas; ``recibo`` (el original) solo se
+    # descarga cuando se abre.
+    recibo = serializers.ImageField(read_only=True)
+    recibo_miniatura = serializers.ImageField(read_only=True)
 
     class Meta:
         model = Pedido
-        fields = ['id', 'cliente', 'vendedor', 'fecha', 'estado', 'detalles', 'total']
+        fields = ['id', 'cliente', 'vendedor', 'fecha', 'estado', 'detalles', 'total', 'recibo', 'recibo_miniatura']
+
+    def __init__(self, *args, **kwargs):
+        # campos=[...] limita la salida a esos campos (ver ?fields= en
+        # PedidoListView), p.ej. para listar pedidos sin sus detalles.
+        campos = kwargs.pop('campos', None)
+        super().__init__(*args, **kwargs)
+        if campos is not None:
+            for nombre in set(self.fields) - set(campos):
+                self.fields.pop(nombre)
 
     def create(self, validated_data):
         detalles_data = validated_data.pop('detalles')
@@ -188,10 +257,17 @@ class DetalleFacturaSerializer(serializers.ModelSerializer):
 
     def _info(self, obj):
         # Cachea el cálculo por instancia para no repetir el query en cada campo.
+        # Si la vista paso el consumo ya calculado para toda la respuesta
+        # (context['consumo'], ver consumo_facturas) no se consulta nada.
         cache = getattr(obj, '_estado_consumo_cache', None)
         if cache is None:
-            from .utils import estado_consumo_detalle
-            cache = estado_consumo_detalle(obj)
+            from .utils import estado_consumo, estado_consumo_detalle
+            consumo = self.context.get('consumo')
+            if consumo is not None:
+                vivas = consumo['vivas'].get((obj.factura_id, obj.producto_id), 0)
+                cache = estado_consumo(obj, vivas)
+            else:
+                cache = estado_consumo_detalle(obj)
             obj._estado_consumo_cache = cache
         return cache
 
@@ -207,6 +283,9 @@ class DetalleFacturaSerializer(serializers.ModelSerializer):
     def get_pedidos_consumidores(self, obj):
         if self._info(obj)['consumidas'] <= 0:
             return []
+        consumo = self.context.get('consumo')
+        if consumo is not None:
+            return consumo['pedidos'].get((obj.factura_id, obj.producto_id), [])
         from .utils import pedidos_consumidores_detalle
         return pedidos_consumidores_detalle(obj)
 
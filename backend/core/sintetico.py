@@ -0,0 +1,637 @@
+"""Datos sinteticos con la forma de la base real, para benchmarks y pruebas
+de volumen.
+
+QUE GENERA
+Vendedores, clientes, proveedores, productos, facturas de compra con sus
+lotes, pedidos y mermas, recorriendo el calendario en orden: cada factura
+agrega lotes al ledger y cada pedido lo consume por FIFO con las mismas
+reglas que consumir_fifo / descontar_kilos_fifo (unidades y kilos por
+separado; un lote se borra solo cuando no le quedan ni unidades ni kilos).
+Los pedidos Anulado no consumen nada (CancelarPedido ya devolvio todo) y las
+lineas sin pesar (pedidos Reservado y la fraccion 'sin_pesar' del resto)
+consumen unidades pero no kilos. StockResumen y VentaDiaria se calculan en
+memoria con las mismas reglas que calcular_stock / filas_venta_diaria, asi
+que verificar_ledger cuadra sobre los datos generados.
+
+LA FORMA
+Un perfil son las frecuencias de la base real: lineas por factura, unidades
+por lote, peso por unidad y su variacion de cada corte, lineas por pedido,
+unidades por linea, mezcla de estados (Reservado, Preparado, la tasa de
+anulacion), lineas sin pesar y frecuencia y tamano de las mermas. Cada valor
+se sortea con esas frecuencias, asi que al subir las cantidades (escalar) la
+forma se mantiene. PERFIL_BASE es el ajuste del ultimo volcado de produccion
+en backups/; ajustar_perfil(leer_volcado(ruta)) lo recalcula desde otro
+volcado (pg_dump en texto o fixture JSON de dumpdata).
+
+COMO ESCRIBE
+Los ids se asignan aca (desde el maximo existente en la base) para poder
+escribir en tandas de TANDA filas sin esperar a que la base devuelva las
+claves. Las tandas van a un escritor: escribir_bulk (bulk_create),
+escribir_copy (COPY de PostgreSQL, sin instancias de modelo) o
+EscritorFixture (archivo JSON para loaddata). Los lotes vivos se escriben al
+final, cuando ya no cambian.
+"""
+import json
+import random
+import re
+import statistics
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.utils import timezone
+
+from .models import (
+    AjusteInventario, Cliente, DetalleFactura, DetallePedido, EntradaProducto,
+    Factura, FacturaDetallePedido, Pedido, Producto, Proveedor, StockResumen,
+    VentaDiaria, Vendedor,
+)
+
+TANDA = 5000
+
+# ajustar_perfil(leer_volcado('backups/backup_railway_20260811_002526.sql'))
+PERFIL_BASE = {
+    # {valor: frecuencia observada}
+    'lineas_por_factura': {1: 23, 2: 3, 4: 1},
+    'unidades_por_lote': {4: 1, 5: 1, 6: 3, 7: 2, 8: 1, 9: 2, 10: 2, 11: 1, 12: 1, 14: 2,
+                          15: 6, 18: 3, 19: 1, 20: 2, 21: 1, 25: 1, 30: 1, 34: 1, 36: 1},
+    'lineas_por_pedido': {1: 87, 2: 42, 3: 11},
+    'unidades_por_linea': {1: 94, 2: 42, 3: 23, 4: 19, 5: 7, 6: 7, 7: 3, 8: 1, 10: 3,
+                           12: 1, 14: 1},
+    'estados': {'Pagado': 114, 'Anulado': 16, 'Preparado': 10},
+    # Lineas de pedidos no Reservado ni Anulado que quedaron sin pesar.
+    'sin_pesar': 0.0,
+    # Por corte: kilos por unidad (media), su variacion relativa entre lotes y
+    # precio de venta por kilo.
+    'cortes': [
+        {'peso': 2.41, 'variacion': 0.12, 'precio': 19500},
+        {'peso': 1.2, 'variacion': 0.084, 'precio': 14900},
+        {'peso': 2.45, 'variacion': 0.192, 'precio': 9890},
+        {'peso': 0.9, 'variacion': 0.124, 'precio': 11490},
+        {'peso': 1.0, 'variacion': 0.0, 'precio': 7900},
+        {'peso': 1.0, 'variacion': 0.0, 'precio': 1300},
+    ],
+    # precio de venta (con IVA) / costo por kilo (neto)
+    'margen': 1.43,
+    'mermas_por_pedido': 3 / 140,
+    'kilos_merma': {2.4: 1, 5.7: 1, 14.0: 1},
+    # Cantidades de la base observada: escalar() multiplica desde aca.
+    'cantidades': {'vendedores': 4, 'clientes': 67, 'proveedores': 5, 'productos': 7,
+                   'facturas': 27, 'pedidos': 140},
+    'dias': 162,
+}
+
+# Tablas del volcado que usa ajustar_perfil.
+TABLAS_PERFIL = ('core_vendedor', 'core_cliente', 'core_proveedor', 'core_producto', 'core_factura',
+                 'core_detallefactura', 'core_pedido', 'core_detallepedido', 'core_ajusteinventario')
+
+
+def _sorteo(rng, frecuencias):
+    valores = list(frecuencias)
+    pesos = list(frecuencias.values())
+    return lambda: rng.choices(valores, pesos)[0]
+
+
+def _centesimos(valor):
+    return Decimal(valor).scaleb(-2)
+
+
+@contextmanager
+def _fechas_libres(*modelos):
+    # bulk_create respeta auto_now_add y pisaria las fechas sorteadas.
+    campos = [f for m in modelos for f in m._meta.concrete_fields if getattr(f, 'auto_now_add', False)]
+    for campo in campos:
+        campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo in campos:
+            campo.auto_now_add = True
+
+
+# -- lectura y ajuste de un volcado ---------------------------------------------
+
+_COPY = re.compile(r'^COPY (?:\w+\.)?"?(\w+)"? \((.*)\) FROM stdin;$')
+_ESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', '\\': '\\'}
+
+
+def _valor_copy(texto):
+    if texto == r'\N':
+        return None
+    if '\\' not in texto:
+        return texto
+    return re.sub(r'\\(.)', lambda m: _ESCAPES.get(m.group(1), m.group(1)), texto)
+
+
+def _leer_sql(ruta):
+    tablas = {}
+    with open(ruta, encoding='utf-8') as archivo:
+        filas = columnas = None
+        for linea in archivo:
+            linea = linea.rstrip('\n')
+            if filas is None:
+                m = _COPY.match(linea)
+                if m and m.group(1) in TABLAS_PERFIL:
+                    columnas = [c.strip().strip('"') for c in m.group(2).split(',')]
+                    filas = tablas.setdefault(m.group(1), [])
+            elif linea == r'\.':
+                filas = None
+            else:
+                filas.append(dict(zip(columnas, map(_valor_copy, linea.split('\t')))))
+    return tablas
+
+
+def _leer_fixture(ruta):
+    with open(ruta, encoding='utf-8') as archivo:
+        texto = archivo.read()
+    if not texto.strip():
+        raise ValueError("archivo vacio")
+    # dumpdata redirigido a un archivo arrastra lo que el proceso imprimio
+    # antes (los DEBUG de settings.py): el JSON empieza en el primer '['.
+    inicio = texto.find('[')
+    if inicio < 0:
+        raise ValueError("no es un volcado JSON")
+    try:
+        objetos, _fin = json.JSONDecoder().raw_decode(texto, inicio)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"JSON incompleto o invalido ({e.msg}, caracter {e.pos})")
+    tablas = {}
+    for objeto in objetos:
+        modelo = apps.get_model(objeto['model'])
+        if modelo._meta.db_table not in TABLAS_PERFIL:
+            continue
+        fila = {modelo._meta.pk.column: objeto.get('pk')}
+        for nombre, valor in objeto['fields'].items():
+            campo = modelo._meta.get_field(nombre)
+            if not campo.many_to_many:
+                fila[campo.column] = valor
+        tablas.setdefault(modelo._meta.db_table, []).append(fila)
+    return tablas
+
+
+def leer_volcado(ruta):
+    """Filas de las tablas de TABLAS_PERFIL de un volcado: ``{tabla: [{columna:
+    valor}]}``. Acepta el texto de pg_dump (bloques COPY) y el JSON de
+    dumpdata. ValueError si el archivo no sirve (vacio, cortado, sin pedidos)."""
+    if str(ruta).endswith('.json'):
+        tablas = _leer_fixture(ruta)
+    else:
+        tablas = _leer_sql(ruta)
+    if not tablas.get('core_pedido') or not tablas.get('core_detallefactura'):
+        raise ValueError("no trae pedidos ni facturas")
+    return tablas
+
+
+def _numero(valor):
+    return float(valor) if valor not in (None, '') else 0.0
+
+
+def _frecuencias(valores):
+    return dict(sorted(Counter(valores).items()))
+
+
+def ajustar_perfil(tablas):
+    """Perfil (con la forma de PERFIL_BASE) ajustado a las filas de un volcado
+    (ver leer_volcado)."""
+    facturas = tablas.get('core_detallefactura', [])
+    pedidos = tablas.get('core_pedido', [])
+    lineas = tablas.get('core_detallepedido', [])
+    ajustes = tablas.get('core_ajusteinventario', [])
+    productos = {str(r['id']): r for r in tablas.get('core_producto', [])}
+
+    compras = [r for r in facturas if _numero(r['cantidad_unidades']) > 0 and _numero(r['cantidad_kilos']) > 0]
+    por_corte = {}
+    for r in compras:
+        por_corte.setdefault(str(r['producto_id']), []).append(r)
+    cortes = []
+    for producto_id, filas in sorted(por_corte.items()):
+        unidades = [_numero(r['cantidad_unidades']) for r in filas]
+        peso = sum(_numero(r['cantidad_kilos']) for r in filas) / sum(unidades)
+        variacion = None
+        if len(filas) >= 2:
+            # Variacion del peso medio por unidad entre lotes del mismo corte.
+            medias = [_numero(r['cantidad_kilos']) / u for r, u in zip(filas, unidades)]
+            variacion = statistics.pstdev(medias) / statistics.fmean(medias)
+        precio = _numero(productos.get(producto_id, {}).get('precio_por_kilo')) or None
+        cortes.append({'peso': round(peso, 2), 'variacion': variacion, 'precio': precio})
+    conocidas = [c['variacion'] for c in cortes if c['variacion'] is not None]
+    precios = [c['precio'] for c in cortes if c['precio']]
+    for corte in cortes:
+        if corte['variacion'] is None:
+            corte['variacion'] = statistics.median(conocidas) if conocidas else 0.10
+        corte['variacion'] = round(corte['variacion'], 3)
+        corte['precio'] = round(corte['precio'] or (statistics.median(precios) if precios else 10000))
+
+    estado_de = {str(r['id']): r['estado'] for r in pedidos}
+    pesables = [r for r in lineas if estado_de.get(str(r['pedido_id'])) not in ('Anulado', 'Reservado')]
+    margenes = [_numero(r['precio_venta']) / _numero(r['costo_por_kilo'])
+                for r in lineas if _numero(r['costo_por_kilo']) > 0 and _numero(r['precio_venta']) > 0]
+    mermas = [abs(_numero(r['cantidad'])) for r in ajustes if _numero(r['cantidad']) < 0]
+    dias = sorted({str(r['fecha'])[:10] for r in pedidos if r.get('fecha')})
+
+    return {
+        'lineas_por_factura': _frecuencias(Counter(str(r['factura_id']) for r in facturas).values()),
+        'unidades_por_lote': _frecuencias(int(_numero(r['cantidad_unidades'])) for r in compras),
+        'lineas_por_pedido': _frecuencias(Counter(str(r['pedido_id']) for r in lineas).values()),
+        'unidades_por_linea': _frecuencias(
+            round(_numero(r['cantidad_unidades'])) for r in lineas if _numero(r['cantidad_unidades']) >= 1),
+        'estados': dict(Counter(estado_de.values()).most_common()),
+        'sin_pesar': round(sum(1 for r in pesables if _numero(r['cantidad_kilos']) == 0)
+                           / max(1, len(pesables)), 3),
+        'cortes': cortes or PERFIL_BASE['cortes'],
+        'margen': round(statistics.median(margenes), 2) if margenes else PERFIL_BASE['margen'],
+        'mermas_por_pedido': len(mermas) / len(pedidos),
+        'kilos_merma': _frecuencias(round(k, 1) for k in mermas) or PERFIL_BASE['kilos_merma'],
+        'cantidades': {
+            'vendedores': len(tablas.get('core_vendedor', [])),
+            'clientes': len(tablas.get('core_cliente', [])),
+            'proveedores': len(tablas.get('core_proveedor', [])),
+            'productos': len(productos),
+            'facturas': len(tablas.get('core_factura', [])),
+            'pedidos': len(pedidos),
+        },
+        'dias': (date.fromisoformat(dias[-1]) - date.fromisoformat(dias[0])).days if dias else PERFIL_BASE['dias'],
+    }
+
+
+def escalar(factor, perfil=None):
+    """Cantidades del perfil multiplicadas por ``factor`` (los productos y
+    proveedores crecen con la raiz: un catalogo 100 veces mas grande no es lo
+    que pasa cuando el negocio vende 100 veces mas)."""
+    base = (perfil or PERFIL_BASE)['cantidades']
+    cantidades = {k: max(1, round(v * factor)) for k, v in base.items()}
+    for clave in ('productos', 'proveedores'):
+        cantidades[clave] = max(1, round(base[clave] * factor ** 0.5))
+    return cantidades
+
+
+# -- escritores -----------------------------------------------------------------
+#
+# Un escritor recibe ``(modelo, filas)``: cada fila es un dict {attname:
+# valor} con los valores ya del tipo de la columna; lo que falta toma el
+# default del campo. Sin instancias de modelo en el camino de COPY: armarlas
+# costaba mas que generar los datos.
+
+_COLUMNAS = {}
+
+
+def _columnas(modelo):
+    """[(campo, default)] de las columnas concretas de ``modelo``."""
+    if modelo not in _COLUMNAS:
+        _COLUMNAS[modelo] = [
+            (campo, None if campo.primary_key else campo.get_default())
+            for campo in modelo._meta.concrete_fields
+        ]
+    return _COLUMNAS[modelo]
+
+
+def escribir_bulk(modelo, filas):
+    modelo.objects.bulk_create([modelo(**fila) for fila in filas], batch_size=TANDA)
+
+
+def escribir_copy(modelo, filas):
+    """COPY ... FROM STDIN de PostgreSQL (psycopg 3)."""
+    columnas = _columnas(modelo)
+    nombres = ', '.join(connection.ops.quote_name(campo.column) for campo, _d in columnas)
+    sql = f"COPY {connection.ops.quote_name(modelo._meta.db_table)} ({nombres}) FROM STDIN"
+    with connection.cursor() as cursor:
+        with cursor.copy(sql) as copia:
+            for fila in filas:
+                copia.write_row([fila.get(campo.attname, default) for campo, default in columnas])
+
+
+class EscritorFixture:
+    """Escribe las tandas como un fixture JSON (el formato de dumpdata) en
+    ``archivo``, a medida que llegan. cerrar() termina la lista."""
+
+    def __init__(self, archivo):
+        self.archivo = archivo
+        self.primero = True
+        archivo.write('[')
+
+    def __call__(self, modelo, filas):
+        etiqueta = modelo._meta.label_lower
+        pk = modelo._meta.pk.attname
+        columnas = [(c, d) for c, d in _columnas(modelo) if not c.primary_key]
+        for fila in filas:
+            valores = {campo.name: fila.get(campo.attname, default) for campo, default in columnas}
+            objeto = {'model': etiqueta, 'pk': fila[pk], 'fields': valores}
+            self.archivo.write(('\n' if self.primero else ',\n') + json.dumps(objeto, cls=DjangoJSONEncoder))
+            self.primero = False
+
+    def cerrar(self):
+        self.archivo.write('\n]\n')
+
+
+# -- generador ------------------------------------------------------------------
+
+class _Ids:
+    """Siguiente id libre por modelo, desde el maximo que ya hay en la base."""
+
+    def __init__(self):
+        self._siguiente = {}
+
+    def __call__(self, modelo):
+        if modelo not in self._siguiente:
+            ultimo = modelo.objects.order_by('-pk').values_list('pk', flat=True).first()
+            self._siguiente[modelo] = (ultimo or 0) + 1
+        valor = self._siguiente[modelo]
+        self._siguiente[modelo] += 1
+        return valor
+
+
+class Generador:
+    """Genera y escribe un conjunto de datos; ver sembrar()."""
+
+    # Orden de escritura de cada tanda (las FK apuntan hacia arriba).
+    ORDEN = (Vendedor, Cliente, Proveedor, Producto, Factura, DetalleFactura, Pedido,
+             DetallePedido, FacturaDetallePedido, DetallePedido.facturas.through,
+             AjusteInventario, EntradaProducto, StockResumen, VentaDiaria)
+
+    def __init__(self, cantidades, perfil=None, semilla=1, prefijo='SIN', hasta=None,
+                 escribir=escribir_bulk):
+        self.perfil = perfil or PERFIL_BASE
+        self.cantidades = cantidades
+        self.rng = random.Random(semilla)
+        self.prefijo = prefijo
+        self.hasta = hasta or timezone.localdate()
+        self.escribir = escribir
+        # make_aware por cada fecha pasa por el timezone activo (thread local).
+        self.zona = timezone.get_current_timezone()
+        self.ids = _Ids()
+        self.pendientes = {modelo: [] for modelo in self.ORDEN}
+        self.escritas = {modelo: 0 for modelo in self.ORDEN}
+        self._en_espera = 0
+        p = self.perfil
+        self.sortear = {
+            nombre: _sorteo(self.rng, {k: v for k, v in p[nombre].items() if v})
+            for nombre in ('lineas_por_factura', 'unidades_por_lote', 'lineas_por_pedido',
+                           'unidades_por_linea', 'estados', 'kilos_merma')
+        }
+        # (fecha, producto, vendedor) -> [ventas, costo, kilos] en centesimos,
+        # de lineas no anuladas: lo que filas_venta_diaria sumaria.
+        self.ventas_diarias = {}
+
+    # -- escritura -----------------------------------------------------------
+
+    def _agregar(self, modelo, **fila):
+        self.pendientes[modelo].append(fila)
+        self._en_espera += 1
+        if self._en_espera >= TANDA:
+            self._vaciar()
+
+    def _vaciar(self):
+        for modelo in self.ORDEN:
+            filas = self.pendientes[modelo]
+            if filas:
+                self.escribir(modelo, filas)
+                self.escritas[modelo] += len(filas)
+                filas.clear()
+        self._en_espera = 0
+
+    # -- calendario ----------------------------------------------------------
+
+    def _momento(self, dia):
+        segundos = self.rng.randint(8 * 3600, 20 * 3600)
+        return datetime.combine(dia, time.min, self.zona) + timedelta(seconds=segundos)
+
+    def generar(self):
+        n = self.cantidades
+        p = self.perfil
+        rng = self.rng
+        desde = self.hasta - timedelta(days=p['dias'])
+
+        vendedores = []
+        for i in range(n['vendedores']):
+            vid = self.ids(Vendedor)
+            vendedores.append(vid)
+            self._agregar(Vendedor, id=vid, nombre=f"{self.prefijo} Vendedor {i + 1}",
+                          sigla=f"{self.prefijo[:4]}-{i + 1}")
+        # (id, vendedor)
+        self.clientes = []
+        for i in range(n['clientes']):
+            cliente = (self.ids(Cliente), vendedores[i % len(vendedores)])
+            self.clientes.append(cliente)
+            self._agregar(Cliente, id=cliente[0], nombre=f"{self.prefijo} Cliente {i + 1}",
+                          direccion='-', telefono='', vendedor_id=cliente[1])
+        proveedores = []
+        for i in range(n['proveedores']):
+            prid = self.ids(Proveedor)
+            proveedores.append(prid)
+            self._agregar(Proveedor, id=prid, nombre=f"{self.prefijo} Proveedor {i + 1}")
+        self.productos = []
+        for i in range(n['productos']):
+            pid = self.ids(Producto)
+            corte = rng.choice(p['cortes'])
+            self.productos.append({
+                'id': pid,
+                'precio': corte['precio'] * 100,
+                'costo': round(corte['precio'] * 100 / p['margen']),
+                'peso': corte['peso'],
+                'variacion': corte['variacion'],
+            })
+            self._agregar(Producto, id=pid, nombre=f"{self.prefijo} Corte {i + 1}",
+                          precio_por_kilo=Decimal(corte['precio']))
+
+        # Lotes vivos por producto, en orden FIFO:
+        # [id, factura, unidades, kilos (centesimos), costo/kg (centesimos), fecha]
+        # Los que quedan en cero por ambos lados son siempre los primeros (las
+        # unidades y los kilos se consumen desde el frente), asi que se
+        # descartan con popleft.
+        self.lotes = {prod['id']: deque() for prod in self.productos}
+        self.unidades = {prod['id']: 0 for prod in self.productos}
+        self.kilos = {prod['id']: 0 for prod in self.productos}
+        self.reservas = {prod['id']: 0 for prod in self.productos}
+
+        eventos = [(desde + timedelta(days=rng.randint(0, p['dias'])), 0) for _ in range(n['facturas'])]
+        eventos += [(desde + timedelta(days=rng.randint(0, p['dias'])), 1) for _ in range(n['pedidos'])]
+        eventos.sort()
+        numero = 0
+        for dia, tipo in eventos:
+            if tipo == 0:
+                numero += 1
+                self._factura(dia, numero, proveedores)
+            else:
+                self._pedido(dia)
+                if rng.random() < p['mermas_por_pedido']:
+                    self._merma(dia)
+
+        ahora = timezone.now()
+        for producto_id, lotes in self.lotes.items():
+            for lote_id, factura, unidades, kilos, costo, fecha in lotes:
+                self._agregar(EntradaProducto, id=lote_id, factura_id=factura, producto_id=producto_id,
+                              cantidad_unidades=unidades, cantidad_kilos=_centesimos(kilos),
+                              costo_por_kilo=_centesimos(costo), fecha_entrada=fecha)
+            self._agregar(StockResumen, producto_id=producto_id, disponibles=self.unidades[producto_id],
+                          kilos_actuales=_centesimos(self.kilos[producto_id]),
+                          reservas=Decimal(self.reservas[producto_id]), actualizado=ahora)
+        for (dia, producto_id, vendedor_id), (ventas, costo, kilos) in self.ventas_diarias.items():
+            self._agregar(VentaDiaria, id=self.ids(VentaDiaria), fecha=dia, producto_id=producto_id,
+                          vendedor_id=vendedor_id, ventas=_centesimos(ventas), costo=_centesimos(costo),
+                          kilos=_centesimos(kilos))
+        self._vaciar()
+
+    def _peso(self, producto, unidades):
+        """Kilos (centesimos) de ``unidades`` piezas de un lote o una linea: el
+        peso medio por unidad varia entre lotes como en el perfil."""
+        media = producto['peso']
+        por_unidad = max(0.05, self.rng.gauss(media, media * producto['variacion']))
+        return round(unidades * por_unidad * 100)
+
+    def _factura(self, dia, numero, proveedores):
+        rng = self.rng
+        numero_factura = f"{self.prefijo}-{numero:07d}"
+        productos = rng.sample(self.productos, min(self.sortear['lineas_por_factura'](), len(self.productos)))
+        fecha_entrada = datetime.combine(dia, time.min, self.zona)
+        subtotal = 0
+        detalles = []
+        for producto in productos:
+            unidades = self.sortear['unidades_por_lote']()
+            kilos = self._peso(producto, unidades)
+            costo = round(producto['costo'] * rng.uniform(0.95, 1.05))
+            total = kilos * costo // 100
+            subtotal += total
+            detalles.append({
+                'id': self.ids(DetalleFactura), 'factura_id': numero_factura, 'producto_id': producto['id'],
+                'cantidad_kilos': _centesimos(kilos), 'cantidad_unidades': unidades,
+                'costo_por_kilo': _centesimos(costo), 'costo_total': _centesimos(total),
+            })
+            lote_id = self.ids(EntradaProducto)
+            self.lotes[producto['id']].append([lote_id, numero_factura, unidades, kilos, costo, fecha_entrada])
+            self.unidades[producto['id']] += unidades
+            self.kilos[producto['id']] += kilos
+        iva = round(subtotal * 0.19)
+        self._agregar(Factura, numero_factura=numero_factura, proveedor_id=rng.choice(proveedores), fecha=dia,
+                      subtotal=_centesimos(subtotal), iva=_centesimos(iva), total=_centesimos(subtotal + iva))
+        for detalle in detalles:
+            self._agregar(DetalleFactura, **detalle)
+
+    def _consumir_unidades(self, producto_id, unidades):
+        """Como _planear_unidades: devuelve [(factura, unidades, kilos estimados
+        en centesimos, costo/kg)] y deja los lotes descontados."""
+        usados = []
+        self.unidades[producto_id] -= unidades
+        for lote in self.lotes[producto_id]:
+            if unidades <= 0:
+                break
+            if lote[2] <= 0:
+                continue
+            tomadas = min(lote[2], unidades)
+            usados.append((lote[1], tomadas, lote[3] * tomadas // lote[2], lote[4]))
+            lote[2] -= tomadas
+            unidades -= tomadas
+        return usados
+
+    def _consumir_kilos(self, producto_id, kilos):
+        """Como _planear_kilos (FIFO solo de kilos)."""
+        self.kilos[producto_id] -= kilos
+        for lote in self.lotes[producto_id]:
+            if kilos <= 0:
+                break
+            tomados = min(lote[3], kilos)
+            lote[3] -= tomados
+            kilos -= tomados
+
+    def _podar(self, producto_id):
+        lotes = self.lotes[producto_id]
+        while lotes and lotes[0][2] <= 0 and lotes[0][3] <= 0:
+            lotes.popleft()
+
+    def _pedido(self, dia):
+        rng = self.rng
+        estado = self.sortear['estados']()
+        cliente_id, vendedor_id = rng.choice(self.clientes)
+        con_stock = [prod for prod in self.productos if self.unidades[prod['id']] > 0]
+        if not con_stock:
+            return
+        pedido_id = self.ids(Pedido)
+        lineas = []
+        total_pedido = 0
+        for producto in rng.sample(con_stock, min(self.sortear['lineas_por_pedido'](), len(con_stock))):
+            pid = producto['id']
+            unidades = min(self.sortear['unidades_por_linea'](), self.unidades[pid])
+            pesado = estado != 'Reservado' and rng.random() >= self.perfil['sin_pesar']
+            kilos = self._peso(producto, unidades) if pesado else 0
+            if estado == 'Anulado':
+                usados = []
+                costo = producto['costo']
+            else:
+                usados = self._consumir_unidades(pid, unidades)
+                kilos_estimados = sum(u[2] for u in usados)
+                costo = (sum(u[2] * u[3] for u in usados) // kilos_estimados) if kilos_estimados else 0
+                if pesado:
+                    # El pesaje no puede llevarse mas kilos de los que hay.
+                    kilos = min(kilos, self.kilos[pid])
+                    self._consumir_kilos(pid, kilos)
+                self._podar(pid)
+            venta = kilos * producto['precio'] // 100
+            total_costo = kilos * costo // 100
+            total_pedido += venta
+            if estado != 'Anulado':
+                if kilos == 0:
+                    self.reservas[pid] += unidades
+                suma = self.ventas_diarias.setdefault((dia, pid, vendedor_id), [0, 0, 0])
+                suma[0] += venta
+                suma[1] += total_costo
+                suma[2] += kilos
+            detalle_id = self.ids(DetallePedido)
+            lineas.append((DetallePedido, {
+                'id': detalle_id, 'pedido_id': pedido_id, 'producto_id': pid,
+                'cantidad_unidades': Decimal(unidades), 'cantidad_kilos': _centesimos(kilos),
+                'precio_venta': _centesimos(producto['precio']), 'costo_por_kilo': _centesimos(costo),
+                'total_venta': _centesimos(venta), 'total_costo': _centesimos(total_costo),
+                'margen': _centesimos(venta - total_costo), 'fecha': dia,
+            }))
+            por_factura = {}
+            for factura, tomadas, _k, _c in usados:
+                por_factura[factura] = por_factura.get(factura, 0) + tomadas
+            for factura, tomadas in por_factura.items():
+                lineas.append((FacturaDetallePedido, {
+                    'id': self.ids(FacturaDetallePedido), 'detallepedido_id': detalle_id,
+                    'factura_id': factura, 'cantidad_unidades': tomadas,
+                }))
+                lineas.append((DetallePedido.facturas.through, {
+                    'id': self.ids(DetallePedido.facturas.through), 'detallepedido_id': detalle_id,
+                    'factura_id': factura,
+                }))
+        self._agregar(Pedido, id=pedido_id, cliente_id=cliente_id, vendedor_id=vendedor_id,
+                      fecha=self._momento(dia), estado=estado, total=_centesimos(total_pedido))
+        for modelo, fila in lineas:
+            self._agregar(modelo, **fila)
+
+    def _merma(self, dia):
+        con_kilos = [prod for prod in self.productos if self.kilos[prod['id']] > 0]
+        if not con_kilos:
+            return
+        pid = self.rng.choice(con_kilos)['id']
+        kilos = min(round(self.sortear['kilos_merma']() * 100), self.kilos[pid])
+        self._consumir_kilos(pid, kilos)
+        self._podar(pid)
+        self._agregar(AjusteInventario, id=self.ids(AjusteInventario), producto_id=pid, tipo='merma',
+                      cantidad=-_centesimos(kilos), cantidad_unidades=0, razon='Sintetico', fecha=dia)
+
+    def terminar(self, en_base=True):
+        """Ajusta las secuencias de PostgreSQL si se escribio en la base (los
+        ids se pusieron a mano); devuelve las filas escritas por tabla."""
+        if en_base and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), list(self.ORDEN)):
+                    cursor.execute(sql)
+        return {modelo._meta.db_table: filas for modelo, filas in self.escritas.items()}
+
+
+def sembrar(cantidades, perfil=None, semilla=1, prefijo='SIN', escribir=escribir_bulk, en_base=True):
+    """Genera y escribe un conjunto de datos sinteticos con ``cantidades``
+    ({'vendedores', 'clientes', 'proveedores', 'productos', 'facturas',
+    'pedidos'}) y la forma de ``perfil`` (PERFIL_BASE por defecto). Si escribe
+    en la base debe correr dentro de una transaccion. Devuelve las filas
+    escritas por tabla."""
+    generador = Generador(cantidades, perfil=perfil, semilla=semilla, prefijo=prefijo, escribir=escribir)
+    with _fechas_libres(Pedido, DetallePedido, AjusteInventario):
+        generador.generar()
+    return generador.terminar(en_base=en_base)
@@ -1,3 +1,345 @@
-from django.test import TestCase
+import threading
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.db.models import Min, Sum
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from core import views
+from core.models import (
+    Cliente, DetallePedido, EntradaProducto, Factura, FacturaDetallePedido,
+    Pedido, Producto, Proveedor, StockResumen, Vendedor,
+)
+from core.utils import actualizar_stock_resumen, calcular_stock
+from core.views import ActualizarKilosPedido, CancelarPedido, CrearPedido, PedidoDetailView
+
+
+class StockConsultasTests(TestCase):
+    """GET /api/stock/ (con la foto StockResumen y con ?fuente=ledger) y
+    calcular_stock corren un numero CONSTANTE de consultas sin importar
+    cuantos productos tenga el catalogo. Si alguien vuelve a meter un
+    agregado por producto dentro del loop, el conteo crece con el catalogo y
+    la prueba falla."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = get_user_model().objects.create_user(username='stock', is_staff=True)
+        proveedor = Proveedor.objects.create(nombre='Proveedor')
+        vendedor = Vendedor.objects.create(nombre='Vendedor', sigla='VE')
+        cliente = Cliente.objects.create(nombre='Cliente', direccion='-', vendedor=vendedor)
+        cls.factura = Factura.objects.create(
+            numero_factura='F-STOCK', proveedor=proveedor,
+            fecha=timezone.now().date(), subtotal=0, iva=0, total=0,
+        )
+        cls.pedido = Pedido.objects.create(cliente=cliente, vendedor=vendedor, total=0)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def _sembrar(self, cantidad):
+        productos = Producto.objects.bulk_create([
+            Producto(nombre=f"Producto {i}", precio_por_kilo=Decimal('10000'))
+            for i in range(cantidad)
+        ])
+        EntradaProducto.objects.bulk_create([
+            EntradaProducto(
+                factura=self.factura, producto=producto,
+                cantidad_unidades=4 + j, cantidad_kilos=Decimal(8 + 2 * j),
+                costo_por_kilo=Decimal('5000'),
+                fecha_entrada=timezone.now() + timezone.timedelta(seconds=j),
+            )
+            for producto in productos for j in range(3)
+        ])
+        # Una reserva (linea sin pesar) por producto, para que el filtro de
+        # reservas tambien participe.
+        DetallePedido.objects.bulk_create([
+            DetallePedido(
+                pedido=self.pedido, producto=producto, cantidad_unidades=1,
+                cantidad_kilos=0, precio_venta=0, costo_por_kilo=0,
+            )
+            for producto in productos
+        ])
+        actualizar_stock_resumen(p.id for p in productos)
+        return productos
+
+    def _comprobar(self, cantidad):
+        productos = self._sembrar(cantidad)
+        with self.assertNumQueries(1):
+            foto = self.client.get('/api/stock/')
+        with self.assertNumQueries(1):
+            ledger = self.client.get('/api/stock/?fuente=ledger')
+        with self.assertNumQueries(1):
+            calcular_stock([p.id for p in productos])
+
+        self.assertEqual(foto.status_code, 200)
+        self.assertEqual(len(foto.data), cantidad)
+        self.assertEqual(foto.data, ledger.data)
+
+    def test_un_producto(self):
+        self._comprobar(1)
+
+    def test_muchos_productos(self):
+        self._comprobar(50)
+
+
+class ImportarFacturasTests(TestCase):
+    """POST /api/facturas/importar/ con CSV (UTF-8 o Windows-1252, como lo
+    guarda Excel es-CL) y con numeros repetidos: todo o nada, y los errores
+    de cada factura vuelven como 400, nunca como 500."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = get_user_model().objects.create_user(username='importar', is_staff=True)
+        cls.proveedor = Proveedor.objects.create(nombre='Proveedor')
+        cls.producto = Producto.objects.create(nombre='Lomo', precio_por_kilo=Decimal('10000'))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def _csv(self, numeros):
+        filas = ['numero_factura;proveedor;fecha;producto;cantidad_kilos;cantidad_unidades;costo_por_kilo']
+        filas += [f'{n};{self.proveedor.id};2026-03-02;{self.producto.id};10.5;3;5000' for n in numeros]
+        return '\r\n'.join(filas) + '\r\n'
+
+    def _subir(self, contenido):
+        archivo = SimpleUploadedFile('facturas.csv', contenido, content_type='text/csv')
+        return self.client.post('/api/facturas/importar/', {'archivo': archivo}, format='multipart')
+
+    def test_csv_utf8(self):
+        respuesta = self._subir(self._csv(['A-1', 'A-2']).encode('utf-8-sig'))
+        self.assertEqual(respuesta.status_code, 201, respuesta.data)
+        self.assertEqual(respuesta.data['facturas'], ['A-1', 'A-2'])
+        self.assertEqual(EntradaProducto.objects.filter(producto=self.producto).count(), 2)
+        factura = Factura.objects.get(numero_factura='A-1')
+        self.assertEqual((factura.subtotal, factura.iva, factura.total),
+                         (Decimal('52500'), Decimal('9975'), Decimal('62475')))
+
+    def test_csv_windows_1252(self):
+        respuesta = self._subir(self._csv(['NÑ-1']).encode('cp1252'))
+        self.assertEqual(respuesta.status_code, 201, respuesta.data)
+        self.assertTrue(Factura.objects.filter(numero_factura='NÑ-1').exists())
+
+    def test_csv_ilegible(self):
+        respuesta = self._subir(self._csv(['B-1']).encode('utf-8') + b'\x81\x8d')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('UTF-8', respuesta.data['error'])
+        self.assertFalse(Factura.objects.exists())
+
+    def _json(self, numeros):
+        return {'facturas': [{
+            'numero_factura': n, 'proveedor': self.proveedor.id, 'fecha': '2026-03-02',
+            'detalles': [{'producto': self.producto.id, 'cantidad_kilos': 4,
+                          'cantidad_unidades': 2, 'costo_por_kilo': 5000}],
+        } for n in numeros]}
+
+    def test_numero_repetido_como_numero_y_texto(self):
+        respuesta = self.client.post('/api/facturas/importar/', self._json([777001, '777001']), format='json')
+        self.assertEqual(respuesta.status_code, 400, respuesta.data)
+        self.assertEqual([e['indice'] for e in respuesta.data['errores']], [1])
+        self.assertFalse(Factura.objects.exists())
+
+    def test_numero_ya_registrado(self):
+        Factura.objects.create(numero_factura='777002', proveedor=self.proveedor,
+                               fecha=timezone.now().date(), subtotal=0, iva=0, total=0)
+        respuesta = self.client.post('/api/facturas/importar/', self._json([' 777002 ']), format='json')
+        self.assertEqual(respuesta.status_code, 400, respuesta.data)
+        self.assertEqual(respuesta.data['errores'][0]['numero_factura'], '777002')
+
+    def test_numero_registrado_despues_del_chequeo(self):
+        # Otro request inserta el numero entre el chequeo y el INSERT: el
+        # chequeo no lo ve y el INSERT choca con la PK.
+        Factura.objects.create(numero_factura='777003', proveedor=self.proveedor,
+                               fecha=timezone.now().date(), subtotal=0, iva=0, total=0)
+        real = views._facturas_existentes
+        with mock.patch('core.views._facturas_existentes', side_effect=[set(), real(['777003'])]):
+            respuesta = self.client.post('/api/facturas/importar/', self._json(['777004', '777003']),
+                                         format='json')
+        self.assertEqual(respuesta.status_code, 400, respuesta.data)
+        self.assertEqual(respuesta.data['errores'],
+                         [{'indice': 1, 'numero_factura': '777003', 'error': 'La factura 777003 ya existe'}])
+        self.assertFalse(Factura.objects.filter(numero_factura='777004').exists())
+        self.assertFalse(EntradaProducto.objects.exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', "Necesita PostgreSQL (bloqueo de filas real).")
+class PedidosConcurrentesTests(TransactionTestCase):
+    """Dispara pedidos EN PARALELO (un hilo y una conexion a la base por
+    pedido) que compiten por las mismas unidades, y verifica las invariantes
+    que protege bloquear_ledger (utils.py):
+      - ningun lote de EntradaProducto queda con unidades o kilos negativos,
+      - vendido + stock vivo = stock inicial (no se pierde ni se inventa stock),
+      - se aceptan exactamente los pedidos para los que alcanza el stock,
+      - cada pedido aceptado tiene sus links FacturaDetallePedido completos,
+      - la foto StockResumen termina igual al ledger,
+      - ningun pedido termina en error de base (deadlock, serializacion).
+
+    Con dos productos la mitad de los pedidos manda las lineas en orden
+    inverso, para ejercitar el orden determinista de los candados (un pedido
+    A+B contra otro B+A); test_anulacion_contra_edicion cruza una anulacion
+    con una edicion y un pesaje del mismo pedido. En SQLite los SELECT ... FOR UPDATE se ignoran y
+    los hilos se pisan con "database is locked": ahi se saltea."""
+
+    PEDIDOS = 20
+    STOCK = 15
+    UNIDADES = 2
+    LOTES = 5
+
+    def _escenario(self, n_productos):
+        proveedor = Proveedor.objects.create(nombre='Proveedor')
+        vendedor = Vendedor.objects.create(nombre='Vendedor', sigla='VE')
+        self.cliente = Cliente.objects.create(nombre='Cliente', direccion='-', vendedor=vendedor)
+        self.usuario = get_user_model().objects.create_user(username='estres', is_staff=True)
+        self.productos = [
+            Producto.objects.create(nombre=f"Producto {i}", precio_por_kilo=Decimal('10000'))
+            for i in range(n_productos)
+        ]
+        for j in range(self.LOTES):
+            factura = Factura.objects.create(
+                numero_factura=f"F-{j}", proveedor=proveedor,
+                fecha=timezone.now().date(), subtotal=0, iva=0, total=0,
+            )
+            unidades = self.STOCK // self.LOTES + (1 if j < self.STOCK % self.LOTES else 0)
+            for producto in self.productos:
+                EntradaProducto.objects.create(
+                    factura=factura, producto=producto,
+                    cantidad_unidades=unidades,
+                    cantidad_kilos=Decimal(unidades * 2),
+                    costo_por_kilo=Decimal(5000 + j * 100),
+                    fecha_entrada=timezone.now() + timezone.timedelta(seconds=j),
+                )
+
+    def _en_paralelo(self, llamadas):
+        """Corre cada ``(vista, request, kwargs)`` en su propio hilo, todas a
+        la vez; devuelve ``(status, data)`` de cada una, en orden."""
+        barrera = threading.Barrier(len(llamadas))
+        resultados = [None] * len(llamadas)
+
+        def correr(i, vista, request, kwargs):
+            force_authenticate(request, user=self.usuario)
+            try:
+                barrera.wait()
+                respuesta = vista(request, **kwargs)
+                resultados[i] = (respuesta.status_code, respuesta.data)
+            except Exception as e:  # el hilo nunca debe morir en silencio
+                resultados[i] = (None, str(e))
+            finally:
+                connections.close_all()
+
+        hilos = [threading.Thread(target=correr, args=(i, *llamada)) for i, llamada in enumerate(llamadas)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        return resultados
+
+    def _disparar(self):
+        factory = APIRequestFactory()
+        vista = CrearPedido.as_view()
+        llamadas = []
+        for i in range(self.PEDIDOS):
+            productos = self.productos[::-1] if i % 2 else self.productos
+            payload = {
+                'cliente': self.cliente.id,
+                'detalles': [
+                    {'producto': p.id, 'cantidad_unidades': self.UNIDADES,
+                     'cantidad_kilos': self.UNIDADES * 2 if i % 3 else 0}
+                    for p in productos
+                ],
+            }
+            llamadas.append((vista, factory.post('/api/pedidos/crear/', payload, format='json'), {}))
+        return self._en_paralelo(llamadas)
+
+    def _comprobar(self, n_productos):
+        self._escenario(n_productos)
+        resultados = self._disparar()
+
+        aceptados = [r for r in resultados if r[0] == 201]
+        errores = [
+            r for r in resultados
+            if r[0] != 201 and not (r[0] == 400 and 'stock' in str(r[1].get('error', '')).lower())
+        ]
+        self.assertEqual(errores, [])
+        self.assertEqual(len(aceptados), min(self.PEDIDOS, self.STOCK // self.UNIDADES))
+
+        for producto in self.productos:
+            with self.subTest(producto=producto.nombre):
+                lotes = EntradaProducto.objects.filter(producto=producto)
+                minimos = lotes.aggregate(u=Min('cantidad_unidades'), k=Min('cantidad_kilos'))
+                vivas = lotes.aggregate(t=Sum('cantidad_unidades'))['t'] or 0
+                vendidas = DetallePedido.objects.filter(producto=producto).aggregate(
+                    t=Sum('cantidad_unidades'))['t'] or 0
+                linkeadas = FacturaDetallePedido.objects.filter(
+                    detallepedido__producto=producto).aggregate(t=Sum('cantidad_unidades'))['t'] or 0
+
+                self.assertGreaterEqual(minimos['u'] or 0, 0)
+                self.assertGreaterEqual(minimos['k'] or 0, 0)
+                self.assertEqual(vendidas + vivas, self.STOCK)
+                self.assertEqual(linkeadas, vendidas)
+                self.assertEqual(StockResumen.objects.get(producto=producto).disponibles, vivas)
+
+    def test_un_producto(self):
+        self._comprobar(1)
+
+    def test_orden_de_candados(self):
+        self._comprobar(2)
+
+    def test_anulacion_contra_edicion(self):
+        """Anular un pedido mientras se edita y se pesa: los tres toman los
+        candados en el mismo orden (pedido y despues productos), asi que no
+        hay deadlock, y la edicion no puede pisar la anulacion con un estado
+        viejo ni mover el ledger de un pedido ya anulado."""
+        self._escenario(1)
+        producto = self.productos[0]
+        factory = APIRequestFactory()
+        pedidos = []
+        for _ in range(5):
+            request = factory.post('/api/pedidos/crear/', {
+                'cliente': self.cliente.id,
+                'detalles': [{'producto': producto.id, 'cantidad_unidades': 2, 'cantidad_kilos': 0}],
+            }, format='json')
+            force_authenticate(request, user=self.usuario)
+            respuesta = CrearPedido.as_view()(request)
+            self.assertEqual(respuesta.status_code, 201, respuesta.data)
+            pedidos.append(respuesta.data['id'])
+
+        llamadas = []
+        for pedido_id in pedidos:
+            llamadas += [
+                (CancelarPedido.as_view(),
+                 factory.post('/api/pedidos/cancelar/', {'pedido_id': pedido_id}, format='json'), {}),
+                (PedidoDetailView.as_view(),
+                 factory.put(f'/api/pedidos/{pedido_id}/', {'detalles': [
+                     {'producto': producto.id, 'cantidad_unidades': 3, 'cantidad_kilos': 6}]}, format='json'),
+                 {'pk': pedido_id}),
+                (ActualizarKilosPedido.as_view(),
+                 factory.post(f'/api/pedidos/actualizar_kilos/{pedido_id}/', {'detalles': [
+                     {'producto': producto.id, 'cantidad_kilos': 3}]}, format='json'),
+                 {'pedido_id': pedido_id}),
+            ]
+        # Los kilos por unidad (3/2, 3/3, 6/3) son exactos con dos decimales:
+        # la anulacion devuelve kilos proporcionales a las unidades de cada
+        # factura y un peso como 4/3 perderia centesimos en el redondeo.
+        resultados = self._en_paralelo(llamadas)
+
+        errores = [
+            r for r in resultados
+            if r[0] != 200 and not (r[0] == 400 and 'anulado' in str(r[1].get('error', '')).lower())
+        ]
+        self.assertEqual(errores, [])
+        self.assertEqual(
+            list(Pedido.objects.filter(id__in=pedidos).values_list('estado', flat=True).distinct()),
+            ['Anulado'])
+
+        # Todo lo que salio del ledger volvio con la anulacion.
+        ledger = EntradaProducto.objects.filter(producto=producto).aggregate(
+            u=Sum('cantidad_unidades'), k=Sum('cantidad_kilos'))
+        self.assertEqual(ledger['u'], self.STOCK)
+        self.assertEqual(ledger['k'], self.STOCK * 2)
+        self.assertEqual(StockResumen.objects.get(producto=producto).disponibles, self.STOCK)
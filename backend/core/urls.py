@@ -1,7 +1,7 @@
 from django.conf import settings
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView
-from .views import MyTokenObtainPairView, UpdateCliente,PagoVendedorView,ProductosView,PedidoDetailView, PedidoListView,ProveedorListView, CrearPedido, ActualizarKilosPedido, ClienteListView, CrearCliente, CrearFacturaEntrada, FacturaListView, UpdateFacturaEntrada, CrearPagoFactura, CancelarPedido, ObtenerPedido, StockProductos, VendedorListView, CrearProducto, UpdateProducto, DetallePedidosList, DetalleFacturasList, ReporteGananciasView, ReportePerdidasView, FluctuacionPreciosView, MargenActualProductoView, HistorialPrecioProductoView, AjusteInventarioListView, CrearAjusteInventario, RentabilidadHistoricaView
+from .views import MyTokenObtainPairView, UpdateCliente,PagoVendedorView,ProductosView,PedidoDetailView, PedidoListView,ProveedorListView, CrearPedido, ActualizarKilosPedido, ClienteListView, CrearCliente, CrearFacturaEntrada, FacturaListView, UpdateFacturaEntrada, CrearPagoFactura, CancelarPedido, ObtenerPedido, StockProductos, VendedorListView, CrearProducto, UpdateProducto, DetallePedidosList, DetalleFacturasList, ReporteGananciasView, ReportePerdidasView, FluctuacionPreciosView, MargenActualProductoView, HistorialPrecioProductoView, AjusteInventarioListView, CrearAjusteInventario, RentabilidadHistoricaView, ReportesCacheView, ExportarDetallePedidos, ExportarDetalleFacturas, ImportarFacturas
 
 urlpatterns = [
     path('productos/', ProductosView.as_view(), name='productos'),
@@ -16,6 +16,7 @@ urlpatterns = [
     path('facturas/crear/', CrearFacturaEntrada.as_view(), name='crear_factura'),
     path('facturas/', FacturaListView.as_view(), name='facturas'),
     path('facturas/pagar/', CrearPagoFactura.as_view(), name='pagar_factura'),
+    path('facturas/importar/', ImportarFacturas.as_view(), name='importar_facturas'),
     path('facturas/<str:numero_factura>/', UpdateFacturaEntrada.as_view(), name='actualizar_factura'),
     path('pedidos/cancelar/', CancelarPedido.as_view(), name='cancelar_pedido'),
     path('stock/', StockProductos.as_view(), name='stock_productos'),
@@ -26,6 +27,8 @@ urlpatterns = [
     path('pedidos/<int:pk>/', PedidoDetailView.as_view(), name='pedido-detail'),
     path('inventario/detalle-pedidos/', DetallePedidosList.as_view(), name='detalle-pedidos-list'),
     path('inventario/detalle-facturas/', DetalleFacturasList.as_view(), name='detalle-facturas-list'),
+    path('inventario/detalle-pedidos/exportar/', ExportarDetallePedidos.as_view(), name='exportar-detalle-pedidos'),
+    path('inventario/detalle-facturas/exportar/', ExportarDetalleFacturas.as_view(), name='exportar-detalle-facturas'),
     path('inventario/ajustes/', AjusteInventarioListView.as_view(), name='ajustes-inventario-list'),
     path('inventario/ajustes/crear/', CrearAjusteInventario.as_view(), name='crear_ajuste_inventario'),
     path('pagos-vendedor/', PagoVendedorView.as_view(), name='pagos_vendedor'),
@@ -34,6 +37,7 @@ urlpatterns = [
     path('reportes/fluctuacion-precios/', FluctuacionPreciosView.as_view(), name='reporte_fluctuacion'),
     path('reportes/margen-productos/', MargenActualProductoView.as_view(), name='reporte_margen_productos'),
     path('reportes/rentabilidad-historica/', RentabilidadHistoricaView.as_view(), name='reporte_rentabilidad_historica'),
+    path('reportes/cache/', ReportesCacheView.as_view(), name='reportes_cache'),
     path('clientes/<int:pk>/', UpdateCliente.as_view(), name='actualizar_cliente'),
     path('token/', MyTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
@@ -1,9 +1,14 @@
 from decimal import Decimal
 
-from django.db.models import Sum
+from django.db.models import DecimalField, ExpressionWrapper, F, IntegerField, OuterRef, Q, Subquery, Sum, Window
+from django.db.models.functions import Cast, Coalesce, NullIf
 from rest_framework.exceptions import ValidationError
 
-from .models import EntradaProducto, FacturaDetallePedido, DetalleFactura
+from .metricas import observar_lectura_fifo, registrar_faltante_kilos
+from .models import EntradaProducto, FacturaDetallePedido, DetalleFactura, DetallePedido, Producto, StockResumen, VentaDiaria
+
+# Tope de ids por consulta IN (PostgreSQL acepta hasta 65535 parametros).
+LOTE_IDS = 5000
 
 
 def costo_por_kilo_ponderado(detalle):
@@ -18,19 +23,255 @@ def costo_por_kilo_ponderado(detalle):
 
     Devuelve None si la linea no tiene ninguna factura vinculada.
     """
-    suma_costo = Decimal('0')
-    suma_unidades = 0
-    for link in FacturaDetallePedido.objects.filter(detallepedido=detalle):
-        df = DetalleFactura.objects.filter(
-            factura=link.factura_id, producto=detalle.producto_id
-        ).first()
-        if not df:
-            continue
-        suma_costo += Decimal(link.cantidad_unidades) * df.costo_por_kilo
-        suma_unidades += link.cantidad_unidades
-    if suma_unidades == 0:
-        return None
-    return suma_costo / suma_unidades
+    return costos_por_kilo_ponderados([detalle.pk]).get(detalle.pk)
+
+
+def costos_por_kilo_ponderados(detalle_ids):
+    """Version por lote de costo_por_kilo_ponderado: ``{detalle_id: costo/kg}``
+    para todas las lineas de ``detalle_ids`` en UNA consulta.
+
+    Lee los links FacturaDetallePedido de todas las lineas juntos y les cruza
+    el costo/kg del DetalleFactura de su (factura, producto) en la misma
+    consulta, en vez de un lookup por link. Las lineas sin ninguna factura
+    vinculada (o cuyas facturas no tienen DetalleFactura del producto) no
+    aparecen en el resultado.
+    """
+    ids = {int(pk) for pk in detalle_ids if pk is not None}
+    if not ids:
+        return {}
+
+    # Igual que el .first() de antes: si una factura repite el producto en
+    # varias lineas, manda la de menor id.
+    costo_lote = (
+        DetalleFactura.objects.filter(
+            factura=OuterRef('factura_id'),
+            producto=OuterRef('detallepedido__producto_id'),
+        )
+        .order_by('id')
+        .values('costo_por_kilo')[:1]
+    )
+    links = (
+        FacturaDetallePedido.objects.filter(detallepedido_id__in=ids)
+        .annotate(costo_lote=Subquery(costo_lote))
+        .filter(costo_lote__isnull=False)
+        .values_list('detallepedido_id', 'cantidad_unidades', 'costo_lote')
+    )
+
+    sumas = {}
+    for detalle_id, unidades, costo in links:
+        suma_costo, suma_unidades = sumas.get(detalle_id, (Decimal('0'), 0))
+        sumas[detalle_id] = (
+            suma_costo + Decimal(unidades) * costo,
+            suma_unidades + unidades,
+        )
+    return {
+        detalle_id: suma_costo / suma_unidades
+        for detalle_id, (suma_costo, suma_unidades) in sumas.items()
+        if suma_unidades != 0
+    }
+
+
+def bloquear_ledger(producto_ids):
+    """Toma el candado del ledger de cada producto en ``producto_ids`` y
+    devuelve ``{id: Producto}`` con los que existen.
+
+    El candado es la fila de ``Producto`` (SELECT ... FOR NO KEY UPDATE) y se
+    mantiene hasta el final de la transaccion de quien llama, asi que solo
+    sirve dentro de ``transaction.atomic()``. Dos pedidos que venden el mismo
+    corte se atienden uno detras del otro (el chequeo de stock de CrearPedido
+    y el consumo FIFO ven el mismo ledger), pero pedidos de cortes distintos
+    siguen corriendo en paralelo.
+
+    Los candados se piden SIEMPRE en orden de id: un pedido A+B y otro B+A
+    esperan por A en el mismo orden en vez de bloquearse mutuamente. NO KEY
+    (y no FOR UPDATE a secas) para no frenar los INSERT que solo referencian
+    al producto por FK, como los lotes de una factura nueva.
+    """
+    ids = sorted({int(pid) for pid in producto_ids if pid is not None})
+    if not ids:
+        return {}
+    return Producto.objects.select_for_update(no_key=True).order_by('id').in_bulk(ids)
+
+
+def anotar_stock(productos):
+    """Anota sobre un queryset de ``Producto`` su stock calculado desde el
+    ledger, en la MISMA consulta (subconsultas correlacionadas por producto):
+
+      - ``stock_disponibles``: Sum(EntradaProducto.cantidad_unidades), lo que
+        valida CrearPedido.
+      - ``stock_kilos``: Sum(EntradaProducto.cantidad_kilos).
+      - ``stock_reservas``: unidades de lineas no anuladas y sin pesar
+        (DetallePedido), que ya salieron del ledger pero siguen en la camara.
+
+    Cada subconsulta usa el indice por producto, asi que el costo crece con
+    los lotes de cada producto y no con la cantidad de consultas.
+    """
+    def _suma(qs, campo, output_field):
+        return Coalesce(
+            Subquery(
+                qs.values('producto').annotate(t=Sum(campo)).values('t'),
+                output_field=output_field,
+            ),
+            0,
+            output_field=output_field,
+        )
+
+    entradas = EntradaProducto.objects.filter(producto=OuterRef('pk'))
+    reservas = (
+        DetallePedido.objects.filter(producto=OuterRef('pk'), cantidad_kilos=0)
+        .exclude(pedido__estado="Anulado")
+    )
+    decimal = DecimalField(max_digits=12, decimal_places=2)
+    return productos.annotate(
+        stock_disponibles=_suma(entradas, 'cantidad_unidades', IntegerField()),
+        stock_kilos=_suma(entradas, 'cantidad_kilos', decimal),
+        stock_reservas=_suma(reservas, 'cantidad_unidades', decimal),
+    )
+
+
+def calcular_stock(producto_ids):
+    """Stock de cada producto en ``producto_ids`` calculado desde el ledger
+    (una sola consulta, ver anotar_stock):
+    ``{producto_id: {'disponibles', 'kilos_actuales', 'reservas'}}``.
+    """
+    ids = sorted({int(pid) for pid in producto_ids if pid is not None})
+    if not ids:
+        return {}
+    return {
+        r['id']: {
+            'disponibles': r['stock_disponibles'],
+            'kilos_actuales': r['stock_kilos'],
+            'reservas': r['stock_reservas'],
+        }
+        for r in anotar_stock(Producto.objects.filter(id__in=ids)).values(
+            'id', 'stock_disponibles', 'stock_kilos', 'stock_reservas'
+        )
+    }
+
+
+def actualizar_stock_resumen(producto_ids):
+    """Recalcula desde el ledger (calcular_stock) la fila de ``StockResumen``
+    de cada producto en ``producto_ids``, con un solo upsert.
+
+    Se recalcula en vez de sumar/restar deltas para que la foto nunca pueda
+    derivar del ledger. Hay que llamarla al FINAL de la transaccion que movio
+    el stock y con el candado de esos productos tomado (bloquear_ledger): las
+    reservas dependen de los DetallePedido que la vista crea despues de
+    consumir_fifo, y sin el candado dos transacciones podrian pisarse la foto
+    con lecturas viejas.
+    """
+    stock = calcular_stock(producto_ids)
+    if not stock:
+        return
+    StockResumen.objects.bulk_create(
+        [StockResumen(producto_id=pid, **valores) for pid, valores in stock.items()],
+        update_conflicts=True,
+        unique_fields=['producto'],
+        update_fields=['disponibles', 'kilos_actuales', 'reservas', 'actualizado'],
+    )
+
+
+def claves_venta_diaria(pedido_ids):
+    """Claves ``(fecha, producto_id, vendedor_id)`` de VentaDiaria que tocan
+    las lineas de ``pedido_ids`` (anuladas o no: anular un pedido tambien
+    cambia sus claves)."""
+    ids = {int(pk) for pk in pedido_ids if pk is not None}
+    if not ids:
+        return set()
+    return set(
+        DetallePedido.objects.filter(pedido_id__in=ids)
+        .values_list('fecha', 'producto_id', 'pedido__vendedor_id')
+    )
+
+
+def filas_venta_diaria(detalles):
+    """Sumas por ``(fecha, producto, vendedor)`` de un queryset de
+    DetallePedido, sin las lineas de pedidos anulados, como filas
+    VentaDiaria sin guardar."""
+    return [
+        VentaDiaria(
+            fecha=r['fecha'],
+            producto_id=r['producto_id'],
+            vendedor_id=r['pedido__vendedor_id'],
+            ventas=r['ventas'],
+            costo=r['costo'],
+            kilos=r['kilos'],
+        )
+        for r in detalles.exclude(pedido__estado="Anulado")
+        .values('fecha', 'producto_id', 'pedido__vendedor_id')
+        .annotate(
+            ventas=Coalesce(Sum('total_venta'), Decimal('0')),
+            costo=Coalesce(Sum('total_costo'), Decimal('0')),
+            kilos=Coalesce(Sum('cantidad_kilos'), Decimal('0')),
+        )
+        .order_by()
+    ]
+
+
+def actualizar_venta_diaria(claves):
+    """Recalcula desde DetallePedido las filas de VentaDiaria de ``claves``
+    (``(fecha, producto_id, vendedor_id)``, ver claves_venta_diaria): borra
+    las filas de esas claves y reinserta las sumas actuales. Una clave que ya
+    no tiene ventas no anuladas queda sin fila.
+
+    Como actualizar_stock_resumen, se llama al final de la transaccion que
+    cambio las lineas y bajo el candado de sus productos (bloquear_ledger),
+    asi que dos transacciones nunca recalculan la misma clave a la vez.
+    """
+    claves = set(claves)
+    if not claves:
+        return
+    por_clave = Q()
+    for fecha, producto_id, vendedor_id in claves:
+        por_clave |= Q(fecha=fecha, producto_id=producto_id, pedido__vendedor_id=vendedor_id)
+    filas = filas_venta_diaria(DetallePedido.objects.filter(por_clave))
+
+    existentes = Q()
+    for fecha, producto_id, vendedor_id in claves:
+        existentes |= Q(fecha=fecha, producto_id=producto_id, vendedor_id=vendedor_id)
+    VentaDiaria.objects.filter(existentes).delete()
+    VentaDiaria.objects.bulk_create(filas)
+
+
+def _lotes_fifo(producto, campo, requerido, con_factura=False):
+    """Lotes vivos (``campo`` > 0) de ``producto`` en orden FIFO, bloqueados
+    con SELECT ... FOR UPDATE, limitados al PREFIJO que alcanza a cubrir
+    ``requerido``.
+
+    El prefijo se calcula en la base con una suma acumulada
+    ``SUM(campo) OVER (ORDER BY fecha_entrada, id)``: entra cada lote cuyo
+    acumulado ANTERIOR todavia no llega a lo pedido. Asi un producto con
+    cientos de lotes vivos (cada anulacion crea filas nuevas, ver
+    CancelarPedido) no se recorre entero cuando el primer lote ya alcanza.
+    El ``id`` desempata lotes con la misma fecha para que el acumulado sea
+    estricto.
+
+    Si entre el calculo del prefijo y el bloqueo otra transaccion consumio
+    parte de esos lotes, el prefijo ya no alcanza: en ese caso (y cuando de
+    verdad no hay stock) se vuelve a leer el ledger completo, para que quien
+    llama decida con la foto entera.
+    """
+    vivos = EntradaProducto.objects.filter(producto=producto, **{f'{campo}__gt': 0})
+    acumulado_previo = Window(
+        Sum(campo), order_by=[F('fecha_entrada').asc(), F('id').asc()]
+    ) - F(campo)
+    prefijo = (
+        vivos.annotate(acumulado_previo=acumulado_previo)
+        .filter(acumulado_previo__lt=requerido)
+        .values('pk')
+    )
+
+    # of=('self',) para bloquear solo EntradaProducto y no la Factura del join.
+    bloqueados = vivos.select_for_update(of=('self',)).order_by('fecha_entrada', 'id')
+    if con_factura:
+        bloqueados = bloqueados.select_related('factura')
+
+    lotes = list(bloqueados.filter(pk__in=prefijo))
+    relectura = sum(getattr(l, campo) for l in lotes) < requerido
+    if relectura:
+        lotes = list(bloqueados)
+    observar_lectura_fifo(campo, len(lotes), relectura)
+    return lotes
 
 
 def consumir_fifo(producto, unidades_a_consumir):
@@ -58,7 +299,38 @@ def consumir_fifo(producto, unidades_a_consumir):
     if unidades_a_consumir <= 0:
         return Decimal('0.00'), Decimal('0.00'), [], {}
 
-    entradas = EntradaProducto.objects.filter(producto=producto).order_by('fecha_entrada')
+    # Un solo SELECT ... FOR UPDATE trae (y bloquea) solo los lotes que hacen
+    # falta, con su factura (ver _lotes_fifo); el plan se arma en memoria y se
+    # aplica al final con un bulk_update + un DELETE, en vez de un
+    # save()/delete() por lote tocado.
+    entradas = _lotes_fifo(
+        producto, 'cantidad_unidades', unidades_a_consumir, con_factura=True
+    )
+    a_borrar, tocadas = set(), set()
+    costo_total, kilos_consumidos, facturas_usadas, facturas_cantidades, faltante = (
+        _planear_unidades(entradas, unidades_a_consumir, a_borrar, tocadas)
+    )
+
+    # Se valida ANTES de escribir: si no alcanza, el ledger queda intacto aunque
+    # quien llama no este dentro de una transaccion.
+    if faltante > 0:
+        raise ValidationError(
+            f"No hay stock disponible suficiente de '{producto.nombre}' para cubrir el pedido"
+        )
+
+    _aplicar_plan(entradas, a_borrar, ['cantidad_unidades'], tocadas)
+    return costo_total, kilos_consumidos, facturas_usadas, facturas_cantidades
+
+
+def _planear_unidades(entradas, unidades_a_consumir, a_borrar, tocadas):
+    """Consume en memoria ``unidades_a_consumir`` de ``entradas`` (lotes en
+    orden FIFO), agrega a ``tocadas`` los pk de los lotes modificados y a
+    ``a_borrar`` los de los que quedan sin nada que rastrear. No escribe en
+    la base: ver consumir_fifo.
+
+    Devuelve (costo_total, kilos_consumidos, facturas_usadas,
+    facturas_cantidades, faltante).
+    """
     costo_total = Decimal('0.00')
     kilos_consumidos = Decimal('0.00')
     cantidad_restante_unidades = Decimal(unidades_a_consumir)
@@ -68,13 +340,12 @@ def consumir_fifo(producto, unidades_a_consumir):
     for entrada in entradas:
         if cantidad_restante_unidades <= 0:
             break
+        # Lote ya vaciado por una linea anterior del mismo plan (ver
+        # consumir_fifo_pedido): una lectura nueva no lo traeria.
         if entrada.cantidad_unidades <= 0:
             continue
 
-        peso_promedio = (
-            entrada.cantidad_kilos / entrada.cantidad_unidades
-            if entrada.cantidad_unidades else Decimal('0.00')
-        )
+        peso_promedio = entrada.cantidad_kilos / entrada.cantidad_unidades
         unidades_consumidas = min(Decimal(entrada.cantidad_unidades), cantidad_restante_unidades)
         kilos_consumidos_lote = unidades_consumidas * peso_promedio
 
@@ -83,6 +354,7 @@ def consumir_fifo(producto, unidades_a_consumir):
 
         entrada.cantidad_unidades -= int(unidades_consumidas)
         cantidad_restante_unidades -= unidades_consumidas
+        tocadas.add(entrada.pk)
 
         facturas_usadas.append(entrada.factura)
         # OJO: Factura.numero_factura ES el primary key (ver models.py), no hay
@@ -96,16 +368,106 @@ def consumir_fifo(producto, unidades_a_consumir):
         # esos kilos son stock real que aun no se ha pesado en una venta, y
         # borrarlos aqui los haria desaparecer del inventario.
         if entrada.cantidad_unidades <= 0 and entrada.cantidad_kilos <= 0:
-            entrada.delete()
-        else:
-            entrada.save()
+            a_borrar.add(entrada.pk)
 
-    if cantidad_restante_unidades > 0:
-        raise ValidationError(
-            f"No hay stock disponible suficiente de '{producto.nombre}' para cubrir el pedido"
-        )
+    return (costo_total, kilos_consumidos, facturas_usadas, facturas_cantidades,
+            cantidad_restante_unidades)
 
-    return costo_total, kilos_consumidos, facturas_usadas, facturas_cantidades
+
+def _planear_kilos(entradas, kilos_a_descontar, tocadas):
+    """Descuenta en memoria ``kilos_a_descontar`` de ``entradas`` (lotes en
+    orden FIFO) y agrega a ``tocadas`` los pk de los lotes modificados. No
+    escribe en la base: ver descontar_kilos_fifo. Devuelve lo que falto.
+    """
+    restante = kilos_a_descontar
+    for entrada in entradas:
+        if restante <= 0:
+            break
+        if entrada.cantidad_kilos <= 0:
+            continue
+        tomados = min(entrada.cantidad_kilos, restante)
+        entrada.cantidad_kilos -= tomados
+        restante -= tomados
+        tocadas.add(entrada.pk)
+    return restante
+
+
+def _aplicar_plan(entradas, a_borrar, campos, tocadas):
+    """Escribe un plan armado en memoria: un bulk_update de ``campos`` para
+    los lotes ``tocadas`` que siguen vivos y un DELETE para ``a_borrar``."""
+    a_actualizar = [e for e in entradas if e.pk in tocadas and e.pk not in a_borrar]
+    if a_actualizar:
+        EntradaProducto.objects.bulk_update(a_actualizar, campos)
+    if a_borrar:
+        EntradaProducto.objects.filter(pk__in=a_borrar).delete()
+
+
+def consumir_fifo_pedido(lineas):
+    """consumir_fifo + descontar_kilos_fifo para TODAS las lineas de un
+    pedido, con una lectura del ledger por producto en vez de dos por linea.
+
+    ``lineas`` es una lista de ``(producto, unidades, kilos)`` en el orden del
+    pedido; ``kilos`` > 0 descuenta kilos con permitir_faltante=True (pedido
+    ya pesado, ver CrearPedido). Cada producto se lee una vez por campo con
+    el total que piden sus lineas (_lotes_fifo) y las lineas se consumen en
+    memoria en orden, sobre los MISMOS objetos de lote: el resultado es
+    identico a llamar a las dos funciones linea por linea. Al final se
+    escribe todo con un bulk_update y un DELETE.
+
+    Quien llama debe tener el candado de los productos (bloquear_ledger).
+    Devuelve, por linea y en el mismo orden, lo mismo que consumir_fifo:
+    (costo_total, kilos_consumidos, facturas_usadas, facturas_cantidades).
+    Lanza ValidationError, sin escribir nada, si alguna linea no alcanza.
+    """
+    unidades_por_producto = {}
+    kilos_por_producto = {}
+    productos = {}
+    for producto, unidades, kilos in lineas:
+        productos[producto.id] = producto
+        if unidades > 0:
+            unidades_por_producto[producto.id] = unidades_por_producto.get(producto.id, 0) + unidades
+        if kilos > 0:
+            kilos_por_producto[producto.id] = kilos_por_producto.get(producto.id, Decimal('0')) + kilos
+
+    lotes_unidades = {}
+    lotes_kilos = {}
+    por_pk = {}
+    for pid in sorted(productos):
+        if pid in unidades_por_producto:
+            lotes_unidades[pid] = _lotes_fifo(
+                productos[pid], 'cantidad_unidades', unidades_por_producto[pid], con_factura=True
+            )
+            por_pk.update((e.pk, e) for e in lotes_unidades[pid])
+        if pid in kilos_por_producto:
+            # Mismo objeto por fila: lo que una linea consume en unidades lo
+            # ve la siguiente al descontar kilos, y viceversa.
+            lotes_kilos[pid] = [
+                por_pk.setdefault(e.pk, e)
+                for e in _lotes_fifo(productos[pid], 'cantidad_kilos', kilos_por_producto[pid])
+            ]
+
+    a_borrar = set()
+    tocadas = set()
+    resultados = []
+    for producto, unidades, kilos in lineas:
+        if unidades > 0:
+            costo, kilos_consumidos, usadas, cantidades, faltante = _planear_unidades(
+                lotes_unidades[producto.id], unidades, a_borrar, tocadas
+            )
+            if faltante > 0:
+                raise ValidationError(
+                    f"No hay stock disponible suficiente de '{producto.nombre}' para cubrir el pedido"
+                )
+            resultados.append((costo, kilos_consumidos, usadas, cantidades))
+        else:
+            resultados.append((Decimal('0.00'), Decimal('0.00'), [], {}))
+        if kilos > 0:
+            faltante_kilos = _planear_kilos(lotes_kilos[producto.id], kilos, tocadas)
+            registrar_faltante_kilos(producto, faltante_kilos)
+
+    _aplicar_plan(list(por_pk.values()), a_borrar,
+                  ['cantidad_unidades', 'cantidad_kilos'], tocadas)
+    return resultados
 
 
 def descontar_kilos_fifo(producto, kilos_a_descontar, permitir_faltante=False):
@@ -127,7 +489,8 @@ def descontar_kilos_fifo(producto, kilos_a_descontar, permitir_faltante=False):
       - True: descuenta hasta donde alcance y devuelve lo que falto. Para
         registrar un pesaje: la carne YA salio de la camara, bloquear el
         registro no la devuelve; el faltante queda visible en el comando
-        resincronizar_ledger_stock --kilos.
+        resincronizar_ledger_stock --kilos y en /metrics
+        (meets_kilos_faltantes_kg_total, ver core/metricas.py).
 
     Devuelve (kilos_descontados, faltante).
     """
@@ -135,9 +498,10 @@ def descontar_kilos_fifo(producto, kilos_a_descontar, permitir_faltante=False):
     if kilos_a_descontar <= 0:
         return Decimal('0.00'), Decimal('0.00')
 
-    entradas = list(
-        EntradaProducto.objects.filter(producto=producto).order_by('fecha_entrada')
-    )
+    # Solo el prefijo FIFO que cubre lo pedido (ver _lotes_fifo). Si el ledger
+    # no alcanza, _lotes_fifo devuelve todos los lotes con kilos, asi que la
+    # suma sigue siendo el total disponible para el mensaje de error.
+    entradas = _lotes_fifo(producto, 'cantidad_kilos', kilos_a_descontar)
     disponibles = sum((e.cantidad_kilos for e in entradas), Decimal('0.00'))
     if disponibles < kilos_a_descontar and not permitir_faltante:
         raise ValidationError(
@@ -146,16 +510,10 @@ def descontar_kilos_fifo(producto, kilos_a_descontar, permitir_faltante=False):
             f"{kilos_a_descontar} kg"
         )
 
-    restante = kilos_a_descontar
-    for entrada in entradas:
-        if restante <= 0:
-            break
-        if entrada.cantidad_kilos <= 0:
-            continue
-        tomados = min(entrada.cantidad_kilos, restante)
-        entrada.cantidad_kilos -= tomados
-        restante -= tomados
-        entrada.save()
+    tocadas = set()
+    restante = _planear_kilos(entradas, kilos_a_descontar, tocadas)
+    _aplicar_plan(entradas, set(), ['cantidad_kilos'], tocadas)
+    registrar_faltante_kilos(producto, restante)
 
     return kilos_a_descontar - restante, restante
 
@@ -204,12 +562,17 @@ def estado_consumo_detalle(detalle):
       - ``parcial``: parte vendida -> costo libre, cantidad con piso en lo vendido.
       - ``bloqueada``: lote totalmente consumido -> cantidad/costo bloqueados.
     """
-    original = int(detalle.cantidad_unidades or 0)
-
     vivas = EntradaProducto.objects.filter(
         factura=detalle.factura_id,
         producto=detalle.producto_id,
     ).aggregate(total=Sum('cantidad_unidades'))['total'] or 0
+    return estado_consumo(detalle, vivas)
+
+
+def estado_consumo(detalle, vivas):
+    """Estado de edicion de ``detalle`` dadas sus unidades ``vivas`` en el
+    ledger (ver estado_consumo_detalle y consumo_facturas)."""
+    original = int(detalle.cantidad_unidades or 0)
     vivas = int(vivas)
 
     consumidas = original - vivas
@@ -244,3 +607,103 @@ def pedidos_consumidores_detalle(detalle):
         .values_list('detallepedido__pedido_id', flat=True)
         .distinct()
     )
+
+
+def consumo_facturas(factura_ids):
+    """Version por lote de estado_consumo_detalle y
+    pedidos_consumidores_detalle para todas las lineas de ``factura_ids``,
+    con dos consultas agrupadas (por tramo de LOTE_IDS facturas):
+
+      - ``vivas``: ``{(factura_id, producto_id): unidades vivas}`` (Sum de
+        EntradaProducto).
+      - ``pedidos``: ``{(factura_id, producto_id): [pedido_id, ...]}`` de
+        pedidos no anulados que consumieron de ese lote.
+
+    Pensado para pasarlo en el context de DetalleFacturaSerializer como
+    ``consumo`` (ver FacturaListView): un par que no aparece no tiene stock
+    vivo o no tiene consumidores.
+    """
+    ids = sorted({pk for pk in factura_ids if pk is not None})
+    vivas = {}
+    pedidos = {}
+    for i in range(0, len(ids), LOTE_IDS):
+        tramo = ids[i:i + LOTE_IDS]
+        for fila in (
+            EntradaProducto.objects.filter(factura_id__in=tramo)
+            .values('factura_id', 'producto_id')
+            .annotate(total=Sum('cantidad_unidades'))
+            .order_by()
+        ):
+            vivas[(fila['factura_id'], fila['producto_id'])] = fila['total'] or 0
+
+        for factura_id, producto_id, pedido_id in (
+            FacturaDetallePedido.objects.filter(factura_id__in=tramo)
+            .exclude(detallepedido__pedido__estado='Anulado')
+            .values_list('factura_id', 'detallepedido__producto_id', 'detallepedido__pedido_id')
+            .distinct()
+            .order_by('detallepedido__pedido_id')
+        ):
+            pedidos.setdefault((factura_id, producto_id), []).append(pedido_id)
+    return {'vivas': vivas, 'pedidos': pedidos}
+
+
+class _ADecimal(Cast):
+    """CAST a decimal que en SQLite (sin tipo numerico exacto) va a REAL: con
+    NUMERIC un entero sigue siendo entero y la division que lo usa trunca."""
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='CAST(%(expressions)s AS REAL)', **extra_context)
+
+
+def anotar_atribucion(vinculos, agrupable=False):
+    """Anota en un queryset de FacturaDetallePedido el reparto de cada linea de
+    venta entre las facturas que la abastecieron, con el mismo criterio que
+    DetallePedidoSerializer.get_facturas_detalle pero calculado en la base:
+
+    - ``costo_por_kilo``: costo/kg de la factura para el producto de la linea
+      (la ultima linea de esa factura si repite el producto), o NULL.
+    - ``kilos_atribuidos``: kilos de la linea * unidades del vinculo / total de
+      unidades vinculadas a la linea (una suma de ventana por linea); 0 si
+      esos vinculos suman 0 unidades, como en el serializer.
+    - ``venta_atribuida``: kilos_atribuidos * precio_venta de la linea.
+    - ``costo_atribuido``: kilos_atribuidos * costo_por_kilo, 0 sin costo.
+
+    La ventana suma los vinculos que quedan en el queryset: filtrarlo solo por
+    datos de la LINEA (producto, pedido, fecha), nunca dejando afuera parte de
+    los vinculos de una linea.
+
+    SQL no deja agregar sobre una ventana: con ``agrupable=True`` el total de
+    la linea sale de una subconsulta correlacionada (todos los vinculos de la
+    linea) y el resultado se puede agrupar con values(...).annotate(Sum(...)).
+    """
+    decimal = DecimalField(max_digits=30, decimal_places=16)
+    costo_factura_sq = DetalleFactura.objects.filter(
+        factura_id=OuterRef('factura_id'),
+        producto_id=OuterRef('detallepedido__producto_id'),
+    ).order_by('-id').values('costo_por_kilo')[:1]
+    if agrupable:
+        total_linea = Subquery(
+            FacturaDetallePedido.objects.filter(detallepedido_id=OuterRef('detallepedido_id'))
+            .values('detallepedido_id').annotate(total=Sum('cantidad_unidades')).values('total')
+        )
+    else:
+        total_linea = Window(Sum('cantidad_unidades'), partition_by=[F('detallepedido_id')])
+    return vinculos.annotate(
+        costo_por_kilo=Subquery(costo_factura_sq, output_field=DecimalField(max_digits=10, decimal_places=2)),
+        kilos_atribuidos=Coalesce(
+            ExpressionWrapper(
+                Coalesce(F('detallepedido__cantidad_kilos'), Decimal('0')) * F('cantidad_unidades')
+                / NullIf(_ADecimal(total_linea, decimal), Decimal('0')),
+                output_field=decimal,
+            ),
+            Decimal('0'),
+            output_field=decimal,
+        ),
+    ).annotate(
+        venta_atribuida=ExpressionWrapper(
+            F('kilos_atribuidos') * Coalesce(F('detallepedido__precio_venta'), Decimal('0')),
+            output_field=decimal),
+        costo_atribuido=ExpressionWrapper(
+            Coalesce(F('kilos_atribuidos') * F('costo_por_kilo'), Decimal('0')),
+            output_field=decimal),
+    )
@@ -1,17 +1,31 @@
 from rest_framework.views import APIView, PermissionDenied
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Producto, Pedido, FacturaDetallePedido, Vendedor, DetallePedido, Cliente, Factura, DetalleFactura, PagoFactura, EntradaProducto,Proveedor, PagoVendedor, AjusteInventario, HistorialPrecioProducto
+from .models import Producto, Pedido, FacturaDetallePedido, Vendedor, DetallePedido, Cliente, Factura, DetalleFactura, PagoFactura, EntradaProducto,Proveedor, PagoVendedor, AjusteInventario, HistorialPrecioProducto, VentaDiaria
+from .reportes_cache import cachear_reporte, estadisticas_cache, invalidar_reportes
+from .exportar import respuesta_csv, respuesta_xlsx
+from .imagenes import encolar_imagen
+from .pagination import (
+    AjusteCursorPagination, DetalleFacturaCursorPagination, DetallePedidoCursorPagination,
+    FacturaCursorPagination, PedidoCursorPagination,
+)
 from .serializers import MyTokenObtainPairSerializer, ProductoSerializer, PedidoSerializer,ProveedorSerializer, ClienteSerializer, FacturaSerializer, PagoFacturaSerializer, VendedorSerializer, HistorialPrecioProductoSerializer, AjusteInventarioSerializer
-from .utils import estado_consumo_detalle, consumir_fifo, costo_por_kilo_ponderado, descontar_kilos_fifo, restituir_kilos_fifo
+from .utils import estado_consumo_detalle, consumir_fifo, consumir_fifo_pedido, costo_por_kilo_ponderado, costos_por_kilo_ponderados, descontar_kilos_fifo, restituir_kilos_fifo, bloquear_ledger, actualizar_stock_resumen, anotar_stock, calcular_stock, consumo_facturas, actualizar_venta_diaria, claves_venta_diaria, anotar_atribucion
 from rest_framework.exceptions import ValidationError
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+import csv
+import io
+import logging
+from datetime import date, datetime
 from decimal import Decimal
 
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.permissions import IsAuthenticated
 
+logger = logging.getLogger(__name__)
+
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
 
@@ -43,17 +57,74 @@ class CrearProducto(APIView):
                 categoria=categoria,
                 estado=estado
             )
+            invalidar_reportes()
             return Response(ProductoSerializer(producto).data, status=status.HTTP_201_CREATED)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+def _fecha_param(valor):
+    """Fecha YYYY-MM-DD de un query param, o None si no es valida. parse_date
+    devuelve None si no tiene el formato pero lanza ValueError si lo tiene y
+    la fecha no existe (2026-13-01)."""
+    try:
+        return parse_date(valor)
+    except ValueError:
+        return None
+
 class PedidoListView(APIView):
+    """
+    Pedidos del mas nuevo al mas viejo (sin los anulados, salvo
+    ?incluir_anulados=1).
+
+    Filtros opcionales: ?desde=YYYY-MM-DD & ?hasta=YYYY-MM-DD (sobre la fecha
+    del pedido), ?estado=, ?vendedor=<id> y ?cliente=<id>.
+
+    ?fields=id,fecha,estado,... limita los campos de cada pedido; sin
+    'detalles' no se leen las lineas, que son casi todo el peso de la
+    respuesta.
+
+    Con ?page_size=N (o un ?cursor= de una respuesta anterior) la respuesta se
+    pagina por cursor (ver PedidoCursorPagination) y viene como
+    {next, previous, results}. Sin esos parametros se devuelve la lista
+    completa como siempre, que es lo que esperan las pantallas que agregan
+    sobre todos los pedidos.
+    """
     permission_classes = [IsAuthenticated]
     def get(self, request):
-        pedidos = Pedido.objects.all().order_by('-fecha')
-        if request.query_params.get('incluir_anulados') != '1':
+        params = request.query_params
+        pedidos = Pedido.objects.select_related('cliente__vendedor', 'vendedor')
+        if params.get('incluir_anulados') != '1':
             pedidos = pedidos.exclude(estado="Anulado")
-        serializer = PedidoSerializer(pedidos, many=True)
+
+        for nombre, lookup in (('desde', 'fecha__date__gte'), ('hasta', 'fecha__date__lte')):
+            valor = params.get(nombre)
+            if not valor:
+                continue
+            fecha = _fecha_param(valor)
+            if fecha is None:
+                return Response({'error': f"Fecha '{nombre}' invalida, se espera YYYY-MM-DD"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            pedidos = pedidos.filter(**{lookup: fecha})
+        if params.get('estado'):
+            pedidos = pedidos.filter(estado=params['estado'])
+        if params.get('vendedor'):
+            pedidos = pedidos.filter(vendedor_id=params['vendedor'])
+        if params.get('cliente'):
+            pedidos = pedidos.filter(cliente_id=params['cliente'])
+
+        campos = None
+        if params.get('fields'):
+            campos = [c.strip() for c in params['fields'].split(',') if c.strip()]
+        if campos is None or 'detalles' in campos:
+            pedidos = pedidos.prefetch_related('detalles__producto', 'detalles__facturas')
+
+        if 'cursor' in params or 'page_size' in params:
+            paginador = PedidoCursorPagination()
+            pagina = paginador.paginate_queryset(pedidos, request, view=self)
+            serializer = PedidoSerializer(pagina, many=True, campos=campos)
+            return paginador.get_paginated_response(serializer.data)
+
+        serializer = PedidoSerializer(pedidos.order_by('-fecha'), many=True, campos=campos)
         return Response(serializer.data)
 
 class CrearPedido(APIView):
@@ -97,86 +168,114 @@ class CrearPedido(APIView):
 
         try:
             with transaction.atomic():
-                pedido = Pedido.objects.create(cliente_id=cliente_id)
-                total_pedido = Decimal('0.00')
+                # Candado del ledger de cada producto del pedido (ver
+                # bloquear_ledger) ANTES del chequeo de stock: sin esto dos
+                # vendedores que venden las ultimas unidades de un mismo corte
+                # pasaban ambos el chequeo. Pedidos de otros cortes no esperan.
+                productos_bloqueados = bloquear_ledger(d.get('producto') for d in detalles)
+
+                # Stock real disponible = unidades remanentes en EntradaProducto.
+                # DetalleFactura es el historico completo de compras y NUNCA se
+                # decrementa al vender, asi que usarlo aca dejaba pasar ventas de
+                # productos ya agotados (la validacion siempre veia "stock" aunque
+                # ya no quedara ninguna EntradaProducto para cubrir el costo).
+                # Una sola lectura para todo el pedido; las lineas que repiten
+                # producto ven lo que dejaron las anteriores.
+                stock = {
+                    pid: s['disponibles']
+                    for pid, s in calcular_stock(productos_bloqueados).items()
+                }
 
+                # 1. Validar y planear TODAS las lineas antes de escribir nada.
+                lineas = []
                 for detalle in detalles:
                     producto_id = detalle.get('producto')
                     kilos = Decimal(str(detalle.get('cantidad_kilos', 0)))
                     unidades = int(detalle.get('cantidad_unidades', 0))
 
-
-                    producto = Producto.objects.get(id=producto_id)
-
-                    # Stock real disponible = unidades remanentes en EntradaProducto.
-                    # DetalleFactura es el historico completo de compras y NUNCA se
-                    # decrementa al vender, asi que usarlo aca dejaba pasar ventas de
-                    # productos ya agotados (la validacion siempre veia "stock" aunque
-                    # ya no quedara ninguna EntradaProducto para cubrir el costo).
-                    stockProducto = EntradaProducto.objects.filter(producto=producto).aggregate(total=Sum('cantidad_unidades'))['total'] or 0
-
-                    if unidades > stockProducto:
-                        raise ValidationError("No hay suficiente stock disponible para el producto")
-
-                    if not producto_id:
-                        raise ValidationError("El ID del producto es obligatorio")
-
                     try:
+                        producto = productos_bloqueados[int(producto_id)]
+                    except (KeyError, TypeError, ValueError):
+                        # Producto inexistente: mismo error de siempre.
                         producto = Producto.objects.get(id=producto_id)
-                    except Producto.DoesNotExist:
-                        return Response({'error': f"Producto con ID {producto_id} no existe"}, status=status.HTTP_404_NOT_FOUND)
 
+                    if unidades > stock[producto.id]:
+                        raise ValidationError("No hay suficiente stock disponible para el producto")
+                    stock[producto.id] -= max(unidades, 0)
 
+                    if kilos == 0:
+                        kilos = Decimal('0.00')  # Si no hay kilos, se deja en 0
+                    lineas.append((producto, unidades, kilos))
 
-                    # Descontar el stock (FIFO) por las unidades vendidas. El costo
-                    # /kg de la linea se calcula despues como promedio ponderado de
-                    # los lotes vinculados (costo_por_kilo_ponderado), coherente con
-                    # el desglose por factura que se muestra en Movimientos.
-                    _c, _k, facturas_usadas, facturas_cantidades = consumir_fifo(producto, unidades)
+                # Descontar el stock (FIFO) por las unidades vendidas y, si la
+                # linea viene pesada, los kilos REALES de la bascula. Si viene sin
+                # pesar (Reservado) no se descuentan kilos todavia — lo hara
+                # ActualizarKilosPedido cuando se registre la bascula. Una lectura
+                # del ledger por producto y una escritura para todo el pedido
+                # (ver consumir_fifo_pedido).
+                consumos = consumir_fifo_pedido(lineas)
 
+                total_pedido = Decimal('0.00')
+                estado = "Reservado"
+                for producto, unidades, kilos in lineas:
                     if kilos == 0:
-                        kilos = Decimal('0.00')  # Si no hay kilos, se deja en 0
-                        total_venta = Decimal('0.00')
-                        pedido.estado = "Reservado"
+                        estado = "Reservado"
                     else:
-                        total_venta = kilos * producto.precio_por_kilo
-                        total_pedido += total_venta
-                        pedido.estado = "Preparado"
-                        # El pedido viene pesado: los kilos REALES salen ahora
-                        # del ledger. Si viene sin pesar (Reservado) no se
-                        # descuenta nada todavia — lo hara ActualizarKilosPedido
-                        # cuando se registre la bascula.
-                        descontar_kilos_fifo(producto, kilos, permitir_faltante=True)
-
-                    detalle_pedido = DetallePedido.objects.create(
+                        total_pedido += kilos * producto.precio_por_kilo
+                        estado = "Preparado"
+
+                pedido = Pedido.objects.create(
+                    cliente_id=cliente_id, vendedor=vendedor,
+                    total=total_pedido, estado=estado,
+                )
+
+                # 2. Escribir el pedido entero con bulk_create.
+                detalles_pedido = DetallePedido.objects.bulk_create([
+                    DetallePedido(
                         pedido=pedido,
                         producto=producto,
                         cantidad_kilos=kilos,
                         cantidad_unidades=unidades,
-                        total_venta=total_venta,
-                        precio_venta=producto.precio_por_kilo
+                        total_venta=Decimal('0.00') if kilos == 0 else kilos * producto.precio_por_kilo,
+                        precio_venta=producto.precio_por_kilo,
                     )
-
-                    # Agregar las facturas usadas al detalle del pedido
-                    detalle_pedido.facturas.set(facturas_usadas)
-
-                    # Agregar la cantidad de unidades usadas de cada factura
-                    for factura_id, cantidad in facturas_cantidades.items():
-                        FacturaDetallePedido.objects.create(
-                            detallepedido=detalle_pedido,
-                            factura_id=factura_id,
-                            cantidad_unidades=cantidad
-                        )
-
-                    # Ya con las facturas vinculadas, fijar el costo/kg ponderado y
-                    # re-guardar (save() deriva total_costo = costo/kg * kilos).
-                    cpk = costo_por_kilo_ponderado(detalle_pedido)
+                    for producto, unidades, kilos in lineas
+                ])
+
+                # Facturas usadas (M2M) y unidades usadas de cada factura.
+                # OJO: Factura.numero_factura ES el primary key.
+                Through = DetallePedido.facturas.through
+                Through.objects.bulk_create([
+                    Through(detallepedido_id=detalle_pedido.id, factura_id=factura_id)
+                    for detalle_pedido, (_c, _k, facturas_usadas, _fc) in zip(detalles_pedido, consumos)
+                    for factura_id in dict.fromkeys(f.pk for f in facturas_usadas)
+                ])
+                FacturaDetallePedido.objects.bulk_create([
+                    FacturaDetallePedido(
+                        detallepedido=detalle_pedido,
+                        factura_id=factura_id,
+                        cantidad_unidades=cantidad,
+                    )
+                    for detalle_pedido, (_c, _k, _fu, facturas_cantidades) in zip(detalles_pedido, consumos)
+                    for factura_id, cantidad in facturas_cantidades.items()
+                ])
+
+                # Ya con las facturas vinculadas, fijar el costo/kg ponderado de
+                # cada linea (promedio de los lotes vinculados, coherente con el
+                # desglose por factura de Movimientos) y derivar total_costo y
+                # margen como lo haria save().
+                costos = costos_por_kilo_ponderados(d.id for d in detalles_pedido)
+                for detalle_pedido in detalles_pedido:
+                    cpk = costos.get(detalle_pedido.id)
                     if cpk is not None:
                         detalle_pedido.costo_por_kilo = cpk
-                        detalle_pedido.save()
-                pedido.vendedor = vendedor
-                pedido.total = total_pedido
-                pedido.save()
+                    detalle_pedido.derivar_totales()
+                DetallePedido.objects.bulk_update(
+                    detalles_pedido, ['costo_por_kilo', 'total_costo', 'margen']
+                )
+                actualizar_stock_resumen(productos_bloqueados)
+                actualizar_venta_diaria(claves_venta_diaria([pedido.id]))
+                invalidar_reportes()
 
                 return Response(PedidoSerializer(pedido).data, status=status.HTTP_201_CREATED)
 
@@ -190,10 +289,23 @@ class PedidoDetailView(APIView):
     permission_classes = [IsAuthenticated]
     def put(self, request, pk):
         try:
-            pedido = Pedido.objects.get(pk=pk)
             data = request.data
-            
+
             with transaction.atomic():
+                # Mismo orden de candados que CancelarPedido: primero la fila
+                # del pedido y despues el ledger. Leerlo aca (y no antes de la
+                # transaccion) evita ademas guardar encima de una anulacion
+                # recien confirmada un estado/total viejo.
+                pedido = Pedido.objects.select_for_update().get(pk=pk)
+                if pedido.estado == "Anulado":
+                    return Response({'error': 'El pedido está Anulado'}, status=status.HTTP_400_BAD_REQUEST)
+
+                # Se bloquean TODOS los productos del pedido y no solo los de
+                # las lineas enviadas: un cambio de estado (p.ej. a Anulado)
+                # mueve las reservas de todas sus lineas.
+                productos_bloqueados = bloquear_ledger(
+                    pedido.detalles.values_list('producto_id', flat=True))
+
                 # 1. Actualizar el estado si viene (Pagado, Anulado, etc.)
                 if 'estado' in data:
                     pedido.estado = data['estado']
@@ -268,6 +380,9 @@ class PedidoDetailView(APIView):
                     pedido.total = nuevo_total_pedido
                 
                 pedido.save()
+                actualizar_stock_resumen(productos_bloqueados)
+                actualizar_venta_diaria(claves_venta_diaria([pedido.id]))
+                invalidar_reportes()
                 
             serializer = PedidoSerializer(pedido)
             return Response(serializer.data, status=status.HTTP_200_OK)
@@ -289,10 +404,16 @@ class ActualizarKilosPedido(APIView):
     permission_classes = [IsAuthenticated]
     def post(self, request, pedido_id, *args, **kwargs):
         try:
-            pedido = Pedido.objects.get(id=pedido_id)
             detalles_data = request.data.get('detalles', [])
             total_pedido = 0
             with transaction.atomic():
+                # Pedido antes que ledger, como CancelarPedido (ver
+                # PedidoDetailView.put).
+                pedido = Pedido.objects.select_for_update().get(id=pedido_id)
+                if pedido.estado == "Anulado":
+                    return Response({'error': 'El pedido está Anulado'}, status=status.HTTP_400_BAD_REQUEST)
+                productos_bloqueados = bloquear_ledger(
+                    pedido.detalles.values_list('producto_id', flat=True))
                 for detalle_data in detalles_data:
                     producto_id = detalle_data.get('producto')
                     cantidad_kilos = detalle_data.get('cantidad_kilos')
@@ -317,6 +438,9 @@ class ActualizarKilosPedido(APIView):
                     total_pedido += detalle.total_venta
                 pedido.total = total_pedido
                 pedido.save()
+                actualizar_stock_resumen(productos_bloqueados)
+                actualizar_venta_diaria(claves_venta_diaria([pedido.id]))
+                invalidar_reportes()
 
                 
 
@@ -369,71 +493,361 @@ class CrearCliente(APIView):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+def _decimal_param(valor, nombre):
+    try:
+        return Decimal(str(valor))
+    except Exception:
+        raise ValidationError(f"{nombre} invalido: {valor!r}")
+
+
+def _preparar_factura(data, productos, proveedores):
+    """Valida una factura de compra (el payload de CrearFacturaEntrada) y arma,
+    SIN guardar, la Factura, sus DetalleFactura y los lotes EntradaProducto.
+
+    ``productos`` es el ``{id: Producto}`` que devolvio bloquear_ledger y
+    ``proveedores`` los ids de proveedor existentes (_proveedores_de). Lanza
+    ValidationError con el primer problema que encuentra: nada se escribe
+    hasta que todas las lineas son validas.
+    """
+    try:
+        proveedor_id = int(data.get('proveedor'))
+    except (TypeError, ValueError):
+        proveedor_id = None
+    if proveedor_id not in proveedores:
+        raise ValidationError(f"Proveedor no encontrado: {data.get('proveedor')!r}")
+    if not data.get('numero_factura'):
+        raise ValidationError("Falta numero_factura")
+
+    fecha = data.get('fecha')
+    if fecha in (None, ''):
+        fecha = timezone.localdate()
+    elif not isinstance(fecha, date):
+        fecha = _fecha_param(str(fecha))
+        if fecha is None:
+            raise ValidationError(f"Fecha invalida: {data.get('fecha')!r}, se espera YYYY-MM-DD")
+
+    factura = Factura(
+        numero_factura=data.get('numero_factura'),
+        proveedor_id=proveedor_id,
+        fecha=fecha,
+        subtotal=_decimal_param(data.get('subtotal', 0), 'subtotal'),
+        iva=_decimal_param(data.get('iva', 0), 'iva'),
+        total=_decimal_param(data.get('total', 0), 'total'),
+    )
+    # Los lotes entran a la medianoche de la fecha de la factura: es la clave
+    # de orden del FIFO (ver EntradaProducto.fecha_entrada).
+    fecha_entrada = timezone.make_aware(datetime.combine(fecha, datetime.min.time()))
+
+    detalles, entradas = [], []
+    for n, item in enumerate(data.get('detalles') or [], 1):
+        try:
+            producto = productos.get(int(item.get('producto')))
+        except (TypeError, ValueError):
+            producto = None
+        if producto is None:
+            raise ValidationError(f"Linea {n}: producto no encontrado: {item.get('producto')!r}")
+
+        # Leemos con nombres explícitos y valores por defecto 0.0
+        kilos = _decimal_param(item.get('cantidad_kilos', 0), f"Linea {n}: cantidad_kilos")
+        try:
+            unidades = int(item.get('cantidad_unidades', 0))
+        except (TypeError, ValueError):
+            raise ValidationError(f"Linea {n}: cantidad_unidades invalido: {item.get('cantidad_unidades')!r}")
+        costo_un = _decimal_param(item.get('costo_por_kilo', 0), f"Linea {n}: costo_por_kilo")
+        # Si el frontend envía 'costo_total', lo usamos; si no, lo calculamos
+        costo_tot = _decimal_param(item.get('costo_total', kilos * costo_un), f"Linea {n}: costo_total")
+
+        detalles.append(DetalleFactura(
+            factura=factura,
+            producto=producto,
+            cantidad_kilos=kilos,
+            cantidad_unidades=unidades,
+            costo_por_kilo=costo_un,
+            costo_total=costo_tot,
+        ))
+        # Nos aseguramos que costo_por_kilo NUNCA sea None
+        entradas.append(EntradaProducto(
+            factura=factura,
+            producto=producto,
+            cantidad_kilos=kilos,
+            cantidad_unidades=unidades,
+            costo_por_kilo=costo_un,
+            fecha_entrada=fecha_entrada,
+        ))
+    return factura, detalles, entradas
+
+
+def _guardar_facturas(preparadas):
+    """Inserta las facturas que armo _preparar_factura con un bulk_create por
+    tabla (Factura, DetalleFactura, EntradaProducto), sin importar cuantas
+    facturas ni lineas sean."""
+    Factura.objects.bulk_create([factura for factura, _d, _e in preparadas])
+    DetalleFactura.objects.bulk_create([d for _f, detalles, _e in preparadas for d in detalles])
+    EntradaProducto.objects.bulk_create([e for _f, _d, entradas in preparadas for e in entradas])
+
+
+def _ids(valores):
+    ids = set()
+    for valor in valores:
+        try:
+            ids.add(int(valor))
+        except (TypeError, ValueError):
+            pass
+    return ids
+
+
+def _productos_de(facturas):
+    return _ids(item.get('producto') for data in facturas for item in data.get('detalles') or [])
+
+
+def _proveedores_de(facturas):
+    """Ids de proveedor de ``facturas`` que existen, en una consulta."""
+    ids = _ids(data.get('proveedor') for data in facturas)
+    return set(Proveedor.objects.filter(id__in=ids).values_list('id', flat=True))
+
+
 class CrearFacturaEntrada(APIView):
+    """Registra una factura de compra: la Factura, sus lineas (DetalleFactura)
+    y un lote del ledger (EntradaProducto) por linea. Las lineas se validan
+    todas antes de escribir y se insertan con un bulk_create por tabla, asi
+    que una factura de 60 lineas cuesta lo mismo que una de 2."""
     permission_classes = [IsAuthenticated]
     @transaction.atomic
     def post(self, request):
         data = request.data
         try:
-            # 1. Obtener Proveedor
-            proveedor_id = data.get('proveedor')
-            proveedor = Proveedor.objects.get(id=proveedor_id)
-
-            # 2. Crear la Factura
-            factura = Factura.objects.create(
-                numero_factura=data.get('numero_factura'),
-                proveedor=proveedor,
-                fecha=data.get('fecha', timezone.now()),
-                subtotal=Decimal(str(data.get('subtotal', 0))),
-                iva=Decimal(str(data.get('iva', 0))),
-                total=Decimal(str(data.get('total', 0)))
+            if Factura.objects.filter(numero_factura=data.get('numero_factura')).exists():
+                raise ValidationError(f"La factura {data.get('numero_factura')} ya existe")
+            productos_bloqueados = bloquear_ledger(_productos_de([data]))
+            _guardar_facturas([_preparar_factura(data, productos_bloqueados, _proveedores_de([data]))])
+
+            actualizar_stock_resumen(productos_bloqueados)
+            invalidar_reportes()
+            return Response({'message': 'Éxito'}, status=status.HTTP_201_CREATED)
+
+        except Exception as e:
+            # Nada a medias: sin esto la excepcion capturada dejaba que
+            # @transaction.atomic confirmara lo que se alcanzo a escribir.
+            transaction.set_rollback(True)
+            detail = e.detail if isinstance(e, ValidationError) else str(e)
+            mensaje = detail[0] if isinstance(detail, list) and detail else detail
+            if isinstance(e, ValidationError):
+                logger.warning("Factura rechazada: %s", mensaje)
+            else:
+                logger.exception("Error creando la factura %s", data.get('numero_factura'))
+            return Response({'error': str(mensaje)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+# Columnas del CSV de ImportarFacturas. Los datos de la factura se repiten en
+# cada linea; subtotal, iva y total son opcionales.
+COLUMNAS_CSV_FACTURAS = (
+    'numero_factura', 'proveedor', 'fecha', 'producto',
+    'cantidad_kilos', 'cantidad_unidades', 'costo_por_kilo',
+)
+_CAMPOS_FACTURA_CSV = ('proveedor', 'fecha', 'subtotal', 'iva', 'total')
+
+
+def _facturas_desde_csv(archivo):
+    """Agrupa las filas del CSV (una por linea de factura) en payloads como
+    los de CrearFacturaEntrada, en el orden en que aparece cada factura. Si
+    faltan subtotal/iva/total se calculan como en Facturas.tsx: subtotal =
+    suma de costo_total, iva = 19 %, ambos redondeados a pesos."""
+    texto = archivo.read()
+    if isinstance(texto, bytes):
+        # Excel en configuracion regional es-CL guarda el CSV en Windows-1252
+        # salvo que se elija "CSV UTF-8".
+        try:
+            texto = texto.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            try:
+                texto = texto.decode('cp1252')
+            except UnicodeDecodeError:
+                raise ValidationError("El CSV debe estar en UTF-8 o Windows-1252")
+    # Excel en configuracion regional es-CL guarda el CSV con ';'.
+    encabezado = texto.split('\n', 1)[0]
+    separador = ';' if encabezado.count(';') > encabezado.count(',') else ','
+    lector = csv.DictReader(io.StringIO(texto), delimiter=separador)
+    faltantes = [c for c in COLUMNAS_CSV_FACTURAS if c not in (lector.fieldnames or [])]
+    if faltantes:
+        raise ValidationError(f"Faltan columnas en el CSV: {', '.join(faltantes)}")
+
+    facturas = {}
+    for fila in lector:
+        fila = {k: (v or '').strip() for k, v in fila.items() if k}
+        if not any(fila.values()):
+            continue
+        data = facturas.setdefault(fila['numero_factura'], {
+            'numero_factura': fila['numero_factura'],
+            **{c: fila[c] for c in _CAMPOS_FACTURA_CSV if fila.get(c)},
+            'detalles': [],
+        })
+        data['detalles'].append({
+            c: fila[c] for c in ('producto', 'cantidad_kilos', 'cantidad_unidades',
+                                 'costo_por_kilo', 'costo_total') if fila.get(c)
+        })
+
+    for data in facturas.values():
+        if 'subtotal' in data:
+            continue
+        try:
+            subtotal = sum(
+                Decimal(d['costo_total']) if 'costo_total' in d
+                else Decimal(d.get('cantidad_kilos', 0)) * Decimal(d.get('costo_por_kilo', 0))
+                for d in data['detalles']
             )
+        except Exception:
+            # Los montos invalidos los reporta _preparar_factura por linea.
+            continue
+        subtotal = subtotal.quantize(Decimal('1'))
+        iva = (subtotal * (IVA_RATE - 1)).quantize(Decimal('1'))
+        data.update(subtotal=subtotal, iva=iva, total=subtotal + iva)
+    return list(facturas.values())
 
-            detalles_data = data.get('detalles', [])
-            
-            for item in detalles_data:
-                producto = Producto.objects.get(id=item.get('producto'))
-                
-                # Leemos con nombres explícitos y valores por defecto 0.0
-                kilos = Decimal(str(item.get('cantidad_kilos', 0)))
-                unidades = int(item.get('cantidad_unidades', 0))
-                costo_un = Decimal(str(item.get('costo_por_kilo', 0)))
-                # Si el frontend envía 'costo_total', lo usamos; si no, lo calculamos
-                costo_tot = Decimal(str(item.get('costo_total', kilos * costo_un)))
-
-                # 3. Crear DetalleFactura
-                DetalleFactura.objects.create(
-                    factura=factura,
-                    producto=producto,
-                    cantidad_kilos=kilos,
-                    cantidad_unidades=unidades,
-                    costo_por_kilo=costo_un,
-                    costo_total=costo_tot
-                )
 
-                # 4. Crear EntradaProducto (Aquí es donde fallaba)
-                # Nos aseguramos que costo_por_kilo NUNCA sea None
-                EntradaProducto.objects.create(
-                    factura=factura,
-                    producto=producto,
-                    cantidad_kilos=kilos,
-                    cantidad_unidades=unidades,
-                    costo_por_kilo=costo_un,
-                    fecha_entrada=factura.fecha
-                )
+def _facturas_existentes(numeros):
+    return set(Factura.objects.filter(
+        numero_factura__in=[n for n in numeros if n]).values_list('numero_factura', flat=True))
 
-            return Response({'message': 'Éxito'}, status=status.HTTP_201_CREATED)
 
-        except Exception as e:
-            # Este print saldrá en tu terminal de VS Code / Servidor
-            print(f"DEBUG ERROR: {str(e)}")
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+def _errores_importacion(errores, total):
+    return Response({
+        'error': f"{len(errores)} de {total} facturas con errores; no se importó ninguna",
+        'errores': errores,
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ImportarFacturas(APIView):
+    """
+    Importa un lote de facturas de compra en UNA transacción.
+
+    Acepta JSON ({"facturas": [...]}, o directamente la lista), con cada
+    factura en el mismo formato que CrearFacturaEntrada, o un CSV subido como
+    ``archivo`` (multipart) con una fila por línea de factura (ver
+    COLUMNAS_CSV_FACTURAS).
+
+    Todo o nada: si alguna factura no es válida (proveedor o producto
+    inexistente, montos o fecha inválidos, número repetido en el lote o ya
+    registrado) no se importa ninguna y se responde 400 con los errores de
+    cada factura en ``errores``. Si todas son válidas se insertan con un
+    bulk_create por tabla para todo el lote.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            if request.FILES.get('archivo'):
+                facturas = _facturas_desde_csv(request.FILES['archivo'])
+            else:
+                data = request.data
+                facturas = data.get('facturas') if hasattr(data, 'get') else data
+                if not isinstance(facturas, list):
+                    raise ValidationError("Se espera una lista de facturas (JSON) o un CSV en 'archivo'")
+        except ValidationError as e:
+            return Response({'error': str(e.detail[0])}, status=status.HTTP_400_BAD_REQUEST)
+        if not facturas:
+            return Response({'error': 'No hay facturas para importar'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # numero_factura es un CharField (la PK): 777001 y "777001" son la
+        # misma factura, asi que se comparan (y se guardan) como texto.
+        numeros = []
+        for data in facturas:
+            numero = data.get('numero_factura') if isinstance(data, dict) else None
+            if numero is not None:
+                numero = data['numero_factura'] = str(numero).strip()
+            numeros.append(numero or None)
+
+        validas = [f for f in facturas if isinstance(f, dict)]
+        proveedores = _proveedores_de(validas)
+        errores, preparadas, vistos = [], [], set()
+        with transaction.atomic():
+            productos_bloqueados = bloquear_ledger(_productos_de(validas))
+            existentes = _facturas_existentes(numeros)
+            for indice, (data, numero) in enumerate(zip(facturas, numeros)):
+                try:
+                    if not isinstance(data, dict):
+                        raise ValidationError("Cada factura debe ser un objeto")
+                    if numero in existentes:
+                        raise ValidationError(f"La factura {numero} ya existe")
+                    if numero in vistos:
+                        raise ValidationError(f"La factura {numero} está repetida en el lote")
+                    vistos.add(numero)
+                    preparadas.append(_preparar_factura(data, productos_bloqueados, proveedores))
+                except ValidationError as e:
+                    errores.append({'indice': indice, 'numero_factura': numero, 'error': str(e.detail[0])})
+
+            if errores:
+                return _errores_importacion(errores, len(facturas))
+
+            try:
+                with transaction.atomic():
+                    _guardar_facturas(preparadas)
+            except IntegrityError:
+                # Otro request registro alguno de los numeros despues del
+                # chequeo: el INSERT espero su commit y choco con la PK.
+                transaction.set_rollback(True)
+                existentes = _facturas_existentes(numeros)
+                errores = [
+                    {'indice': indice, 'numero_factura': numero, 'error': f"La factura {numero} ya existe"}
+                    for indice, numero in enumerate(numeros) if numero in existentes
+                ]
+                logger.warning("ImportarFacturas: conflicto al insertar %s", sorted(existentes))
+                return _errores_importacion(errores, len(facturas))
+
+            actualizar_stock_resumen(productos_bloqueados)
+            invalidar_reportes()
+
+        return Response({
+            'message': f"{len(preparadas)} facturas importadas",
+            'facturas': [factura.numero_factura for factura, _d, _e in preparadas],
+            'lineas': sum(len(detalles) for _f, detalles, _e in preparadas),
+        }, status=status.HTTP_201_CREATED)
 
 class FacturaListView(APIView):
+    """
+    Facturas de compra de la mas nueva a la mas vieja, con sus lineas.
+
+    Filtros opcionales: ?desde=YYYY-MM-DD & ?hasta=YYYY-MM-DD (sobre la fecha
+    de la factura) y ?proveedor=<id>.
+
+    Con ?page_size=N (o un ?cursor= de una respuesta anterior) la respuesta se
+    pagina por cursor (ver FacturaCursorPagination) y viene como
+    {next, previous, results}; sin esos parametros se devuelve la lista
+    completa como siempre.
+
+    El estado de consumo de cada linea (unidades vivas y pedidos que la
+    consumieron) se calcula para toda la respuesta de una vez
+    (consumo_facturas) y se pasa al serializer en el context, en vez de una o
+    dos consultas por linea.
+    """
     permission_classes = [IsAuthenticated]
     def get(self, request):
-        facturas = Factura.objects.all()
-        serializer = FacturaSerializer(facturas, many=True)
+        params = request.query_params
+        facturas = Factura.objects.select_related('proveedor', 'pago_factura').prefetch_related(
+            'detalles__producto'
+        )
+        for nombre, lookup in (('desde', 'fecha__gte'), ('hasta', 'fecha__lte')):
+            valor = params.get(nombre)
+            if not valor:
+                continue
+            fecha = _fecha_param(valor)
+            if fecha is None:
+                return Response({'error': f"Fecha '{nombre}' invalida, se espera YYYY-MM-DD"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            facturas = facturas.filter(**{lookup: fecha})
+        if params.get('proveedor'):
+            facturas = facturas.filter(proveedor_id=params['proveedor'])
+
+        paginador = None
+        if 'cursor' in params or 'page_size' in params:
+            paginador = FacturaCursorPagination()
+            facturas = paginador.paginate_queryset(facturas, request, view=self)
+        else:
+            facturas = list(facturas)
+
+        contexto = {'consumo': consumo_facturas(f.pk for f in facturas)}
+        serializer = FacturaSerializer(facturas, many=True, context=contexto)
+        if paginador is not None:
+            return paginador.get_paginated_response(serializer.data)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 class UpdateFacturaEntrada(APIView):
@@ -458,6 +872,8 @@ class UpdateFacturaEntrada(APIView):
         try:
             with transaction.atomic():
                 factura = Factura.objects.select_for_update().get(numero_factura=numero_factura)
+                productos_bloqueados = bloquear_ledger(
+                    factura.detalles.values_list('producto_id', flat=True))
 
                 # Metadatos no ligados a stock: siempre editables sin restricción.
                 proveedor_id = data.get('proveedor')
@@ -509,6 +925,8 @@ class UpdateFacturaEntrada(APIView):
                 factura.iva = iva
                 factura.total = (subtotal + iva).quantize(Decimal('0.01'))
                 factura.save()
+                actualizar_stock_resumen(productos_bloqueados)
+                invalidar_reportes()
 
             factura.refresh_from_db()
             return Response(FacturaSerializer(factura).data, status=status.HTTP_200_OK)
@@ -523,7 +941,7 @@ class UpdateFacturaEntrada(APIView):
                 detail = detail[0]
             return Response({'error': str(detail)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            print(f"DEBUG ERROR (UpdateFacturaEntrada): {str(e)}")
+            logger.exception("Error editando la factura %s", numero_factura)
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     def _reconciliar_entrada(self, detalle, consumidas, nuevos_kilos, nuevas_unidades, nuevo_costo):
@@ -609,6 +1027,9 @@ class CancelarPedido(APIView):
                 if pedido.estado == "Anulado":
                     return Response({'error': 'El pedido ya está Anulado'}, status=status.HTTP_400_BAD_REQUEST)
 
+                productos_bloqueados = bloquear_ledger(
+                    pedido.detalles.values_list('producto_id', flat=True))
+
                 # 1. Revertir stock a las entradas originales
                 for detalle in pedido.detalles.all():
                     # Buscamos las relaciones en la tabla intermedia
@@ -687,6 +1108,9 @@ class CancelarPedido(APIView):
                 # Solo cambia el estado del pedido.
                 pedido.estado = "Anulado"
                 pedido.save()
+                actualizar_stock_resumen(productos_bloqueados)
+                actualizar_venta_diaria(claves_venta_diaria([pedido.id]))
+                invalidar_reportes()
 
                 return Response({'status': 'Pedido Anulado y stock revertido'}, status=status.HTTP_200_OK)
 
@@ -723,34 +1147,44 @@ class UpdateCliente(generics.UpdateAPIView):
 class StockProductos(APIView):
     permission_classes = [IsAuthenticated]
     def get(self, request, *args, **kwargs):
+        # Una sola lectura: StockResumen (ver models.py) guarda por producto
+        # la foto del ledger que se recalcula en cada transaccion que mueve
+        # stock. Antes aca se corrian dos agregados POR producto (2N+1
+        # queries) en la pantalla mas consultada de la app.
+        #
+        # DISPONIBLES sigue siendo EXACTAMENTE la misma cifra que valida
+        # CrearPedido (Sum de EntradaProducto), que es el ledger real que se
+        # descuenta con cada venta/reserva (consumir_fifo) y se restaura al
+        # anular un pedido (CancelarPedido). Antes esto se recalculaba de forma
+        # independiente a partir de DetalleFactura/DetallePedido/
+        # AjusteInventario, y con el tiempo esa cuenta paralela se
+        # desincronizaba del ledger real: la pantalla mostraba stock que
+        # CrearPedido igual rechazaba por "No hay suficiente stock".
+        #
+        # ?fuente=ledger calcula las mismas cifras en vivo desde el ledger, en
+        # una sola consulta (anotar_stock), sin pasar por la foto: sirve para
+        # auditar la foto o si se sospecha que quedo desfasada.
         productos = Producto.objects.exclude(estado="desactivado")
+        en_vivo = request.query_params.get('fuente') == 'ledger'
+        if en_vivo:
+            productos = anotar_stock(productos)
+        else:
+            productos = productos.select_related('stock_resumen')
         stock_data = []
 
         for producto in productos:
-            # DISPONIBLES: se calcula EXACTAMENTE igual que el chequeo de stock
-            # de CrearPedido (Sum de EntradaProducto), que es el ledger real que
-            # se descuenta con cada venta/reserva (consumir_fifo) y se restaura
-            # al anular un pedido (CancelarPedido). Antes esto se recalculaba
-            # de forma independiente a partir de DetalleFactura/DetallePedido/
-            # AjusteInventario, y con el tiempo esa cuenta paralela se
-            # desincronizaba del ledger real: la pantalla mostraba stock que
-            # CrearPedido igual rechazaba por "No hay suficiente stock".
-            # Usar la misma fuente que el chequeo real hace que ambos numeros
-            # NUNCA puedan divergir.
-            reales = EntradaProducto.objects.filter(producto=producto).aggregate(
-                u=Sum('cantidad_unidades'),
-                k=Sum('cantidad_kilos'),
-            )
-            disponibles = reales['u'] or 0
-            kilos_actuales = reales['k'] or 0
-
-            # Reservas: pedidos no anulados sin kilos (ya descontaron unidades
-            # del ledger real, pero siguen fisicamente en bodega esperando).
-            unidades_reservadas = DetallePedido.objects.filter(
-                producto=producto, cantidad_kilos=0
-            ).exclude(pedido__estado="Anulado").aggregate(
-                u=Sum('cantidad_unidades')
-            )['u'] or 0
+            if en_vivo:
+                disponibles = producto.stock_disponibles
+                kilos_actuales = producto.stock_kilos
+                unidades_reservadas = producto.stock_reservas
+            else:
+                # Producto sin ningun movimiento todavia: no tiene fila resumen.
+                resumen = getattr(producto, 'stock_resumen', None)
+                disponibles = resumen.disponibles if resumen else 0
+                kilos_actuales = resumen.kilos_actuales if resumen else Decimal('0.00')
+                # Reservas: pedidos no anulados sin kilos (ya descontaron
+                # unidades del ledger real, pero siguen fisicamente en bodega).
+                unidades_reservadas = resumen.reservas if resumen else 0
 
             # Stock físico = disponibles + lo reservado (que sigue en la repisa).
             stock_fisico = disponibles + unidades_reservadas
@@ -791,7 +1225,9 @@ class PagoVendedorView(APIView):
             "comentario": p.comentario,
             "tipo": p.tipo,
             "fecha": p.fecha,
-            "comprobante": p.comprobante.url if p.comprobante else None
+            # La lista muestra la miniatura; el original se abre a pedido.
+            "comprobante": p.comprobante.url if p.comprobante else None,
+            "comprobante_miniatura": p.comprobante_miniatura.url if p.comprobante_miniatura else None,
         } for p in pagos]
         return Response({"data": data}, status=status.HTTP_200_OK)
 
@@ -806,21 +1242,77 @@ class PagoVendedorView(APIView):
                 tipo=request.data.get('tipo', 'pago'),
                 comprobante=request.FILES.get('comprobante')
             )
+            encolar_imagen(pago)
             return Response({'message': 'Registrado con éxito'}, status=status.HTTP_201_CREATED)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 class DetalleFacturasList(APIView):
+    """
+    Entradas de Movimientos: lineas de facturas de compra.
+
+    Filtros opcionales: ?producto=<id>, ?proveedor=<id>, ?factura=<numero> y
+    ?desde=YYYY-MM-DD & ?hasta=YYYY-MM-DD (sobre la fecha de la factura).
+
+    Con ?page_size=N (o un ?cursor= de una respuesta anterior) la respuesta se
+    pagina por cursor (ver DetalleFacturaCursorPagination) y viene como
+    {next, previous, results}; sin esos parametros se devuelve la lista
+    completa como siempre.
+    """
     permission_classes = [IsAuthenticated]
     def get(self, request):
+        params = request.query_params
         # Optimizamos con select_related para traer nombres de productos/proveedores en una sola consulta
-        detalles = DetalleFactura.objects.select_related('factura__proveedor', 'producto').all()
-        serializer = DetalleFacturaSerializer(detalles, many=True)
+        detalles = DetalleFactura.objects.select_related('factura__proveedor', 'producto')
+        for nombre, lookup in (('desde', 'factura__fecha__gte'), ('hasta', 'factura__fecha__lte')):
+            valor = params.get(nombre)
+            if not valor:
+                continue
+            fecha = _fecha_param(valor)
+            if fecha is None:
+                return Response({'error': f"Fecha '{nombre}' invalida, se espera YYYY-MM-DD"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            detalles = detalles.filter(**{lookup: fecha})
+        if params.get('producto'):
+            detalles = detalles.filter(producto_id=params['producto'])
+        if params.get('proveedor'):
+            detalles = detalles.filter(factura__proveedor_id=params['proveedor'])
+        if params.get('factura'):
+            detalles = detalles.filter(factura_id=params['factura'])
+
+        paginador = None
+        if 'cursor' in params or 'page_size' in params:
+            paginador = DetalleFacturaCursorPagination()
+            detalles = paginador.paginate_queryset(
+                detalles.annotate(fecha_factura=F('factura__fecha')), request, view=self)
+        else:
+            detalles = list(detalles)
+
+        # Estado de consumo de las lineas devueltas en dos consultas (ver
+        # consumo_facturas) en vez de una o dos por linea.
+        contexto = {'consumo': consumo_facturas({d.factura_id for d in detalles})}
+        serializer = DetalleFacturaSerializer(detalles, many=True, context=contexto)
+        if paginador is not None:
+            return paginador.get_paginated_response(serializer.data)
         return Response(serializer.data)
 
 class DetallePedidosList(APIView):
+    """
+    Salidas de Movimientos: lineas de pedidos no anulados.
+
+    Filtros opcionales: ?producto=<id>, ?vendedor=<id>, ?cliente=<id>,
+    ?pedido=<id>, ?estado= (del pedido), ?proveedor=<id> (lineas que
+    consumieron alguna factura de ese proveedor) y ?desde=YYYY-MM-DD &
+    ?hasta=YYYY-MM-DD (sobre la fecha de venta).
+
+    Con ?page_size=N (o un ?cursor= de una respuesta anterior) la respuesta se
+    pagina por cursor (ver DetallePedidoCursorPagination) y viene como
+    {next, previous, results}; sin esos parametros se devuelve la lista
+    completa como siempre.
+    """
     permission_classes = [IsAuthenticated]
     def get(self, request):
+        params = request.query_params
         # Excluimos los pedidos Anulados: al anular, CancelarPedido devuelve las
         # unidades al ledger (EntradaProducto) pero a proposito NO borra el
         # DetallePedido (se conserva el historial de que se vendio). Si esta
@@ -830,9 +1322,164 @@ class DetallePedidosList(APIView):
         detalles = DetallePedido.objects.select_related(
             'pedido__cliente', 'pedido__vendedor', 'producto'
         ).prefetch_related('facturas').exclude(pedido__estado="Anulado")
+        for nombre, lookup in (('desde', 'fecha__gte'), ('hasta', 'fecha__lte')):
+            valor = params.get(nombre)
+            if not valor:
+                continue
+            fecha = _fecha_param(valor)
+            if fecha is None:
+                return Response({'error': f"Fecha '{nombre}' invalida, se espera YYYY-MM-DD"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            detalles = detalles.filter(**{lookup: fecha})
+        if params.get('producto'):
+            detalles = detalles.filter(producto_id=params['producto'])
+        if params.get('vendedor'):
+            detalles = detalles.filter(pedido__vendedor_id=params['vendedor'])
+        if params.get('cliente'):
+            detalles = detalles.filter(pedido__cliente_id=params['cliente'])
+        if params.get('pedido'):
+            detalles = detalles.filter(pedido_id=params['pedido'])
+        if params.get('estado'):
+            detalles = detalles.filter(pedido__estado=params['estado'])
+        if params.get('proveedor'):
+            # Exists y no un join: una linea que consumio varias facturas del
+            # mismo proveedor saldria repetida.
+            detalles = detalles.filter(Exists(FacturaDetallePedido.objects.filter(
+                detallepedido=OuterRef('pk'), factura__proveedor_id=params['proveedor'])))
+
+        if 'cursor' in params or 'page_size' in params:
+            paginador = DetallePedidoCursorPagination()
+            pagina = paginador.paginate_queryset(detalles, request, view=self)
+            serializer = DetallePedidoSerializer(pagina, many=True)
+            return paginador.get_paginated_response(serializer.data)
+
         serializer = DetallePedidoSerializer(detalles, many=True)
         return Response(serializer.data)
 
+# Exportes de Movimientos: se recorren con iterator() para no cargar la
+# historia entera en memoria (ver core/exportar.py).
+CHUNK_EXPORTAR = 2000
+
+
+def _filas_salidas(detalles):
+    # Mismas columnas (y el mismo IVA en el costo) que el export que arma
+    # MovimientosInventario.tsx con la lista en memoria.
+    for d in detalles.iterator(chunk_size=CHUNK_EXPORTAR):
+        kilos = d.cantidad_kilos or Decimal('0')
+        precio = d.precio_venta or Decimal('0')
+        costo_kg = (d.costo_por_kilo or Decimal('0')) * IVA_RATE
+        costo_total = (d.total_costo or Decimal('0')) * IVA_RATE
+        yield [
+            d.pedido_id, d.fecha, d.pedido.cliente.nombre if d.pedido.cliente_id else None,
+            d.pedido.vendedor.nombre if d.pedido.vendedor_id else None, d.producto.nombre,
+            d.cantidad_unidades or 0, kilos, precio, kilos * precio,
+            costo_kg, costo_total, precio - costo_kg, (d.total_venta or Decimal('0')) - costo_total,
+        ]
+
+
+def _centavos(valor):
+    # La atribucion (anotar_atribucion) sale de la base con la escala de la
+    # division (2.8100000000000000): al archivo va con 2 decimales.
+    return valor.quantize(Decimal('0.01')) if valor is not None else None
+
+
+def _filas_facturas_salidas(vinculos):
+    # Desglose por factura de cada salida (get_facturas_detalle), una fila por
+    # vinculo, con la atribucion calculada en la base.
+    for v in anotar_atribucion(vinculos).iterator(chunk_size=CHUNK_EXPORTAR):
+        yield [
+            v.detallepedido.pedido_id, v.detallepedido_id, v.detallepedido.fecha,
+            v.detallepedido.producto.nombre, v.factura.numero_factura,
+            v.factura.proveedor.nombre if v.factura.proveedor_id else None,
+            v.cantidad_unidades, _centavos(v.costo_por_kilo), _centavos(v.kilos_atribuidos),
+            _centavos(v.costo_atribuido) if v.costo_por_kilo is not None else None,
+        ]
+
+
+def _filas_entradas(detalles):
+    for d in detalles.iterator(chunk_size=CHUNK_EXPORTAR):
+        kilos = d.cantidad_kilos or Decimal('0')
+        costo = d.costo_por_kilo or Decimal('0')
+        yield [
+            d.factura.numero_factura, d.factura.fecha,
+            d.factura.proveedor.nombre if d.factura.proveedor_id else None,
+            d.producto.nombre, d.cantidad_unidades or 0, kilos, costo, kilos * costo,
+        ]
+
+
+def _responder_export(request, nombre, hojas):
+    """CSV (la primera hoja, o la de ?hoja=<n> contando desde 1) o XLSX (todas)
+    segun ?formato=csv|xlsx."""
+    formato = request.query_params.get('formato', 'xlsx')
+    fecha = timezone.localdate().isoformat()
+    if formato == 'xlsx':
+        return respuesta_xlsx(f'{nombre}-{fecha}.xlsx', hojas)
+    if formato == 'csv':
+        try:
+            indice = int(request.query_params.get('hoja', 1)) - 1
+            if not 0 <= indice < len(hojas):
+                raise ValueError
+        except ValueError:
+            return Response({'error': f'hoja debe ser un numero entre 1 y {len(hojas)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return respuesta_csv(f'{nombre}-{fecha}.csv', hojas[indice])
+    return Response({'error': 'formato debe ser csv o xlsx'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ExportarDetallePedidos(APIView):
+    """Salidas de Movimientos (mismas lineas que DetallePedidosList, sin
+    pedidos Anulados) en streaming. Hoja 1: una fila por linea de venta. Hoja
+    2: el desglose por factura de compra de cada linea. Acepta ?desde= &
+    ?hasta= sobre la fecha de venta."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            rango = _rango_fechas(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        detalles = (
+            DetallePedido.objects.exclude(pedido__estado="Anulado").filter(**rango)
+            .select_related('pedido__cliente', 'pedido__vendedor', 'producto')
+            .order_by('fecha', 'id')
+        )
+        vinculos = (
+            FacturaDetallePedido.objects.exclude(detallepedido__pedido__estado="Anulado")
+            .filter(**{f'detallepedido__{k}': v for k, v in rango.items()})
+            .select_related('detallepedido__producto', 'factura__proveedor')
+            .order_by('detallepedido__fecha', 'detallepedido_id', 'id')
+        )
+        return _responder_export(request, 'movimientos-salidas', [
+            ('Salidas', ['#', 'Fecha', 'Cliente', 'Vendedor', 'Producto', 'Unidades', 'Kilos',
+                         'Precio/Kg', 'Total', 'Costo/Kg', 'Costo Total', 'Ganancia/Kg', 'Ganancia Total'],
+             _filas_salidas(detalles)),
+            ('Facturas por salida', ['Pedido', 'Linea', 'Fecha', 'Producto', 'Factura', 'Proveedor',
+                                     'Unidades consumidas', 'Costo/Kg factura', 'Kilos atribuidos',
+                                     'Costo atribuido'],
+             _filas_facturas_salidas(vinculos)),
+        ])
+
+
+class ExportarDetalleFacturas(APIView):
+    """Entradas de Movimientos (DetalleFactura) en streaming, con ?desde= &
+    ?hasta= sobre la fecha de la factura."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            rango = _rango_fechas(request, 'factura__fecha')
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        detalles = (
+            DetalleFactura.objects.filter(**rango)
+            .select_related('factura__proveedor', 'producto')
+            .order_by('factura__fecha', 'id')
+        )
+        return _responder_export(request, 'movimientos-entradas', [
+            ('Entradas', ['#', 'Fecha', 'Proveedor', 'Producto', 'Unidades', 'Kilos', 'Costo/Kg', 'Total'],
+             _filas_entradas(detalles)),
+        ])
+
 class UpdateProducto(APIView):
     permission_classes = [IsAuthenticated]
     def put(self, request, producto_id, *args, **kwargs):
@@ -858,6 +1505,7 @@ class UpdateProducto(APIView):
                     precio_nuevo=producto.precio_por_kilo,
                     usuario=request.user,
                 )
+            invalidar_reportes()
 
             return Response(ProductoSerializer(producto).data, status=status.HTTP_200_OK)
         except Producto.DoesNotExist:
@@ -938,21 +1586,49 @@ class StockProductosView(APIView):
 
 
 class AjusteInventarioListView(APIView):
-    """Lista los ajustes de inventario (mermas, excesos y ajustes manuales)."""
+    """
+    Lista los ajustes de inventario (mermas, excesos y ajustes manuales), del
+    mas nuevo al mas viejo.
+
+    Filtros opcionales: ?producto=<id>, ?tipo= y ?desde=YYYY-MM-DD &
+    ?hasta=YYYY-MM-DD (sobre la fecha del ajuste).
+
+    Con ?page_size=N (o un ?cursor= de una respuesta anterior) la respuesta se
+    pagina por cursor (ver AjusteCursorPagination) y viene como
+    {next, previous, results}; sin esos parametros se devuelve la lista
+    completa como siempre.
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        ajustes = AjusteInventario.objects.select_related('producto').order_by('-fecha', '-id')
+        params = request.query_params
+        ajustes = AjusteInventario.objects.select_related('producto')
 
-        producto_id = request.query_params.get('producto')
+        producto_id = params.get('producto')
         if producto_id:
             ajustes = ajustes.filter(producto_id=producto_id)
 
-        tipo = request.query_params.get('tipo')
+        tipo = params.get('tipo')
         if tipo:
             ajustes = ajustes.filter(tipo=tipo)
 
-        serializer = AjusteInventarioSerializer(ajustes, many=True)
+        for nombre, lookup in (('desde', 'fecha__gte'), ('hasta', 'fecha__lte')):
+            valor = params.get(nombre)
+            if not valor:
+                continue
+            fecha = _fecha_param(valor)
+            if fecha is None:
+                return Response({'error': f"Fecha '{nombre}' invalida, se espera YYYY-MM-DD"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            ajustes = ajustes.filter(**{lookup: fecha})
+
+        if 'cursor' in params or 'page_size' in params:
+            paginador = AjusteCursorPagination()
+            pagina = paginador.paginate_queryset(ajustes, request, view=self)
+            serializer = AjusteInventarioSerializer(pagina, many=True)
+            return paginador.get_paginated_response(serializer.data)
+
+        serializer = AjusteInventarioSerializer(ajustes.order_by('-fecha', '-id'), many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -1034,6 +1710,7 @@ class CrearAjusteInventario(APIView):
 
         try:
             with transaction.atomic():
+                bloquear_ledger([producto.id])
                 ajuste = AjusteInventario.objects.create(
                     producto=producto,
                     cantidad=cantidad,
@@ -1049,6 +1726,8 @@ class CrearAjusteInventario(APIView):
                     consumir_fifo(producto, abs(cantidad_unidades))
                 if cantidad < 0:
                     descontar_kilos_fifo(producto, abs(cantidad))
+                actualizar_stock_resumen([producto.id])
+                invalidar_reportes()
 
         except ValidationError as e:
             detail = e.detail if hasattr(e, 'detail') else str(e)
@@ -1061,8 +1740,8 @@ class CrearAjusteInventario(APIView):
 # ============================================================================
 # REPORTES FINANCIEROS (Plan 03 — Ganancias, Márgenes y Estadísticas)
 # ============================================================================
-from django.db.models import Avg, F, OuterRef, Subquery, DecimalField
-from django.db.models.functions import TruncMonth, TruncDate, Coalesce
+from django.db.models import Avg, Exists, ExpressionWrapper, F, Max, Min, OuterRef, Q, Subquery, DecimalField, Value
+from django.db.models.functions import Abs, TruncMonth, Coalesce
 
 
 # Los costos de compra se ingresan SIN IVA (ver Facturas.tsx: subtotal/costo_por_kilo
@@ -1097,29 +1776,47 @@ def _desglose_iva(ventas_con_iva, costo_neto):
     return ventas_neto, ganancia, iva_debito, iva_credito, iva_a_pagar
 
 
-def _detalles_ganancia_qs(request):
+def _rango_fechas(request, campo='fecha'):
+    """Filtros de ?desde=YYYY-MM-DD & ?hasta=YYYY-MM-DD (ambos opcionales e
+    inclusivos) sobre ``campo``, como kwargs para ``filter``. Lanza ValueError
+    con el mensaje para el 400 si alguna fecha no es valida (ver
+    _fecha_param): pasada tal cual al filtro, revienta con un 500."""
+    filtros = {}
+    for nombre, lookup in (('desde', 'gte'), ('hasta', 'lte')):
+        valor = request.query_params.get(nombre)
+        if not valor:
+            continue
+        fecha = _fecha_param(valor)
+        if fecha is None:
+            raise ValueError(f"Fecha '{nombre}' invalida, se espera YYYY-MM-DD")
+        filtros[f'{campo}__{lookup}'] = fecha
+    return filtros
+
+
+def _ventas_diarias_qs(request):
     """
-    Base de agregación de ganancias: líneas de venta (DetallePedido)
-    EXCLUYENDO pedidos Anulado (de lo contrario las ventas revertidas
-    inflarían la ganancia reportada). Acepta filtro opcional de rango de
-    fechas vía ?desde=YYYY-MM-DD & ?hasta=YYYY-MM-DD sobre DetallePedido.fecha.
+    Base de agregación de ganancias: el rollup VentaDiaria (una fila por
+    fecha, producto y vendedor, ya SIN pedidos Anulado: ver
+    filas_venta_diaria en utils.py). Acepta filtro opcional de rango de
+    fechas vía ?desde=YYYY-MM-DD & ?hasta=YYYY-MM-DD sobre la fecha de venta
+    (DetallePedido.fecha), igual que antes sobre las líneas. Lanza ValueError
+    si el rango no es valido (ver _rango_fechas).
     """
-    qs = DetallePedido.objects.exclude(pedido__estado="Anulado")
-    desde = request.query_params.get('desde')
-    hasta = request.query_params.get('hasta')
-    if desde:
-        qs = qs.filter(fecha__gte=desde)
-    if hasta:
-        qs = qs.filter(fecha__lte=hasta)
-    return qs
+    return VentaDiaria.objects.filter(**_rango_fechas(request))
 
 
 class ReporteGananciasView(APIView):
     """
-    Agregación de ganancias sobre DetallePedido (pedidos NO anulados).
+    Agregación de ganancias de las ventas (pedidos NO anulados).
     Devuelve en una sola respuesta: total general, por producto ("corte"),
     por mes y por vendedor.
 
+    Suma el rollup diario VentaDiaria y no DetallePedido: cada agregado
+    recorre unas filas por día en vez de todo el historial de líneas. El
+    rollup se mantiene al crear, editar, pesar y anular pedidos
+    (actualizar_venta_diaria) y se reconstruye con
+    ``reconstruir_ventas_diarias``.
+
     La ganancia se RECALCULA netA de IVA en ambos lados (ver _desglose_iva) en
     vez de usar el campo persistido DetallePedido.margen, que mezcla venta
     bruta (con IVA) con costo neto y por lo tanto no representa ni la
@@ -1131,56 +1828,60 @@ class ReporteGananciasView(APIView):
     """
     permission_classes = [IsAuthenticated]
 
+    @cachear_reporte('ganancias')
     def get(self, request):
-        detalles = _detalles_ganancia_qs(request)
+        try:
+            ventas = _ventas_diarias_qs(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         # --- Total general ---
-        totales = detalles.aggregate(
-            ventas=Coalesce(Sum('total_venta'), Decimal('0')),
-            costo_neto=Coalesce(Sum('total_costo'), Decimal('0')),
-            kilos=Coalesce(Sum('cantidad_kilos'), Decimal('0')),
+        totales = ventas.aggregate(
+            total_ventas=Coalesce(Sum('ventas'), Decimal('0')),
+            costo_neto=Coalesce(Sum('costo'), Decimal('0')),
+            total_kilos=Coalesce(Sum('kilos'), Decimal('0')),
         )
         ventas_neto, ganancia, iva_debito, iva_credito, iva_a_pagar = _desglose_iva(
-            totales['ventas'], totales['costo_neto']
+            totales['total_ventas'], totales['costo_neto']
         )
         margen_pct = float(ganancia / ventas_neto * 100) if ventas_neto else 0.0
 
         # --- Por producto / "corte" (= Producto.nombre) ---
         por_producto_raw = list(
-            detalles.values('producto__id', 'producto__nombre')
+            ventas.values('producto__id', 'producto__nombre')
             .annotate(
-                ventas=Coalesce(Sum('total_venta'), Decimal('0')),
-                costo_neto=Coalesce(Sum('total_costo'), Decimal('0')),
-                kilos=Coalesce(Sum('cantidad_kilos'), Decimal('0')),
+                total_ventas=Coalesce(Sum('ventas'), Decimal('0')),
+                costo_neto=Coalesce(Sum('costo'), Decimal('0')),
+                total_kilos=Coalesce(Sum('kilos'), Decimal('0')),
             )
         )
         por_producto = []
         for r in por_producto_raw:
-            ventas_n, gan, *_ = _desglose_iva(r['ventas'], r['costo_neto'])
+            ventas_n, gan, *_ = _desglose_iva(r['total_ventas'], r['costo_neto'])
             por_producto.append({
                 'producto_id': r['producto__id'],
                 'nombre': r['producto__nombre'],
                 'ganancia': gan,
                 'ventas': ventas_n,
                 'costo': r['costo_neto'],
-                'kilos': r['kilos'],
+                'kilos': r['total_kilos'],
                 'margen_pct': float(gan / ventas_n * 100) if ventas_n else 0.0,
             })
         por_producto.sort(key=lambda x: x['ganancia'], reverse=True)
 
         # --- Por mes (con desglose de IVA, se declara mensualmente) ---
         por_mes_raw = list(
-            detalles.annotate(mes=TruncMonth('fecha'))
+            ventas.annotate(mes=TruncMonth('fecha'))
             .values('mes')
             .annotate(
-                ventas=Coalesce(Sum('total_venta'), Decimal('0')),
-                costo_neto=Coalesce(Sum('total_costo'), Decimal('0')),
+                total_ventas=Coalesce(Sum('ventas'), Decimal('0')),
+                costo_neto=Coalesce(Sum('costo'), Decimal('0')),
             )
             .order_by('mes')
         )
         por_mes = []
         for r in por_mes_raw:
-            ventas_n, gan, debito, credito, neto = _desglose_iva(r['ventas'], r['costo_neto'])
+            ventas_n, gan, debito, credito, neto = _desglose_iva(r['total_ventas'], r['costo_neto'])
             por_mes.append({
                 'mes': r['mes'].strftime('%Y-%m') if r['mes'] else None,
                 'ganancia': gan,
@@ -1193,18 +1894,18 @@ class ReporteGananciasView(APIView):
 
         # --- Por vendedor ---
         por_vendedor_raw = list(
-            detalles.values('pedido__vendedor__id', 'pedido__vendedor__nombre')
+            ventas.values('vendedor__id', 'vendedor__nombre')
             .annotate(
-                ventas=Coalesce(Sum('total_venta'), Decimal('0')),
-                costo_neto=Coalesce(Sum('total_costo'), Decimal('0')),
+                total_ventas=Coalesce(Sum('ventas'), Decimal('0')),
+                costo_neto=Coalesce(Sum('costo'), Decimal('0')),
             )
         )
         por_vendedor = []
         for r in por_vendedor_raw:
-            ventas_n, gan, *_ = _desglose_iva(r['ventas'], r['costo_neto'])
+            ventas_n, gan, *_ = _desglose_iva(r['total_ventas'], r['costo_neto'])
             por_vendedor.append({
-                'vendedor_id': r['pedido__vendedor__id'],
-                'nombre': r['pedido__vendedor__nombre'] or 'Sin vendedor',
+                'vendedor_id': r['vendedor__id'],
+                'nombre': r['vendedor__nombre'] or 'Sin vendedor',
                 'ganancia': gan,
                 'ventas': ventas_n,
                 'margen_pct': float(gan / ventas_n * 100) if ventas_n else 0.0,
@@ -1216,7 +1917,7 @@ class ReporteGananciasView(APIView):
                 'ganancia': ganancia,
                 'ventas': ventas_neto,
                 'costo': totales['costo_neto'],
-                'kilos': totales['kilos'],
+                'kilos': totales['total_kilos'],
                 'margen_pct': round(margen_pct, 2),
                 'iva_debito': iva_debito,
                 'iva_credito': iva_credito,
@@ -1248,58 +1949,73 @@ class ReportePerdidasView(APIView):
     Si el producto nunca se compro, la merma se valoriza en 0. La cantidad de
     la merma se toma en valor absoluto (las mermas suelen registrarse como
     cantidad negativa).
+
+    Todo se agrega en la base: como el costo depende solo del producto, el
+    valor de un grupo es Sum(abs(cantidad)) * costo * IVA. El costo se busca
+    una vez por producto (no por merma) y se reutiliza para valorizar los
+    meses. Acepta ?desde= & ?hasta= sobre AjusteInventario.fecha, igual que
+    el reporte de ganancias.
     """
     permission_classes = [IsAuthenticated]
 
+    @cachear_reporte('perdidas')
     def get(self, request):
+        try:
+            rango = _rango_fechas(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         ultimo_costo_sq = DetalleFactura.objects.filter(
-            producto=OuterRef('producto')
+            producto=OuterRef('pk')
         ).order_by('-factura__fecha', '-id').values('costo_por_kilo')[:1]
 
-        mermas = (
-            AjusteInventario.objects.filter(tipo='merma')
-            .annotate(costo_unit=Coalesce(
-                Subquery(ultimo_costo_sq, output_field=DecimalField(max_digits=10, decimal_places=2)),
-                Decimal('0'),
-            ))
-            .select_related('producto')
+        en_rango = Q(ajustes__tipo='merma', **{
+            f'ajustes__{k}': v for k, v in rango.items()
+        })
+        decimal = DecimalField(max_digits=20, decimal_places=6)
+
+        # --- Por producto: un costo por producto ---
+        por_producto_list = list(
+            Producto.objects.filter(en_rango)
+            .annotate(
+                kilos=Sum(Abs('ajustes__cantidad'), filter=en_rango),
+                costo_unit=Coalesce(
+                    Subquery(ultimo_costo_sq, output_field=DecimalField(max_digits=10, decimal_places=2)),
+                    Decimal('0'),
+                ),
+            )
+            .annotate(valor=ExpressionWrapper(
+                F('kilos') * F('costo_unit') * Value(IVA_RATE), output_field=decimal))
+            .values('id', 'nombre', 'kilos', 'costo_unit', 'valor')
+            .order_by('-valor', 'id')
         )
+        costo_por_producto = {r['id']: r['costo_unit'] for r in por_producto_list}
 
-        por_producto = {}
+        # --- Por mes: kilos por (mes, producto), valorizados con ese costo ---
         por_mes = {}
-        total_valor = Decimal('0')
-        total_kilos = Decimal('0')
-
-        for m in mermas:
-            kilos = abs(m.cantidad or Decimal('0'))
-            valor = kilos * m.costo_unit * IVA_RATE
-            total_valor += valor
-            total_kilos += kilos
-
-            pid = m.producto_id
-            if pid not in por_producto:
-                por_producto[pid] = {
-                    'producto_id': pid,
-                    'nombre': m.producto.nombre,
-                    'kilos': Decimal('0'),
-                    'valor': Decimal('0'),
-                }
-            por_producto[pid]['kilos'] += kilos
-            por_producto[pid]['valor'] += valor
-
-            mes = m.fecha.strftime('%Y-%m') if m.fecha else 'Sin fecha'
-            if mes not in por_mes:
-                por_mes[mes] = {'mes': mes, 'kilos': Decimal('0'), 'valor': Decimal('0')}
-            por_mes[mes]['kilos'] += kilos
-            por_mes[mes]['valor'] += valor
-
-        por_producto_list = sorted(por_producto.values(), key=lambda x: x['valor'], reverse=True)
-        por_mes_list = sorted(por_mes.values(), key=lambda x: x['mes'])
+        for r in (
+            AjusteInventario.objects.filter(tipo='merma', **rango)
+            .annotate(mes=TruncMonth('fecha'))
+            .values('mes', 'producto_id')
+            .annotate(kilos=Sum(Abs('cantidad')))
+            .order_by('mes')
+        ):
+            mes = r['mes'].strftime('%Y-%m') if r['mes'] else 'Sin fecha'
+            fila = por_mes.setdefault(mes, {'mes': mes, 'kilos': Decimal('0'), 'valor': Decimal('0')})
+            fila['kilos'] += r['kilos']
+            fila['valor'] += r['kilos'] * costo_por_producto[r['producto_id']] * IVA_RATE
 
         return Response({
-            'total': {'valor': total_valor, 'kilos': total_kilos},
-            'por_producto': por_producto_list,
-            'por_mes': por_mes_list,
+            'total': {
+                'valor': sum((r['valor'] for r in por_producto_list), Decimal('0')),
+                'kilos': sum((r['kilos'] for r in por_producto_list), Decimal('0')),
+            },
+            'por_producto': [{
+                'producto_id': r['id'],
+                'nombre': r['nombre'],
+                'kilos': r['kilos'],
+                'valor': r['valor'],
+            } for r in por_producto_list],
+            'por_mes': sorted(por_mes.values(), key=lambda x: x['mes']),
         }, status=status.HTTP_200_OK)
 
 
@@ -1322,6 +2038,7 @@ class FluctuacionPreciosView(APIView):
     """
     permission_classes = [IsAuthenticated]
 
+    @cachear_reporte('fluctuacion-precios')
     def get(self, request):
         productos = list(Producto.objects.values('id', 'nombre').order_by('nombre'))
         producto_id = request.query_params.get('producto')
@@ -1343,7 +2060,8 @@ class FluctuacionPreciosView(APIView):
             ventas_qs = (
                 DetallePedido.objects.filter(producto_id=producto_id)
                 .exclude(pedido__estado="Anulado")
-                .annotate(dia=TruncDate('fecha'))
+                # fecha ya es un DateField: TruncDate sobre ella falla en SQLite.
+                .annotate(dia=F('fecha'))
                 .values('dia')
                 .annotate(precio=Avg('precio_venta'))
                 .order_by('dia')
@@ -1381,6 +2099,7 @@ class MargenActualProductoView(APIView):
     """
     permission_classes = [IsAuthenticated]
 
+    @cachear_reporte('margen-productos')
     def get(self, request):
         productos = Producto.objects.all()
 
@@ -1445,69 +2164,44 @@ class RentabilidadHistoricaView(APIView):
 
     Siempre devuelve la lista de productos (para el selector). Si se pasa
     ?producto=<id> devuelve además los grupos de ese producto, ordenados por
-    precio de venta y luego por costo de factura.
+    precio de venta y luego por costo de factura. Con ?producto=all devuelve
+    los grupos de TODO el catálogo en la misma pasada, ordenados por nombre
+    de producto; cada grupo trae su producto_id y nombre.
+
+    La atribución se hace en la base (anotar_atribucion en utils.py): una
+    subconsulta sobre los vínculos de cada línea da el total de unidades de la
+    línea, cada vínculo lleva kilos * unidades_vinculo / total_unidades y los
+    vínculos se suman por grupo en SQL. Las líneas sin vínculos también se
+    agrupan directamente en SQL.
     """
     permission_classes = [IsAuthenticated]
 
+    @cachear_reporte('rentabilidad-historica')
     def get(self, request):
         productos = list(Producto.objects.values('id', 'nombre').order_by('nombre'))
         producto_id = request.query_params.get('producto')
 
         periodos = []
+        producto = None
         if producto_id:
-            try:
-                producto = Producto.objects.get(id=producto_id)
-            except Producto.DoesNotExist:
-                return Response({'error': 'Producto no encontrado'}, status=status.HTTP_404_NOT_FOUND)
-
-            detalles = list(
-                DetallePedido.objects.filter(producto_id=producto_id).exclude(pedido__estado="Anulado")
-            )
-
-            costo_por_factura = {
-                df.factura_id: df.costo_por_kilo
-                for df in DetalleFactura.objects.filter(producto_id=producto_id)
-            }
-
-            links_por_detalle = {}
-            for link in FacturaDetallePedido.objects.filter(detallepedido__in=detalles):
-                links_por_detalle.setdefault(link.detallepedido_id, []).append(link)
-
-            # grupos: (precio_venta, costo_por_kilo|None) -> acumuladores
-            grupos = {}
-            fecha_maxima_global = None
-            for d in detalles:
-                if d.fecha and (fecha_maxima_global is None or d.fecha > fecha_maxima_global):
-                    fecha_maxima_global = d.fecha
-
-                links = links_por_detalle.get(d.id, [])
-                total_unidades = sum(l.cantidad_unidades for l in links) or 0
-                kilos_linea = Decimal(str(d.cantidad_kilos or 0))
-
-                if not links or total_unidades == 0:
-                    key = (d.precio_venta, None)
-                    g = grupos.setdefault(key, {'kilos': Decimal('0'), 'venta': Decimal('0'), 'costo_neto': Decimal('0'), 'fechas': []})
-                    g['kilos'] += kilos_linea
-                    g['venta'] += d.total_venta or Decimal('0')
-                    g['costo_neto'] += d.total_costo or Decimal('0')
-                    g['fechas'].append(d.fecha)
-                    continue
-
-                for link in links:
-                    costo_por_kilo = costo_por_factura.get(link.factura_id)
-                    kilos_atrib = kilos_linea * Decimal(link.cantidad_unidades) / Decimal(total_unidades)
-                    venta_atrib = kilos_atrib * (d.precio_venta or Decimal('0'))
-                    costo_atrib = (kilos_atrib * costo_por_kilo) if costo_por_kilo is not None else Decimal('0')
-
-                    key = (d.precio_venta, costo_por_kilo)
-                    g = grupos.setdefault(key, {'kilos': Decimal('0'), 'venta': Decimal('0'), 'costo_neto': Decimal('0'), 'fechas': []})
-                    g['kilos'] += kilos_atrib
-                    g['venta'] += venta_atrib
-                    g['costo_neto'] += costo_atrib
-                    g['fechas'].append(d.fecha)
-
-            for (precio, costo_por_kilo), g in sorted(
-                grupos.items(), key=lambda kv: (kv[0][0], kv[0][1] if kv[0][1] is not None else Decimal('0'))
+            if producto_id != 'all':
+                try:
+                    producto = Producto.objects.get(id=producto_id)
+                except Producto.DoesNotExist:
+                    return Response({'error': 'Producto no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+
+            grupos = self._grupos(producto)
+            nombres = {p['id']: p['nombre'] for p in productos}
+            # Fecha de la última venta de cada producto: marca el grupo vigente.
+            fecha_maxima = {}
+            for (pid, _precio, _costo), g in grupos.items():
+                if g['hasta'] and (fecha_maxima.get(pid) is None or g['hasta'] > fecha_maxima[pid]):
+                    fecha_maxima[pid] = g['hasta']
+
+            for (pid, precio, costo_por_kilo), g in sorted(
+                grupos.items(),
+                key=lambda kv: (nombres[kv[0][0]], kv[0][0], kv[0][1],
+                                kv[0][2] if kv[0][2] is not None else Decimal('0')),
             ):
                 # 'costo'/'costo_unitario' se muestran CON IVA (costo real pagado en
                 # efectivo al proveedor), pero 'ganancia'/'margen_pct' se calculan
@@ -1521,9 +2215,10 @@ class RentabilidadHistoricaView(APIView):
                 margen_pct = float(ganancia / venta_neta * 100) if venta_neta else None
                 costo_unitario = (costo_con_iva / g['kilos']) if g['kilos'] else None
                 ganancia_unitaria = (ganancia / g['kilos']) if g['kilos'] else None
-                fechas = [f for f in g['fechas'] if f]
 
                 periodos.append({
+                    'producto_id': pid,
+                    'nombre': nombres[pid],
                     'precio': precio,
                     'costo_por_kilo': costo_por_kilo,
                     # costo_unitario va CON IVA (costo_con_iva / kilos): es el costo real
@@ -1531,9 +2226,9 @@ class RentabilidadHistoricaView(APIView):
                     # costo_por_kilo que es el costo neto tal como se ingresa en la Factura.
                     'costo_unitario': round(costo_unitario, 2) if costo_unitario is not None else None,
                     'ganancia_unitaria': round(ganancia_unitaria, 2) if ganancia_unitaria is not None else None,
-                    'desde': min(fechas).isoformat() if fechas else None,
-                    'hasta': max(fechas).isoformat() if fechas else None,
-                    'vigente': fecha_maxima_global is not None and fecha_maxima_global in fechas,
+                    'desde': g['desde'].isoformat() if g['desde'] else None,
+                    'hasta': g['hasta'].isoformat() if g['hasta'] else None,
+                    'vigente': g['hasta'] is not None and g['hasta'] == fecha_maxima.get(pid),
                     'kilos': g['kilos'],
                     'ventas': venta_neta,
                     'costo': g['costo_neto'],
@@ -1543,6 +2238,84 @@ class RentabilidadHistoricaView(APIView):
 
         return Response({
             'productos': productos,
-            'producto_id': int(producto_id) if producto_id else None,
+            'producto_id': producto.id if producto else producto_id or None,
             'periodos': periodos,
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        }, status=status.HTTP_200_OK)
+
+    def _grupos(self, producto=None):
+        """Acumuladores por (producto_id, precio_venta, costo_por_kilo|None)
+        de las ventas NO anuladas de ``producto`` (todas si es None), en dos
+        consultas, las dos agrupadas en SQL: vínculos a factura (atribuidos
+        con anotar_atribucion) y líneas sin vínculos."""
+        lineas = DetallePedido.objects.exclude(pedido__estado="Anulado")
+        vinculos = FacturaDetallePedido.objects.exclude(detallepedido__pedido__estado="Anulado")
+        if producto is not None:
+            lineas = lineas.filter(producto=producto)
+            vinculos = vinculos.filter(detallepedido__producto=producto)
+
+        grupos = {}
+
+        def acumular(clave, kilos, venta, costo, desde, hasta):
+            g = grupos.setdefault(clave, {
+                'kilos': Decimal('0'), 'venta': Decimal('0'), 'costo_neto': Decimal('0'),
+                'desde': None, 'hasta': None,
+            })
+            g['kilos'] += kilos
+            g['venta'] += venta
+            g['costo_neto'] += costo
+            if desde and (g['desde'] is None or desde < g['desde']):
+                g['desde'] = desde
+            if hasta and (g['hasta'] is None or hasta > g['hasta']):
+                g['hasta'] = hasta
+
+        # Líneas con unidades vinculadas: los vínculos se atribuyen y se suman
+        # por grupo en la base, así que solo viaja una fila por grupo.
+        for r in (
+            anotar_atribucion(vinculos.filter(
+                Exists(FacturaDetallePedido.objects.filter(
+                    detallepedido_id=OuterRef('detallepedido_id')).exclude(cantidad_unidades=0))
+            ), agrupable=True)
+            .values('detallepedido__producto_id', 'detallepedido__precio_venta', 'costo_por_kilo')
+            .annotate(
+                kilos=Sum('kilos_atribuidos'),
+                venta=Sum('venta_atribuida'),
+                costo=Sum('costo_atribuido'),
+                desde=Min('detallepedido__fecha'),
+                hasta=Max('detallepedido__fecha'),
+            )
+            .order_by()
+        ):
+            acumular((r['detallepedido__producto_id'], r['detallepedido__precio_venta'], r['costo_por_kilo']),
+                     r['kilos'], r['venta'], r['costo'], r['desde'], r['hasta'])
+
+        # Líneas sin unidades vinculadas (dato legado): su propio total_costo.
+        for r in (
+            lineas.exclude(
+                Exists(FacturaDetallePedido.objects.filter(
+                    detallepedido_id=OuterRef('pk')).exclude(cantidad_unidades=0))
+            )
+            .values('producto_id', 'precio_venta')
+            .annotate(
+                kilos=Coalesce(Sum('cantidad_kilos'), Decimal('0')),
+                venta=Coalesce(Sum('total_venta'), Decimal('0')),
+                costo=Coalesce(Sum('total_costo'), Decimal('0')),
+                desde=Min('fecha'),
+                hasta=Max('fecha'),
+            )
+            .order_by()
+        ):
+            acumular((r['producto_id'], r['precio_venta'], None),
+                     r['kilos'], r['venta'], r['costo'], r['desde'], r['hasta'])
+
+        return grupos
+
+
+class ReportesCacheView(APIView):
+    """
+    Estado del cache de reportes (ver core/reportes_cache.py): versión de
+    datos vigente y aciertos/fallos por reporte, para monitoreo.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(estadisticas_cache(), status=status.HTTP_200_OK)